@@ -0,0 +1,352 @@
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.database import DATABASE_URL
+
+# Which broker carries broadcasts between worker processes:
+#   memory   - single process, nothing is forwarded (default)
+#   postgres - PostgreSQL LISTEN/NOTIFY, works across hosts
+#   unix     - Unix datagram sockets in WS_BROADCAST_SOCKET_DIR, one host
+WS_BROADCAST_BACKEND = os.getenv("WS_BROADCAST_BACKEND", "memory")
+WS_BROADCAST_CHANNEL = os.getenv("WS_BROADCAST_CHANNEL", "syncvault_events")
+WS_BROADCAST_SOCKET_DIR = os.getenv("WS_BROADCAST_SOCKET_DIR", "/tmp/syncvault-ws")
+
+# NOTIFY payloads must stay under 8000 bytes; larger messages are split
+PG_NOTIFY_CHUNK = 7000
+# Unix datagrams are capped by the socket send buffer (~208 KB on Linux);
+# larger messages are split the same way
+UNIX_DATAGRAM_CHUNK = 64 * 1024
+# How long a publish waits for a peer whose socket queue is full
+UNIX_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_BROADCAST_SEND_TIMEOUT_SECONDS", "1.0"))
+
+Deliver = Callable[[int, dict], Awaitable[None]]
+
+
+class Broker:
+    """
+    Forwards broadcasts to the other worker processes
+
+    The WebSocketManager delivers every message to its own clients first and
+    then hands it to publish(); a broker only has to reach the other
+    processes and call `deliver` there. Messages a process published itself
+    must not be delivered back to it.
+
+    The broker also numbers each store's broadcasts: next_seq() draws from
+    a sequence shared by every process the broker reaches, so all workers
+    log a message under the same number, and `epoch` names that numbering
+    (it changes only when the numbering restarts). This base version counts
+    in memory, which is right for a single process.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seqs: Dict[int, int] = {}
+
+    async def start(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def next_seq(self, store_id: int) -> Optional[int]:
+        """Take the store's next broadcast number (None if the shared counter is unreachable)"""
+        seq = self._seqs[store_id] = self._seqs.get(store_id, 0) + 1
+        return seq
+
+    async def publish(self, store_id: int, message: dict):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class InProcessBroker(Broker):
+    """Single worker: every client is local, so there is nothing to forward"""
+
+
+def split_envelope(origin: str, message_id: int, store_id: int, message: dict, chunk_size: int) -> List[str]:
+    """Serialize a broadcast as "origin|id|index|count|part" payloads of at most chunk_size characters of JSON"""
+    data = json.dumps({"store_id": store_id, "message": message})  # ASCII, so len() is bytes
+    parts = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] or [""]
+    return [f"{origin}|{message_id}|{index}|{len(parts)}|{part}" for index, part in enumerate(parts)]
+
+
+class Reassembler:
+    """Joins the parts of payloads made by split_envelope, in any arrival order"""
+
+    MAX_PARTIAL = 100
+
+    def __init__(self):
+        self._partial: Dict[Tuple[str, str], List[Optional[str]]] = {}
+
+    def feed(self, origin: str, message_id: str, index: int, count: int, part: str) -> Optional[dict]:
+        """Returns the envelope once every part of it has arrived, else None"""
+        if count > 1:
+            key = (origin, message_id)
+            parts = self._partial.setdefault(key, [None] * count)
+            parts[index] = part
+            if any(p is None for p in parts):
+                # Keep reassembly bounded if a publisher died mid-message
+                while len(self._partial) > self.MAX_PARTIAL:
+                    self._partial.pop(next(iter(self._partial)))
+                return None
+            part = "".join(self._partial.pop(key))
+        return json.loads(part)
+
+
+class PostgresBroker(Broker):
+    """
+    Fan-out through PostgreSQL LISTEN/NOTIFY on one channel
+
+    One autocommit connection listens, another publishes. Payloads carry
+    an origin ID so a process skips its own messages, and payloads over the
+    NOTIFY size limit are sent in numbered parts and reassembled. Broadcast
+    numbers come from the broadcast_sequences table, so they survive
+    restarts and the epoch can stay fixed per channel.
+    """
+
+    NEXT_SEQ_SQL = (
+        "INSERT INTO broadcast_sequences (store_id, seq) VALUES (%s, 1) "
+        "ON CONFLICT (store_id) DO UPDATE SET seq = broadcast_sequences.seq + 1 RETURNING seq"
+    )
+
+    def __init__(self, dsn: str, channel: str = WS_BROADCAST_CHANNEL):
+        super().__init__()
+        self.epoch = f"pg-{channel}"
+        self.dsn = dsn
+        self.channel = channel
+        self.origin = uuid.uuid4().hex[:12]
+        self._counter = 0
+        self._publisher = None
+        self._publish_lock = asyncio.Lock()
+        self._listener: Optional[asyncio.Task] = None
+        self._parts = Reassembler()
+
+    async def start(self, deliver: Deliver):
+        import psycopg
+
+        await super().start(deliver)
+        self._publisher = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self._publisher:
+            await self._publisher.close()
+
+    async def next_seq(self, store_id: int) -> Optional[int]:
+        async with self._publish_lock:
+            try:
+                cursor = await self._publisher.execute(self.NEXT_SEQ_SQL, (store_id,))
+                return (await cursor.fetchone())[0]
+            except Exception as e:
+                print(f"⚠️  Broadcast sequence unavailable: {e}")
+                await self._reconnect_publisher()
+                return None
+
+    async def publish(self, store_id: int, message: dict):
+        self._counter += 1
+        payloads = split_envelope(self.origin, self._counter, store_id, message, PG_NOTIFY_CHUNK)
+        async with self._publish_lock:
+            try:
+                for payload in payloads:
+                    await self._publisher.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+            except Exception as e:
+                print(f"⚠️  Broadcast publish failed: {e}")
+                await self._reconnect_publisher()
+
+    async def _reconnect_publisher(self):
+        import psycopg
+
+        try:
+            await self._publisher.close()
+            self._publisher = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+        except Exception as e:
+            print(f"⚠️  Broadcast publisher reconnect failed: {e}")
+
+    async def _listen(self):
+        import psycopg
+
+        delay = 1
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.dsn, autocommit=True) as conn:
+                    await conn.execute(f'LISTEN "{self.channel}"')
+                    delay = 1
+                    async for notify in conn.notifies():
+                        await self._receive(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Broadcast listener lost its connection: {e}; retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def _receive(self, payload: str):
+        origin, message_id, index, count, part = payload.split("|", 4)
+        if origin == self.origin:
+            return
+
+        envelope = self._parts.feed(origin, message_id, int(index), int(count), part)
+        if envelope is not None:
+            await self.deliver(envelope["store_id"], envelope["message"])
+
+
+class UnixSocketBroker(Broker):
+    """
+    Fan-out between the workers on one host through Unix datagram sockets
+
+    Every process binds its own socket in a shared directory and sends each
+    message to every other socket found there. Sockets left behind by dead
+    workers are removed on the first failed send. Messages larger than one
+    datagram are split like PostgresBroker's; when a peer's queue is full the
+    send waits up to UNIX_SEND_TIMEOUT_SECONDS before that peer's copy is
+    dropped.
+
+    Broadcast numbers are kept in one small file per store in the same
+    directory, incremented under flock(); the epoch file there is written
+    by whichever worker starts first.
+    """
+
+    PEER_REFRESH_SECONDS = 1.0
+
+    def __init__(self, directory: str = WS_BROADCAST_SOCKET_DIR):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"ws-{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._transport = None
+        self._sender: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+        self.origin = uuid.uuid4().hex[:12]
+        self._counter = 0
+        self._parts = Reassembler()
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        os.makedirs(self.directory, exist_ok=True)
+        self.epoch = self._shared_epoch()
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramReceiver(self), local_addr=self.path, family=socket.AF_UNIX
+        )
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+    async def stop(self):
+        if self._transport:
+            self._transport.close()
+        if self._sender:
+            self._sender.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _shared_epoch(self) -> str:
+        path = os.path.join(self.directory, "epoch")
+        # Publish the candidate with link(), which never replaces an existing file
+        candidate = f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        with open(candidate, "w") as f:
+            f.write(self.epoch)
+        try:
+            os.link(candidate, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(candidate)
+        with open(path) as f:
+            return f.read()
+
+    async def next_seq(self, store_id: int) -> Optional[int]:
+        # flock() waits for whichever worker holds the file, so not on the loop
+        return await asyncio.get_running_loop().run_in_executor(None, self._take_seq, store_id)
+
+    def _take_seq(self, store_id: int) -> Optional[int]:
+        try:
+            fd = os.open(os.path.join(self.directory, f"seq-{store_id}"), os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as e:
+            print(f"⚠️  Broadcast sequence unavailable: {e}")
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            seq = int(os.pread(fd, 20, 0) or 0) + 1
+            os.pwrite(fd, b"%020d" % seq, 0)
+            return seq
+        finally:
+            os.close(fd)
+
+    def _current_peers(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at > self.PEER_REFRESH_SECONDS:
+            self._peers = [
+                entry.path for entry in os.scandir(self.directory)
+                if entry.name.endswith(".sock") and entry.path != self.path
+            ]
+            self._peers_at = now
+        return self._peers
+
+    async def publish(self, store_id: int, message: dict):
+        self._counter += 1
+        datagrams = [
+            payload.encode()
+            for payload in split_envelope(self.origin, self._counter, store_id, message, UNIX_DATAGRAM_CHUNK)
+        ]
+        for peer in self._current_peers():
+            try:
+                await asyncio.wait_for(self._send(datagrams, peer), UNIX_SEND_TIMEOUT_SECONDS)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker behind this socket is gone
+                self._forget(peer)
+            except asyncio.TimeoutError:
+                print(f"⚠️  Broadcast dropped: worker socket {peer} stayed full")
+            except OSError as e:
+                print(f"⚠️  Broadcast to {peer} failed: {e}")
+
+    async def _send(self, datagrams: List[bytes], peer: str):
+        loop = asyncio.get_running_loop()
+        for datagram in datagrams:
+            # Waits for room instead of failing when the peer's queue is full
+            await loop.sock_sendto(self._sender, datagram, peer)
+
+    def _receive(self, data: bytes):
+        origin, message_id, index, count, part = data.decode().split("|", 4)
+        envelope = self._parts.feed(origin, message_id, int(index), int(count), part)
+        if envelope is not None:
+            asyncio.ensure_future(self.deliver(envelope["store_id"], envelope["message"]))
+
+    def _forget(self, peer: str):
+        try:
+            os.unlink(peer)
+        except FileNotFoundError:
+            pass
+        if peer in self._peers:
+            self._peers.remove(peer)
+
+
+class _DatagramReceiver(asyncio.DatagramProtocol):
+    def __init__(self, broker: UnixSocketBroker):
+        self.broker = broker
+
+    def datagram_received(self, data: bytes, addr):
+        self.broker._receive(data)
+
+
+def create_broker(backend: str = WS_BROADCAST_BACKEND) -> Broker:
+    """Build the broker named by WS_BROADCAST_BACKEND"""
+    if backend == "postgres":
+        # psycopg takes a plain libpq URL, without SQLAlchemy's driver suffix
+        return PostgresBroker(DATABASE_URL.replace("postgresql+psycopg://", "postgresql://", 1))
+    if backend == "unix":
+        return UnixSocketBroker()
+    if backend == "memory":
+        return InProcessBroker()
+    raise ValueError(f"Unknown WS_BROADCAST_BACKEND: {backend}")
@@ -1,9 +1,12 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, String, Text, Boolean, DateTime, ForeignKey, CheckConstraint, Index
 from sqlalchemy.types import Numeric as Decimal
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 import os
+import sqlite3
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -33,6 +36,15 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores ON DELETE CASCADE unless foreign keys are enabled per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
 # Database Models
 class Store(Base):
     __tablename__ = "stores"
@@ -46,11 +58,11 @@ class Store(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
-    products = relationship("Product", back_populates="store", cascade="all, delete-orphan")
-    inventory = relationship("Inventory", back_populates="store", cascade="all, delete-orphan")
-    transactions = relationship("Transaction", back_populates="store", cascade="all, delete-orphan")
-    alerts = relationship("Alert", back_populates="store", cascade="all, delete-orphan")
-    forecasts = relationship("Forecast", back_populates="store", cascade="all, delete-orphan")
+    products = relationship("Product", back_populates="store", cascade="all, delete-orphan", passive_deletes=True)
+    inventory = relationship("Inventory", back_populates="store", cascade="all, delete-orphan", passive_deletes=True)
+    transactions = relationship("Transaction", back_populates="store", cascade="all, delete-orphan", passive_deletes=True)
+    alerts = relationship("Alert", back_populates="store", cascade="all, delete-orphan", passive_deletes=True)
+    forecasts = relationship("Forecast", back_populates="store", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Product(Base):
@@ -67,10 +79,10 @@ class Product(Base):
     
     # Relationships
     store = relationship("Store", back_populates="products")
-    inventory = relationship("Inventory", back_populates="product", cascade="all, delete-orphan", uselist=False)
-    transactions = relationship("Transaction", back_populates="product", cascade="all, delete-orphan")
-    alerts = relationship("Alert", back_populates="product", cascade="all, delete-orphan")
-    forecasts = relationship("Forecast", back_populates="product", cascade="all, delete-orphan", uselist=False)
+    inventory = relationship("Inventory", back_populates="product", cascade="all, delete-orphan", passive_deletes=True, uselist=False)
+    transactions = relationship("Transaction", back_populates="product", cascade="all, delete-orphan", passive_deletes=True)
+    alerts = relationship("Alert", back_populates="product", cascade="all, delete-orphan", passive_deletes=True)
+    forecasts = relationship("Forecast", back_populates="product", cascade="all, delete-orphan", passive_deletes=True, uselist=False)
 
 
 class Inventory(Base):
@@ -82,6 +94,11 @@ class Inventory(Base):
     quantity = Column(Integer, default=0)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Serves delta sync: rows of a store changed after a cursor
+        Index("ix_inventory_store_last_updated", "store_id", "last_updated"),
+    )
+    
     # Relationships
     product = relationship("Product", back_populates="inventory")
     store = relationship("Store", back_populates="inventory")
@@ -117,6 +134,16 @@ class Alert(Base):
     acknowledged = Column(Boolean, default=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # Backs the "is there already an open alert" test on every scan
+        Index("ix_alerts_open_lookup", "store_id", "product_id", "alert_type", "acknowledged"),
+        # At most one open alert per product and type, even under concurrent scans
+        Index(
+            "ix_alerts_one_open", "store_id", "product_id", "alert_type", unique=True,
+            postgresql_where=acknowledged == False, sqlite_where=acknowledged == False
+        ),
+    )
+    
     # Relationships
     store = relationship("Store", back_populates="alerts")
     product = relationship("Product", back_populates="alerts")
@@ -139,6 +166,47 @@ class Forecast(Base):
     store = relationship("Store", back_populates="forecasts")
 
 
+class SyncedScan(Base):
+    __tablename__ = "synced_scans"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    store_id = Column(Integer, ForeignKey("stores.id", ondelete="CASCADE"), nullable=False)
+    device_id = Column(String(100), nullable=False)
+    seq = Column(Integer, nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id", ondelete="SET NULL"))  # None if rejected
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Dedupes offline replays and serves the per-device high-water mark
+        Index("ix_synced_scans_device_seq", "store_id", "device_id", "seq", unique=True),
+    )
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    store_id = Column(Integer, ForeignKey("stores.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_idempotency_keys_store_key", "store_id", "key", unique=True),
+    )
+
+
+class BroadcastSequence(Base):
+    __tablename__ = "broadcast_sequences"
+    
+    # Last WebSocket broadcast number per store, shared by every worker
+    # (PostgresBroker); no foreign key, so a purge never races a broadcast
+    store_id = Column(Integer, primary_key=True)
+    seq = Column(BigInteger, nullable=False, default=0)
+
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -151,3 +219,13 @@ def get_db():
 # Create all tables
 def init_db():
     Base.metadata.create_all(bind=engine)
+    
+    # create_all skips tables that already exist, so add indexes introduced
+    # after those tables were first created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except IntegrityError as e:
+                # Existing rows break a new unique index; the app still runs without it
+                print(f"⚠️  Could not create index {index.name}, clean up duplicate rows first: {e.orig}")
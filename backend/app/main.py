@@ -1,12 +1,20 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.websockets import WebSocketState
+from pydantic import BaseModel, ValidationError
 from sqlalchemy.orm import Session
+from typing import Callable, List, Optional
+import asyncio
 import os
 from dotenv import load_dotenv
 
-from app.database import init_db, get_db, Store
+from app.database import init_db, SessionLocal, Store
 from app.routers import auth, inventory, products, alerts, forecasts
-from app.websocket_manager import manager
+from app.websocket_manager import manager, negotiate_subprotocol, decode_message
+from app.services.barcode_service import barcode_cache
+from app.services.job_service import job_manager
+from app.services.idempotency_service import sweep_expired_keys
 from app.middleware import LoggingMiddleware
 
 # Load environment variables
@@ -45,10 +53,35 @@ async def startup_event():
     print("🚀 Starting SyncVault AI Backend...")
     init_db()
     print("✅ Database initialized")
+    job_manager.start(asyncio.get_running_loop())
+    await manager.start()
+    app.state.idempotency_sweeper = asyncio.create_task(sweep_expired_keys())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     print("👋 Shutting down SyncVault AI Backend...")
+    app.state.idempotency_sweeper.cancel()
+    job_manager.shutdown()
+    await manager.stop()
+
+# Sessions for the WebSocket handshake check; each is closed before the
+# socket is accepted, so open sockets never hold pooled DB connections
+websocket_session_factory: Callable[[], Session] = SessionLocal
+
+def websocket_store_name(store_id: int) -> Optional[str]:
+    """Look up a store's name with a short-lived session (blocking; run in a thread)"""
+    db = websocket_session_factory()
+    try:
+        store = db.query(Store.name).filter(Store.id == store_id).first()
+        return store.name if store else None
+    finally:
+        db.close()
+
+class SubscribeMessage(BaseModel):
+    """Client -> server: only send events matching these filters (None: any)"""
+    types: Optional[List[str]] = None
+    categories: Optional[List[str]] = None
+    product_ids: Optional[List[int]] = None
 
 # Health check endpoint
 @app.get("/")
@@ -61,35 +94,100 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "syncvault-api"}
+    return {
+        "status": "healthy",
+        "service": "syncvault-api",
+        "barcode_cache": barcode_cache.stats()
+    }
 
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws/{store_id}")
-async def websocket_endpoint(websocket: WebSocket, store_id: int, db: Session = Depends(get_db)):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    store_id: int,
+    token: Optional[str] = None,
+    last_seq: Optional[int] = None,
+    epoch: Optional[str] = None
+):
     """
     WebSocket endpoint for real-time inventory updates
-    Clients connect with their store_id to receive live updates
+    Clients connect with their store_id and access token (?token=) to
+    receive live updates
+
+    The server sends {"type": "ping"} every WS_HEARTBEAT_SECONDS; clients
+    should answer with {"type": "pong"} (any message counts), or they are
+    closed once idle for WS_IDLE_TIMEOUT_SECONDS.
+
+    Broadcasts carry a "seq" number. A reconnecting client passes the last
+    one it saw (and the epoch from its welcome message) to get just the
+    missed events; a "resync" message means it must reload instead.
+
+    Clients may narrow what they receive by sending
+    {"type": "subscribe", "types": [...], "categories": [...], "product_ids": [...]};
+    any other message except a pong is answered with a pong. Messages are
+    JSON text, or on the MessagePack protocol also binary frames (short or
+    long keys).
     """
-    # Verify store exists
-    store = db.query(Store).filter(Store.id == store_id).first()
-    if not store:
+    # Verify the token belongs to this store
+    payload = auth.decode_access_token(token) if token else None
+    if payload is None:
+        await websocket.close(code=4001, reason="Invalid token")
+        return
+    if payload.get("store_id") != store_id:
+        await websocket.close(code=4003, reason="Token is not valid for this store")
+        return
+
+    # Verify store exists, without blocking the event loop
+    store_name = await run_in_threadpool(websocket_store_name, store_id)
+    if store_name is None:
         await websocket.close(code=4004, reason="Store not found")
         return
     
-    # Connect client
-    await manager.connect(websocket, store_id)
+    # Connect client; "syncvault.msgpack.v1" in Sec-WebSocket-Protocol
+    # selects compact binary frames instead of JSON
+    if not await manager.connect(websocket, store_id, negotiate_subprotocol(websocket.scope.get("subprotocols", []))):
+        return
     
-    # Send welcome message
+    # Send welcome message, then anything missed since last_seq; no await
+    # may come between connect() and replay() (see WebSocketManager.replay)
     await manager.send_personal_message({
         "type": "connection_established",
-        "message": f"Connected to SyncVault AI - Store: {store.name}",
-        "store_id": store_id
+        "message": f"Connected to SyncVault AI - Store: {store_name}",
+        "store_id": store_id,
+        "epoch": manager.epoch,
+        "seq": manager.last_seq(store_id)
     }, websocket)
+    if last_seq is not None:
+        manager.replay(websocket, store_id, last_seq, epoch)
     
     try:
         # Keep connection alive and listen for messages
         while True:
-            data = await websocket.receive_text()
+            event = await websocket.receive()
+            if event["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(event.get("code", 1000))
+            manager.touch(websocket, store_id)
+            # MessagePack clients may answer in binary frames
+            data = event.get("text")
+            request = decode_message(data if data is not None else event.get("bytes") or b"")
+            if isinstance(request, dict) and request.get("type") == "subscribe":
+                try:
+                    filters = SubscribeMessage(**request)
+                except ValidationError as e:
+                    await manager.send_personal_message({
+                        "type": "error",
+                        "message": f"Invalid subscription: {e.errors()[0]['msg']}"
+                    }, websocket)
+                    continue
+                manager.subscribe(websocket, store_id, filters.types, filters.categories, filters.product_ids)
+                await manager.send_personal_message({
+                    "type": "subscribed",
+                    "filters": filters.model_dump(exclude_none=True)
+                }, websocket)
+                continue
+            if isinstance(request, dict) and request.get("type") == "pong":
+                continue  # Heartbeat answer
+
             # Echo back (can be used for heartbeat/ping)
             await manager.send_personal_message({
                 "type": "pong",
@@ -97,8 +195,14 @@ async def websocket_endpoint(websocket: WebSocket, store_id: int, db: Session =
             }, websocket)
     
     except WebSocketDisconnect:
-        manager.disconnect(websocket, store_id)
         print(f"Client disconnected from store {store_id}")
+    except RuntimeError:
+        # Closed by the server (idle, too slow) while waiting for a message;
+        # anything else is a real error
+        if WebSocketState.DISCONNECTED not in (websocket.application_state, websocket.client_state):
+            raise
+    finally:
+        manager.disconnect(websocket, store_id)
 
 # Include routers
 app.include_router(auth.router)
@@ -6,6 +6,24 @@ from app.logging_config import setup_logging
 
 logger = setup_logging()
 
+
+class ServerTiming:
+    """Collects per-stage durations for a Server-Timing response header"""
+    
+    def __init__(self):
+        self.stages = []
+        self._last = time.perf_counter()
+    
+    def mark(self, stage: str):
+        """Record the time spent since the previous mark under `stage`"""
+        now = time.perf_counter()
+        self.stages.append((stage, (now - self._last) * 1000))
+        self._last = now
+    
+    def header(self) -> str:
+        return ", ".join(f"{stage};dur={duration:.2f}" for stage, duration in self.stages)
+
+
 class LoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         request_id = str(uuid.uuid4())
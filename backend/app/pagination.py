@@ -0,0 +1,149 @@
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+from datetime import datetime
+import base64
+import json
+import os
+import threading
+import time
+
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+
+# How long a total count is reused before it is counted again
+COUNT_CACHE_TTL_SECONDS = int(os.getenv("COUNT_CACHE_TTL_SECONDS", "30"))
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encode cursor values into an opaque URL-safe token"""
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a token from encode_cursor, rejecting anything malformed with a 400"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        values = None
+    if not isinstance(values, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def keyset_page(
+    query: Query,
+    sort_column,
+    id_column,
+    key: Callable[[Any], Tuple[Any, int]],
+    cursor: Optional[str],
+    limit: Optional[int],
+    descending: bool = False,
+    skip: int = 0
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Fetch one page of a query ordered by (sort_column, id_column)
+
+    Instead of OFFSET, the page starts strictly after the (sort value, id)
+    pair carried by the cursor, so every page costs the same index seek no
+    matter how deep it is.
+
+    Args:
+        query: Filtered query to paginate
+        sort_column: Column or expression to order by (must not be NULL),
+            or None to order by id_column alone
+        id_column: Unique tie-breaker column
+        key: Returns (sort value, id) for a result row; the sort value is
+            ignored when sort_column is None
+        cursor: Cursor from a previous page, or None for the first page
+        limit: Page size; None returns every row unless a cursor is given,
+            in which case the page is PAGE_SIZE_DEFAULT rows
+        descending: Order newest/largest first
+        skip: Legacy OFFSET, only honoured for the first page (no cursor)
+
+    Returns:
+        Tuple of (rows, cursor for the next page or None on the last page)
+    """
+    columns = [id_column] if sort_column is None else [sort_column, id_column]
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 2:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        sort_value, last_id = values
+
+        if sort_column is None:
+            after = id_column < last_id if descending else id_column > last_id
+        else:
+            if sort_column.type.python_type is datetime:
+                sort_value = datetime.fromisoformat(sort_value)
+            if descending:
+                after = or_(sort_column < sort_value, and_(sort_column == sort_value, id_column < last_id))
+            else:
+                after = or_(sort_column > sort_value, and_(sort_column == sort_value, id_column > last_id))
+        query = query.filter(after)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    if skip and not cursor:
+        query = query.offset(skip)
+
+    # Clients that never asked for paging keep getting the full list
+    if limit is None:
+        if not cursor:
+            return query.all(), None
+        limit = PAGE_SIZE_DEFAULT
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(list(key(rows[-1])))
+
+
+def set_page_headers(response: Response, next_cursor: Optional[str], total: Optional[int] = None):
+    """Expose paging state as headers for list endpoints that return bare arrays"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+
+
+class CountCache:
+    """Short-lived cache of total counts, so paging does not COUNT(*) every page"""
+
+    def __init__(self, ttl_seconds: int = COUNT_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, cache_key: Hashable, query: Query) -> int:
+        """Return the cached count for cache_key, counting the query when stale"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(cache_key)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        total = query.order_by(None).count()
+        with self._lock:
+            # Drop expired entries so the cache stays bounded by active keys
+            self._counts = {k: v for k, v in self._counts.items() if v[0] > now}
+            self._counts[cache_key] = (now + self.ttl_seconds, total)
+        return total
+
+    def invalidate_store(self, store_id: int):
+        """Drop every count for a store; cache keys are (name, store_id, ...)"""
+        with self._lock:
+            self._counts = {k: v for k, v in self._counts.items() if k[1:2] != (store_id,)}
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# Global count cache instance
+count_cache = CountCache()
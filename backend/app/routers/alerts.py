@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
@@ -7,6 +7,7 @@ from decimal import Decimal
 
 from app.database import get_db, Store, Alert, Product
 from app.routers.auth import get_current_store
+from app.pagination import keyset_page, set_page_headers, count_cache, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
 
 router = APIRouter(prefix="/alerts", tags=["Alerts"])
 
@@ -30,11 +31,19 @@ class AcknowledgeRequest(BaseModel):
 # Routes
 @router.get("/", response_model=List[AlertResponse])
 async def get_all_alerts(
+    response: Response,
     acknowledged: Optional[bool] = None,
+    limit: Optional[int] = Query(None, gt=0, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     current_store: Store = Depends(get_current_store),
     db: Session = Depends(get_db)
 ):
-    """Get all alerts for current store"""
+    """
+    Get alerts for current store, newest first
+    Paged when `limit` or `cursor` is given: the next page's cursor is returned in X-Next-Cursor and, with
+    include_total=true, a cached total in X-Total-Count.
+    """
     query = db.query(Alert, Product).join(
         Product, Alert.product_id == Product.id
     ).filter(Alert.store_id == current_store.id)
@@ -44,7 +53,15 @@ async def get_all_alerts(
         query = query.filter(Alert.acknowledged == acknowledged)
     
     # Order by created_at descending (newest first)
-    alerts = query.order_by(Alert.created_at.desc()).all()
+    alerts, next_cursor = keyset_page(
+        query, Alert.created_at, Alert.id,
+        lambda row: (row[0].created_at, row[0].id),
+        cursor, limit, descending=True
+    )
+    total = None
+    if include_total:
+        total = count_cache.count(("alerts", current_store.id, acknowledged), query)
+    set_page_headers(response, next_cursor, total)
     
     result = []
     for alert, product in alerts:
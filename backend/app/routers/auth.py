@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
@@ -8,7 +9,15 @@ from passlib.context import CryptContext
 import os
 from typing import Optional
 
-from app.database import get_db, Store
+from app.database import (
+    get_db, Store, Product, Inventory, Transaction, Alert, Forecast, SyncedScan, IdempotencyRecord
+)
+from app.services.barcode_service import barcode_cache
+from app.services.idempotency_service import idempotency_cache
+from app.pagination import count_cache
+from app.websocket_manager import manager
+from app.services.search_service import search_index
+from app.services.job_service import job_manager, Job, JobQueueFull
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 security = HTTPBearer()
@@ -18,6 +27,12 @@ JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-key")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRY_HOURS = int(os.getenv("JWT_EXPIRY_HOURS", "720"))  # 30 days
 
+# Rows deleted per transaction while purging a store
+PURGE_BATCH_ROWS = int(os.getenv("PURGE_BATCH_ROWS", "5000"))
+
+# Children first, so each batch is a plain indexed delete with nothing left to cascade
+PURGE_ORDER = (SyncedScan, IdempotencyRecord, Transaction, Alert, Forecast, Inventory, Product)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Rate Limiting Storage (In-memory)
@@ -38,6 +53,9 @@ class ChangePasswordRequest(BaseModel):
     old_password: str = Field(..., min_length=1)
     new_password: str = Field(..., min_length=8)
 
+class DeleteStoreRequest(BaseModel):
+    password: str = Field(..., min_length=1)
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -67,17 +85,23 @@ def create_access_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    """Verify JWT token and return payload"""
+def decode_access_token(token: str) -> Optional[dict]:
+    """Return the payload of a valid JWT, or None"""
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except JWTError:
+        return None
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Verify JWT token and return payload"""
+    payload = decode_access_token(credentials.credentials)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return payload
 
 def get_current_store(
     payload: dict = Depends(verify_token),
@@ -127,6 +151,38 @@ def reset_attempts(phone: str):
         del login_attempts[phone]
 
 # Routes
+def run_store_purge(job: Job, db: Session, store_id: int) -> dict:
+    """
+    Background job body that deletes a store and all of its data
+
+    Rows go in batches of PURGE_BATCH_ROWS, each committed on its own, so no
+    single transaction holds locks on a whole store's history. Anything
+    written mid-purge is removed by the final cascading delete of the store.
+    Afterwards the store's caches are dropped and its WebSocket clients are
+    closed in every worker.
+    """
+    deleted = 0
+    for model in PURGE_ORDER:
+        while True:
+            ids = [row_id for (row_id,) in db.query(model.id).filter(model.store_id == store_id).limit(PURGE_BATCH_ROWS)]
+            if not ids:
+                break
+            db.execute(delete(model).where(model.id.in_(ids)), execution_options={"synchronize_session": False})
+            db.commit()
+            deleted += len(ids)
+            job_manager.progress(job, table=model.__tablename__, rows_deleted=deleted)
+
+    db.execute(delete(Store).where(Store.id == store_id), execution_options={"synchronize_session": False})
+    db.commit()
+
+    barcode_cache.invalidate_store(store_id)
+    search_index.invalidate_store(store_id)
+    idempotency_cache.invalidate_store(store_id)
+    count_cache.invalidate_store(store_id)
+    job_manager.call_on_loop(manager.drop_store(store_id))
+    print(f"🗑️  Store {store_id} purged ({deleted} rows)")
+    return {"store_id": store_id, "rows_deleted": deleted}
+
 @router.post("/signup", response_model=StoreResponse)
 async def signup(request: SignupRequest, db: Session = Depends(get_db)):
     """Create new store account with password"""
@@ -211,3 +267,28 @@ async def change_password(
 async def get_current_user(current_store: Store = Depends(get_current_store)):
     """Get current authenticated store details"""
     return current_store
+
+@router.delete("/me", status_code=status.HTTP_202_ACCEPTED)
+async def delete_store(
+    request: DeleteStoreRequest,
+    current_store: Store = Depends(get_current_store)
+):
+    """
+    Permanently delete the current store and all of its data
+
+    The purge runs as a background job; progress arrives as "job_progress"
+    WebSocket messages and via GET /products/jobs/{job_id} until the store
+    (and with it this token) is gone.
+    """
+    if not verify_password(request.password, current_store.password_hash):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid password"
+        )
+
+    try:
+        job = job_manager.submit(current_store.id, "store_purge", run_store_purge, current_store.id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    return job.to_dict()
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
@@ -8,9 +9,13 @@ from decimal import Decimal
 from app.database import get_db, Store, Forecast, Product
 from app.routers.auth import get_current_store
 from app.services.forecast_service import ForecastService
+from app.pagination import keyset_page, set_page_headers, count_cache, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
 
 router = APIRouter(prefix="/forecasts", tags=["Forecasts"])
 
+# Sort key standing in for "no stockout expected"
+NO_STOCKOUT_SORT_KEY = 2 ** 31 - 1
+
 
 # Pydantic Models
 class ForecastResponse(BaseModel):
@@ -80,15 +85,36 @@ async def get_product_forecast(
 
 @router.get("/", response_model=List[ForecastResponse])
 async def get_all_forecasts(
+    response: Response,
+    limit: Optional[int] = Query(None, gt=0, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     current_store: Store = Depends(get_current_store),
     db: Session = Depends(get_db)
 ):
-    """Get all forecasts for store"""
-    forecasts = db.query(Forecast, Product).join(
+    """
+    Get forecasts for store, soonest stockout first
+    Paged when `limit` or `cursor` is given: the next page's cursor is returned in X-Next-Cursor and, with
+    include_total=true, a cached total in X-Total-Count.
+    """
+    query = db.query(Forecast, Product).join(
         Product, Forecast.product_id == Product.id
     ).filter(
         Forecast.store_id == current_store.id
-    ).order_by(Forecast.days_until_stockout.asc()).all()
+    )
+    
+    # Forecasts without a stockout estimate sort last on every database
+    days_key = func.coalesce(Forecast.days_until_stockout, NO_STOCKOUT_SORT_KEY)
+    forecasts, next_cursor = keyset_page(
+        query, days_key, Forecast.id,
+        lambda row: (
+            NO_STOCKOUT_SORT_KEY if row[0].days_until_stockout is None else row[0].days_until_stockout,
+            row[0].id
+        ),
+        cursor, limit
+    )
+    total = count_cache.count(("forecasts", current_store.id), query) if include_total else None
+    set_page_headers(response, next_cursor, total)
     
     result = []
     for forecast, product in forecasts:
@@ -1,17 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Dict, Union
+from datetime import datetime, timedelta
 from decimal import Decimal
+import os
 
-from app.database import get_db, Store, Product, Inventory, Transaction, Alert
+from app.database import get_db, Store, Product, Inventory, Transaction, Alert, SyncedScan
 from app.routers.auth import get_current_store
-from app.services.barcode_service import BarcodeService
+from app.services.barcode_service import BarcodeService, barcode_cache
+from app.services.search_service import search_index
+from app.services.inventory_service import InventoryService
+from app.services.idempotency_service import IdempotencyService
 from app.websocket_manager import manager
+from app.middleware import ServerTiming
+from app.streaming import negotiate_stream, stream_query
+from app.pagination import (
+    keyset_page, set_page_headers, count_cache, encode_cursor, decode_cursor, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+)
 
 router = APIRouter(prefix="/inventory", tags=["Inventory"])
 
+# How far behind "now" a delta sync cursor trails, to absorb commit delays
+INVENTORY_SYNC_GRACE_SECONDS = int(os.getenv("INVENTORY_SYNC_GRACE_SECONDS", "5"))
+
 
 # Pydantic Models
 class ScanRequest(BaseModel):
@@ -24,6 +40,19 @@ class ScanRequest(BaseModel):
         return v.strip()
 
 
+class BatchScanRequest(BaseModel):
+    items: List[ScanRequest] = Field(..., min_length=1, max_length=500)
+
+
+class SyncScan(ScanRequest):
+    seq: int = Field(..., ge=0)
+
+
+class SyncRequest(BaseModel):
+    device_id: str = Field(..., min_length=1, max_length=100)
+    scans: List[SyncScan] = Field(..., max_length=5000)
+
+
 class UpdateQuantityRequest(BaseModel):
     quantity: int = Field(..., ge=0)
 
@@ -41,6 +70,11 @@ class InventoryItem(BaseModel):
     last_updated: datetime
 
 
+class InventoryDeltaResponse(BaseModel):
+    items: List[InventoryItem]
+    cursor: str
+
+
 class ScanResponse(BaseModel):
     success: bool
     message: str
@@ -49,6 +83,36 @@ class ScanResponse(BaseModel):
     transaction_id: int
 
 
+class BatchScanItemResult(BaseModel):
+    index: int
+    barcode: str
+    success: bool
+    message: str
+    new_quantity: Optional[int] = None
+    transaction_id: Optional[int] = None
+
+
+class BatchScanResponse(BaseModel):
+    success: bool
+    processed: int
+    failed: int
+    results: List[BatchScanItemResult]
+
+
+class SyncRejectedScan(BaseModel):
+    seq: int
+    barcode: str
+    message: str
+
+
+class SyncResponse(BaseModel):
+    device_id: str
+    high_water_mark: Optional[int]
+    applied: int
+    duplicates: int
+    rejected: List[SyncRejectedScan]
+
+
 # Helper Functions
 def get_inventory_status(quantity: int, reorder_point: int) -> str:
     """Determine inventory status based on quantity and reorder point"""
@@ -60,69 +124,151 @@ def get_inventory_status(quantity: int, reorder_point: int) -> str:
         return "low"
 
 
-def create_low_stock_alert(product_id: int, store_id: int, quantity: int, db: Session):
-    """Create low stock alert if needed"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def broadcast_inventory_batch(store_id: int, updates: Dict[int, dict], alerts: List[dict]):
+    """Send one combined WebSocket message for many stock changes"""
+    if not updates:
+        return
     
-    if quantity < product.reorder_point:
-        # Check if alert already exists
-        existing_alert = db.query(Alert).filter(
-            Alert.product_id == product_id,
-            Alert.store_id == store_id,
-            Alert.alert_type == "low_stock",
-            Alert.acknowledged == False
-        ).first()
-        
-        if not existing_alert:
-            new_alert = Alert(
-                store_id=store_id,
-                product_id=product_id,
-                alert_type="low_stock",
-                message=f"Low stock alert: {product.name} has only {quantity} units left (reorder point: {product.reorder_point})"
-            )
-            db.add(new_alert)
-            db.commit()
-            return new_alert
+    timestamp = datetime.utcnow().isoformat()
+    await manager.broadcast(store_id, {
+        "type": "inventory_batch",
+        "data": {
+            "updates": [
+                {
+                    "product_id": update["product_id"],
+                    "barcode": update["barcode"],
+                    "name": update["name"],
+                    "category": update["category"],
+                    "quantity": update["quantity"],
+                    "status": get_inventory_status(update["quantity"], update["reorder_point"]),
+                    "timestamp": timestamp
+                }
+                for update in updates.values()
+            ],
+            "alerts": alerts
+        }
+    })
+
+
+def replay_idempotent(store_id: int, key: str, request_hash: str, db: Session) -> Optional[JSONResponse]:
+    """Return the stored response for a retried request, if there is one"""
+    stored = IdempotencyService.lookup(store_id, key, db)
+    if stored is None:
+        return None
     
-    return None
+    if stored.request_hash != request_hash:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    
+    return JSONResponse(
+        status_code=stored.status_code,
+        content=stored.body,
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def build_inventory_item(inv: Inventory, prod: Product) -> InventoryItem:
+    """Build the API representation of an inventory row"""
+    return InventoryItem(
+        id=inv.id,
+        product_id=prod.id,
+        barcode=prod.barcode,
+        name=prod.name,
+        category=prod.category,
+        price=prod.price,
+        quantity=inv.quantity,
+        reorder_point=prod.reorder_point,
+        status=get_inventory_status(inv.quantity, prod.reorder_point),
+        last_updated=inv.last_updated
+    )
+
+
+def encode_sync_cursor(changed_after: datetime) -> str:
+    """Opaque change cursor for delta inventory sync"""
+    return encode_cursor([changed_after])
+
+
+def decode_sync_cursor(cursor: str) -> datetime:
+    values = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(values[0])
+    except (IndexError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync cursor")
 
 
 # Routes
-@router.get("/", response_model=List[InventoryItem])
+@router.get("/", response_model=Union[List[InventoryItem], InventoryDeltaResponse])
 async def get_inventory(
+    request: Request,
+    response: Response,
+    since: Optional[str] = None,
+    limit: Optional[int] = Query(None, gt=0, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     current_store: Store = Depends(get_current_store),
     db: Session = Depends(get_db)
 ):
-    """Get all inventory items for current store"""
+    """
+    Get inventory items for current store
+    - Without `since`: every item, or one page when `limit` or `cursor` is
+      given; the next page's cursor is in X-Next-Cursor and, with
+      include_total=true, a cached total in X-Total-Count.
+      X-Inventory-Cursor starts a delta sync.
+    - With `since=<cursor>`: only rows changed after the cursor, plus a new cursor
+    - With `Accept: application/x-ndjson` or `text/csv`: the full list, streamed
+    Deleted products are not reported by the delta mode.
+    """
+    # Anything stamped before this point is committed by the time we read
+    horizon = datetime.utcnow() - timedelta(seconds=INVENTORY_SYNC_GRACE_SECONDS)
+    
     # Join inventory with products
-    items = db.query(Inventory, Product).join(
+    query = db.query(Inventory, Product).join(
         Product, Inventory.product_id == Product.id
     ).filter(
         Inventory.store_id == current_store.id
-    ).all()
+    )
     
-    result = []
-    for inv, prod in items:
-        status = get_inventory_status(inv.quantity, prod.reorder_point)
-        result.append(InventoryItem(
-            id=inv.id,
-            product_id=prod.id,
-            barcode=prod.barcode,
-            name=prod.name,
-            category=prod.category,
-            price=prod.price,
-            quantity=inv.quantity,
-            reorder_point=prod.reorder_point,
-            status=status,
-            last_updated=inv.last_updated
-        ))
+    if since is None:
+        media_type = negotiate_stream(request)
+        if media_type:
+            streamed = stream_query(
+                query, lambda row: build_inventory_item(*row), InventoryItem, media_type, db, filename="inventory"
+            )
+            streamed.headers["X-Inventory-Cursor"] = encode_sync_cursor(horizon)
+            return streamed
+        
+        response.headers["X-Inventory-Cursor"] = encode_sync_cursor(horizon)
+        items, next_cursor = keyset_page(
+            query, None, Inventory.id, lambda row: (None, row[0].id), cursor, limit
+        )
+        total = count_cache.count(("inventory", current_store.id), query) if include_total else None
+        set_page_headers(response, next_cursor, total)
+        return [build_inventory_item(inv, prod) for inv, prod in items]
     
-    return result
+    changed_after = decode_sync_cursor(since)
+    items = query.filter(
+        Inventory.last_updated > changed_after
+    ).order_by(Inventory.last_updated).all()
+    
+    # Rows newer than the horizon are sent again on the next poll, so a
+    # transaction that commits slightly late is never skipped
+    next_sync = changed_after
+    if items:
+        next_sync = max(next_sync, min(items[-1][0].last_updated, horizon))
+    
+    return InventoryDeltaResponse(
+        items=[build_inventory_item(inv, prod) for inv, prod in items],
+        cursor=encode_sync_cursor(next_sync)
+    )
 
 
 @router.post("/scan", response_model=ScanResponse)
 async def scan_barcode(
     request: ScanRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_store: Store = Depends(get_current_store),
     db: Session = Depends(get_db)
 ):
@@ -132,9 +278,22 @@ async def scan_barcode(
     - Restock: Increments quantity
     - Broadcasts update via WebSocket
     - Creates alert if low stock
+    The stock update, transaction insert and alert insert share one commit.
+    Per-stage timings are returned in the Server-Timing header.
+    A retry carrying the same Idempotency-Key replays the first response
+    without touching stock again.
     """
-    # Find product by barcode
-    product = BarcodeService.parse_barcode(request.barcode, current_store.id, db)
+    timing = ServerTiming()
+    
+    if idempotency_key:
+        request_hash = IdempotencyService.request_hash("POST /inventory/scan", request.model_dump())
+        replay = replay_idempotent(current_store.id, idempotency_key, request_hash, db)
+        if replay:
+            return replay
+    
+    # Find product by barcode (served from the barcode cache when warm)
+    product = BarcodeService.resolve_barcode(request.barcode, current_store.id, db)
+    timing.mark("resolve")
     
     if not product:
         raise HTTPException(
@@ -142,60 +301,79 @@ async def scan_barcode(
             detail=f"Product with barcode '{request.barcode}' not found in your store"
         )
     
-    # Get inventory
-    inventory = db.query(Inventory).filter(
-        Inventory.product_id == product.id,
-        Inventory.store_id == current_store.id
-    ).first()
+    # Apply the change with one conditional UPDATE ... RETURNING
+    quantity_change = -request.quantity if request.action == "sale" else request.quantity
+    inventory = InventoryService.adjust_stock(product.product_id, current_store.id, quantity_change, db)
     
     if not inventory:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Inventory record not found"
-        )
-    
-    # Calculate new quantity
-    if request.action == "sale":
-        if inventory.quantity < request.quantity:
+        available = InventoryService.current_quantity(product.product_id, current_store.id, db)
+        if available is None:
+            barcode_cache.invalidate(current_store.id, request.barcode)
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient stock. Available: {inventory.quantity}, Requested: {request.quantity}"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Inventory record not found"
             )
-        new_quantity = inventory.quantity - request.quantity
-        quantity_change = -request.quantity
-        transaction_type = "out"
-    else:  # restock
-        new_quantity = inventory.quantity + request.quantity
-        quantity_change = request.quantity
-        transaction_type = "in"
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient stock. Available: {available}, Requested: {request.quantity}"
+        )
+    new_quantity = inventory.quantity
+    timing.mark("update")
     
-    # Update inventory
-    inventory.quantity = new_quantity
-    inventory.last_updated = datetime.utcnow()
+    # Create transaction record and, if needed, the low stock alert
+    transaction_id = InventoryService.record_transaction(product.product_id, current_store.id, quantity_change, db)
+    alert = InventoryService.insert_low_stock_alert(
+        product.product_id, product.name, product.reorder_point, current_store.id, new_quantity, db
+    )
+    timing.mark("insert")
     
-    # Create transaction record
-    transaction = Transaction(
-        product_id=product.id,
-        store_id=current_store.id,
-        quantity_change=quantity_change,
-        transaction_type=transaction_type
+    status = get_inventory_status(new_quantity, product.reorder_point)
+    result = ScanResponse(
+        success=True,
+        message=f"{'Sale' if request.action == 'sale' else 'Restock'} successful: {product.name}",
+        product=InventoryItem(
+            id=inventory.id,
+            product_id=product.product_id,
+            barcode=product.barcode,
+            name=product.name,
+            category=product.category,
+            price=product.price,
+            quantity=new_quantity,
+            reorder_point=product.reorder_point,
+            status=status,
+            last_updated=inventory.last_updated
+        ),
+        new_quantity=new_quantity,
+        transaction_id=transaction_id
     )
-    db.add(transaction)
-    db.commit()
-    db.refresh(inventory)
-    db.refresh(transaction)
     
-    # Check and create alert if low stock
-    alert = create_low_stock_alert(product.id, current_store.id, new_quantity, db)
+    stored = None
+    if idempotency_key:
+        stored = IdempotencyService.remember(
+            current_store.id, idempotency_key, request_hash, jsonable_encoder(result), db
+        )
+    
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        db.rollback()
+        replay = idempotency_key and replay_idempotent(current_store.id, idempotency_key, request_hash, db)
+        if replay:
+            return replay
+        raise
+    if stored:
+        IdempotencyService.cache(current_store.id, idempotency_key, stored)
+    timing.mark("commit")
     
     # Broadcast update via WebSocket
-    status = get_inventory_status(new_quantity, product.reorder_point)
     update_message = {
         "type": "inventory_update",
         "data": {
-            "product_id": product.id,
+            "product_id": product.product_id,
             "barcode": product.barcode,
             "name": product.name,
+            "category": product.category,
             "quantity": new_quantity,
             "status": status,
             "action": request.action,
@@ -210,33 +388,123 @@ async def scan_barcode(
             "type": "alert_created",
             "data": {
                 "alert_id": alert.id,
+                "product_id": product.product_id,
                 "product_name": product.name,
+                "category": product.category,
                 "message": alert.message,
                 "alert_type": alert.alert_type
             }
         }
         await manager.broadcast(current_store.id, alert_message)
+    timing.mark("broadcast")
     
-    # Prepare response
-    inventory_item = InventoryItem(
-        id=inventory.id,
-        product_id=product.id,
-        barcode=product.barcode,
-        name=product.name,
-        category=product.category,
-        price=product.price,
-        quantity=new_quantity,
-        reorder_point=product.reorder_point,
-        status=status,
-        last_updated=inventory.last_updated
+    response.headers["Server-Timing"] = timing.header()
+    return result
+
+
+@router.post("/scan/batch", response_model=BatchScanResponse)
+async def scan_batch(
+    request: BatchScanRequest,
+    response: Response,
+    current_store: Store = Depends(get_current_store),
+    db: Session = Depends(get_db)
+):
+    """
+    Apply a basket of scans in one database transaction
+    - Resolves all barcodes with a single query
+    - Commits every quantity change and transaction once
+    - Evaluates low stock alerts once per affected product
+    - Sends one combined WebSocket broadcast
+    Items that fail (unknown barcode, insufficient stock) are reported
+    individually and do not prevent the rest of the basket from applying.
+    """
+    timing = ServerTiming()
+    results, updates, alerts = InventoryService.apply_scans(current_store.id, request.items, db)
+    timing.mark("apply")
+    db.commit()
+    timing.mark("commit")
+
+    await broadcast_inventory_batch(current_store.id, updates, alerts)
+    timing.mark("broadcast")
+
+    response.headers["Server-Timing"] = timing.header()
+    processed = sum(1 for result in results if result["success"])
+    return BatchScanResponse(
+        success=processed == len(results),
+        processed=processed,
+        failed=len(results) - processed,
+        results=[BatchScanItemResult(**result) for result in results]
     )
+
+
+@router.post("/sync", response_model=SyncResponse)
+async def sync_offline_scans(
+    request: SyncRequest,
+    current_store: Store = Depends(get_current_store),
+    db: Session = Depends(get_db)
+):
+    """
+    Replay a scanner's offline backlog (idempotent)
+    - Scans are keyed by (device_id, seq); already-synced seqs are skipped
+    - New scans are applied in seq order with a single commit
+    - Returns the device's high-water mark so it can trim its queue
+    Rejected scans (unknown barcode, insufficient stock) are recorded as
+    synced too, so a replay never applies them later by surprise.
+    """
+    # Dedupe within the request, then against what this device already synced
+    scans = {}
+    for scan in request.scans:
+        scans.setdefault(scan.seq, scan)
     
-    return ScanResponse(
-        success=True,
-        message=f"{'Sale' if request.action == 'sale' else 'Restock'} successful: {product.name}",
-        product=inventory_item,
-        new_quantity=new_quantity,
-        transaction_id=transaction.id
+    already_synced = set()
+    if scans:
+        already_synced = {
+            seq for (seq,) in db.query(SyncedScan.seq).filter(
+                SyncedScan.store_id == current_store.id,
+                SyncedScan.device_id == request.device_id,
+                SyncedScan.seq.between(min(scans), max(scans))
+            ).all()
+        }
+    new_scans = [scans[seq] for seq in sorted(scans) if seq not in already_synced]
+    
+    results, updates, alerts = InventoryService.apply_scans(current_store.id, new_scans, db)
+    
+    if new_scans:
+        db.execute(insert(SyncedScan), [
+            {
+                "store_id": current_store.id,
+                "device_id": request.device_id,
+                "seq": scan.seq,
+                "transaction_id": result.get("transaction_id")
+            }
+            for scan, result in zip(new_scans, results)
+        ])
+    
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another sync for this device is in progress, retry shortly"
+        )
+    
+    await broadcast_inventory_batch(current_store.id, updates, alerts)
+    
+    high_water_mark = db.query(func.max(SyncedScan.seq)).filter(
+        SyncedScan.store_id == current_store.id,
+        SyncedScan.device_id == request.device_id
+    ).scalar()
+    
+    return SyncResponse(
+        device_id=request.device_id,
+        high_water_mark=high_water_mark,
+        applied=sum(1 for result in results if result["success"]),
+        duplicates=len(request.scans) - len(new_scans),
+        rejected=[
+            SyncRejectedScan(seq=scan.seq, barcode=scan.barcode, message=result["message"])
+            for scan, result in zip(new_scans, results) if not result["success"]
+        ]
     )
 
 
@@ -244,10 +512,17 @@ async def scan_barcode(
 async def update_quantity(
     product_id: int,
     request: UpdateQuantityRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_store: Store = Depends(get_current_store),
     db: Session = Depends(get_db)
 ):
-    """Manual inventory quantity update"""
+    """Manual inventory quantity update (honours Idempotency-Key)"""
+    if idempotency_key:
+        request_hash = IdempotencyService.request_hash(f"PUT /inventory/{product_id}", request.model_dump())
+        replay = replay_idempotent(current_store.id, idempotency_key, request_hash, db)
+        if replay:
+            return replay
+    
     # Get product and inventory
     product = db.query(Product).filter(
         Product.id == product_id,
@@ -281,29 +556,47 @@ async def update_quantity(
         transaction_type="in" if quantity_change > 0 else "out"
     )
     db.add(transaction)
-    db.commit()
-    db.refresh(inventory)
     
-    # Check for low stock alert
-    create_low_stock_alert(product_id, current_store.id, request.quantity, db)
+    # Check for low stock alert, committed together with the update
+    InventoryService.insert_low_stock_alert(
+        product_id, product.name, product.reorder_point, current_store.id, request.quantity, db
+    )
+    status = get_inventory_status(request.quantity, product.reorder_point)
+    result = {
+        "success": True,
+        "message": "Inventory updated successfully",
+        "old_quantity": old_quantity,
+        "new_quantity": request.quantity
+    }
+    
+    stored = None
+    if idempotency_key:
+        stored = IdempotencyService.remember(current_store.id, idempotency_key, request_hash, result, db)
+    
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        db.rollback()
+        replay = idempotency_key and replay_idempotent(current_store.id, idempotency_key, request_hash, db)
+        if replay:
+            return replay
+        raise
+    if stored:
+        IdempotencyService.cache(current_store.id, idempotency_key, stored)
     
     # Broadcast update
-    status = get_inventory_status(request.quantity, product.reorder_point)
     await manager.broadcast(current_store.id, {
         "type": "inventory_update",
         "data": {
             "product_id": product_id,
+            "category": product.category,
             "quantity": request.quantity,
             "status": status
         }
     })
     
-    return {
-        "success": True,
-        "message": "Inventory updated successfully",
-        "old_quantity": old_quantity,
-        "new_quantity": request.quantity
-    }
+    return result
 
 
 @router.delete("/{product_id}")
@@ -322,8 +615,11 @@ async def delete_product(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
     # Delete product (cascade will delete inventory, transactions, alerts, forecasts)
+    barcode = product.barcode
     db.delete(product)
     db.commit()
+    barcode_cache.invalidate(current_store.id, barcode)
+    search_index.remove(current_store.id, product_id)
     
     return {"success": True, "message": "Product deleted successfully"}
 
@@ -1,14 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status, UploadFile, File
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session, contains_eager
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from typing import Any, Dict, Optional, List, Union
 from decimal import Decimal
+from datetime import datetime
 import pandas as pd
-import io
+import functools
+import os
+import shutil
+import tempfile
 
-from app.database import get_db, Store, Product, Inventory
+from app.database import get_db, Store, Product, Inventory, Forecast
 from app.routers.auth import get_current_store
-from app.services.barcode_service import BarcodeService
+from app.services.barcode_service import BarcodeService, barcode_cache
+from app.services.import_service import ProductImportService, InvalidImportFile, IMPORT_MAX_ERRORS, IN_CLAUSE_CHUNK
+from app.services.job_service import job_manager, Job, JobQueueFull
+from app.services.search_service import search_index
+from app.streaming import negotiate_stream, stream_query, stream_parquet, CSV
+from app.pagination import keyset_page, count_cache, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
@@ -47,8 +57,79 @@ class ProductResponse(BaseModel):
 
 
 class ProductListResponse(BaseModel):
+    total: Optional[int]
+    products: List[ProductResponse]
+    next_cursor: Optional[str] = None
+
+
+class ProductExportRow(BaseModel):
+    # The first six columns are exactly what bulk-upload reads back
+    barcode: str
+    name: str
+    price: Decimal
+    category: Optional[str] = None
+    reorder_point: Optional[int] = None
+    initial_quantity: int
+    days_until_stockout: Optional[int] = None
+    avg_daily_sales: Optional[Decimal] = None
+    forecast_confidence: Optional[Decimal] = None
+    recommendation: Optional[str] = None
+
+
+class CategoryFacet(BaseModel):
+    category: Optional[str]
+    count: int
+
+
+class ProductSearchResponse(BaseModel):
     total: int
     products: List[ProductResponse]
+    facets: List[CategoryFacet]
+
+
+class BulkProductUpdate(ProductUpdate):
+    id: Optional[int] = None
+    barcode: Optional[str] = Field(None, min_length=1, max_length=50)
+    initial_quantity: Optional[int] = Field(None, ge=0)  # Only used when upsert creates the product
+
+    @validator('barcode')
+    def strip_barcode(cls, v):
+        return v.strip() if v else v
+
+    @validator('initial_quantity', always=True)
+    def require_one_key(cls, v, values):
+        if (values.get('id') is None) == (values.get('barcode') is None):
+            raise ValueError('Each item needs exactly one of id or barcode')
+        return v
+
+
+class BulkUpdateRequest(BaseModel):
+    items: List[BulkProductUpdate] = Field(..., min_length=1, max_length=5000)
+    upsert: bool = False
+
+
+class BulkUpdateResponse(BaseModel):
+    success: bool
+    updated: int
+    created: int
+    errors: List[str]
+
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[int] = Field(default_factory=list, max_length=10000)
+    barcodes: List[str] = Field(default_factory=list, max_length=10000)
+
+    @validator('barcodes', always=True)
+    def require_keys(cls, v, values):
+        if not v and not values.get('ids'):
+            raise ValueError('Provide at least one id or barcode')
+        return v
+
+
+class BulkDeleteResponse(BaseModel):
+    success: bool
+    deleted: int
+    not_found: int
 
 
 class BulkUploadResponse(BaseModel):
@@ -58,6 +139,105 @@ class BulkUploadResponse(BaseModel):
     errors: List[str]
 
 
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    progress: Dict[str, Any]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+# Helper Functions
+def query_products_with_inventory(store_id: int, db: Session):
+    """Products of a store with Product.inventory loaded by the same query"""
+    return db.query(Product).outerjoin(
+        Product.inventory
+    ).options(
+        contains_eager(Product.inventory)
+    ).filter(
+        Product.store_id == store_id
+    )
+
+
+def build_product_response(product: Product) -> ProductResponse:
+    """Build the API representation of a product with its inventory loaded"""
+    return ProductResponse(
+        id=product.id,
+        barcode=product.barcode,
+        name=product.name,
+        price=product.price,
+        category=product.category,
+        reorder_point=product.reorder_point,
+        current_quantity=product.inventory.quantity if product.inventory else 0
+    )
+
+
+def delete_products(store_id: int, column, keys: list, db: Session) -> List[Any]:
+    """
+    Delete a store's products matched on `column`, returning (id, barcode) rows
+
+    One DELETE ... RETURNING per chunk of keys; the database cascades to
+    inventory, transactions, alerts and forecasts (ON DELETE CASCADE), so
+    none of that history is loaded into the session.
+    """
+    deleted = []
+    for start in range(0, len(keys), IN_CLAUSE_CHUNK):
+        deleted.extend(db.execute(
+            delete(Product).where(
+                Product.store_id == store_id,
+                column.in_(keys[start:start + IN_CLAUSE_CHUNK])
+            ).returning(Product.id, Product.barcode),
+            execution_options={"synchronize_session": False}
+        ).all())
+    return deleted
+
+
+def query_product_export(store_id: int, db: Session):
+    """Flat product + stock + forecast rows for a store, in product ID order"""
+    return db.query(
+        Product.barcode,
+        Product.name,
+        Product.price,
+        Product.category,
+        Product.reorder_point,
+        func.coalesce(Inventory.quantity, 0).label("initial_quantity"),
+        Forecast.days_until_stockout,
+        Forecast.avg_daily_sales,
+        Forecast.confidence.label("forecast_confidence"),
+        Forecast.recommendation
+    ).outerjoin(
+        Inventory, Inventory.product_id == Product.id
+    ).outerjoin(
+        Forecast, Forecast.product_id == Product.id
+    ).filter(
+        Product.store_id == store_id
+    ).order_by(Product.id)
+
+
+def run_import_job(job: Job, db: Session, path: str, store_id: int, max_errors: int) -> dict:
+    """Background job body for an async bulk upload; removes the spooled file when done"""
+    def report(processed: int, totals):
+        job_manager.progress(job, rows_processed=processed, created=totals.created, skipped=totals.skipped)
+
+    try:
+        with open(path, "rb") as source:
+            result = ProductImportService.import_csv(source, store_id, db, max_errors=max_errors, on_chunk=report)
+    finally:
+        barcode_cache.invalidate_store(store_id)
+        search_index.invalidate_store(store_id)
+        os.unlink(path)
+
+    return BulkUploadResponse(
+        success=result.stopped_at is None,
+        created=result.created,
+        skipped=result.skipped,
+        errors=result.errors
+    ).model_dump()
+
+
 # Routes
 @router.post("/", response_model=ProductResponse)
 async def create_product(
@@ -102,6 +282,8 @@ async def create_product(
     db.add(new_inventory)
     db.commit()
     db.refresh(new_inventory)
+    barcode_cache.invalidate(current_store.id, new_product.barcode)
+    search_index.upsert(current_store.id, new_product.id, new_product.barcode, new_product.name, new_product.category)
     
     return ProductResponse(
         id=new_product.id,
@@ -116,34 +298,106 @@ async def create_product(
 
 @router.get("/", response_model=ProductListResponse)
 async def list_products(
+    request: Request,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(PAGE_SIZE_DEFAULT, gt=0, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     current_store: Store = Depends(get_current_store),
     db: Session = Depends(get_db)
 ):
-    """List all products for store with pagination"""
-    # Get total count
-    total = db.query(Product).filter(Product.store_id == current_store.id).count()
+    """
+    List all products for store with pagination
+    - Pass `next_cursor` back as `cursor` for constant-cost deep pages
+    - `skip` is kept for older clients and ignored when `cursor` is given
+    - `total` is a cached count, omitted when include_total=false
+    With `Accept: application/x-ndjson` or `text/csv` the whole catalogue is
+    streamed instead (pagination parameters are ignored).
+    """
+    media_type = negotiate_stream(request)
+    if media_type:
+        query = query_products_with_inventory(current_store.id, db).order_by(Product.id)
+        return stream_query(query, build_product_response, ProductResponse, media_type, db, filename="products")
     
-    # Get products with inventory
-    products = db.query(Product).filter(
-        Product.store_id == current_store.id
-    ).offset(skip).limit(limit).all()
+    total = None
+    if include_total:
+        total = count_cache.count(
+            ("products", current_store.id),
+            db.query(Product).filter(Product.store_id == current_store.id)
+        )
     
-    result = []
-    for prod in products:
-        inventory = db.query(Inventory).filter(Inventory.product_id == prod.id).first()
-        result.append(ProductResponse(
-            id=prod.id,
-            barcode=prod.barcode,
-            name=prod.name,
-            price=prod.price,
-            category=prod.category,
-            reorder_point=prod.reorder_point,
-            current_quantity=inventory.quantity if inventory else 0
-        ))
+    # Get products with inventory in one joined query
+    products, next_cursor = keyset_page(
+        query_products_with_inventory(current_store.id, db),
+        None, Product.id, lambda prod: (None, prod.id), cursor, limit, skip=skip
+    )
     
-    return ProductListResponse(total=total, products=result)
+    return ProductListResponse(
+        total=total,
+        products=[build_product_response(prod) for prod in products],
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/export")
+async def export_products(
+    export_format: str = Query("csv", alias="format", pattern="^(csv|parquet)$"),
+    current_store: Store = Depends(get_current_store),
+    db: Session = Depends(get_db)
+):
+    """
+    Export the whole catalogue with stock levels and forecasts
+    - CSV columns round-trip with /products/bulk-upload (initial_quantity is
+      the current stock); forecast columns are ignored on re-import
+    - Parquet is written one row group per chunk (requires pyarrow)
+    Rows are streamed from a server-side cursor, so any catalogue size works.
+    """
+    query = query_product_export(current_store.id, db)
+    filename = f"products-{current_store.id}-{datetime.utcnow():%Y%m%d}"
+
+    def to_item(row) -> ProductExportRow:
+        return ProductExportRow(**row._mapping)
+
+    if export_format == "parquet":
+        return stream_parquet(query, to_item, ProductExportRow, db, filename=filename)
+    return stream_query(query, to_item, ProductExportRow, CSV, db, filename=filename)
+
+
+@router.get("/search", response_model=ProductSearchResponse)
+def search_products(
+    q: str = Query(..., min_length=2, max_length=100),
+    category: Optional[str] = None,
+    limit: int = Query(20, gt=0, le=100),
+    current_store: Store = Depends(get_current_store),
+    db: Session = Depends(get_db)
+):
+    """
+    Search products by name, category or barcode
+    - Every word must match as a prefix (or, failing that, approximately)
+    - `facets` counts matches per category, before the `category` filter
+    A plain def, so building a store's index on first search runs in the
+    threadpool instead of stalling the event loop (and every WebSocket).
+    """
+    docs, total, facets = search_index.search(current_store.id, q, limit, db, category=category)
+
+    products = {}
+    if docs:
+        products = {
+            product.id: product
+            for product in query_products_with_inventory(current_store.id, db).filter(
+                Product.id.in_([doc.product_id for doc in docs])
+            )
+        }
+
+    return ProductSearchResponse(
+        total=total,
+        # Keep the index's ranking; skip anything deleted since it was built
+        products=[build_product_response(products[doc.product_id]) for doc in docs if doc.product_id in products],
+        facets=[
+            CategoryFacet(category=name, count=count)
+            for name, count in sorted(facets.items(), key=lambda item: -item[1])
+        ]
+    )
 
 
 @router.get("/{product_id}", response_model=ProductResponse)
@@ -153,25 +407,14 @@ async def get_product(
     db: Session = Depends(get_db)
 ):
     """Get single product by ID"""
-    product = db.query(Product).filter(
-        Product.id == product_id,
-        Product.store_id == current_store.id
+    product = query_products_with_inventory(current_store.id, db).filter(
+        Product.id == product_id
     ).first()
     
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
-    inventory = db.query(Inventory).filter(Inventory.product_id == product_id).first()
-    
-    return ProductResponse(
-        id=product.id,
-        barcode=product.barcode,
-        name=product.name,
-        price=product.price,
-        category=product.category,
-        reorder_point=product.reorder_point,
-        current_quantity=inventory.quantity if inventory else 0
-    )
+    return build_product_response(product)
 
 
 @router.put("/{product_id}", response_model=ProductResponse)
@@ -182,9 +425,8 @@ async def update_product(
     db: Session = Depends(get_db)
 ):
     """Update product details"""
-    product = db.query(Product).filter(
-        Product.id == product_id,
-        Product.store_id == current_store.id
+    product = query_products_with_inventory(current_store.id, db).filter(
+        Product.id == product_id
     ).first()
     
     if not product:
@@ -200,19 +442,44 @@ async def update_product(
     if update.reorder_point is not None:
         product.reorder_point = update.reorder_point
     
-    db.commit()
-    db.refresh(product)
+    # Product fields are part of the inventory view, so surface the change
+    # to delta sync clients
+    if product.inventory:
+        product.inventory.last_updated = datetime.utcnow()
     
-    inventory = db.query(Inventory).filter(Inventory.product_id == product_id).first()
+    # Everything the response needs is already loaded, so no refresh after commit
+    result = build_product_response(product)
+    db.commit()
+    barcode_cache.invalidate(current_store.id, result.barcode)
+    search_index.upsert(current_store.id, result.id, result.barcode, result.name, result.category)
     
-    return ProductResponse(
-        id=product.id,
-        barcode=product.barcode,
-        name=product.name,
-        price=product.price,
-        category=product.category,
-        reorder_point=product.reorder_point,
-        current_quantity=inventory.quantity if inventory else 0
+    return result
+
+
+@router.patch("/bulk", response_model=BulkUpdateResponse)
+async def bulk_update_products(
+    request: BulkUpdateRequest,
+    current_store: Store = Depends(get_current_store),
+    db: Session = Depends(get_db)
+):
+    """
+    Apply many partial product updates in one transaction
+    - Each item is keyed by `id` or `barcode` and carries ProductUpdate fields
+    - With `upsert: true`, unknown barcodes are created (name and price required)
+    - Items that cannot be applied are reported in `errors` (and success is
+      false); the rest commit
+    """
+    changes = [item.model_dump(exclude_unset=True) for item in request.items]
+    result = ProductImportService.apply_updates(changes, current_store.id, request.upsert, db)
+    db.commit()
+    barcode_cache.invalidate_store(current_store.id)
+    search_index.invalidate_store(current_store.id)
+
+    return BulkUpdateResponse(
+        success=not result.errors,
+        updated=result.updated,
+        created=result.created,
+        errors=result.errors
     )
 
 
@@ -231,106 +498,111 @@ async def delete_product(
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
+    barcode = product.barcode
     db.delete(product)
     db.commit()
+    barcode_cache.invalidate(current_store.id, barcode)
+    search_index.remove(current_store.id, product_id)
     
     return {"success": True, "message": "Product deleted successfully"}
 
 
-@router.post("/bulk-upload", response_model=BulkUploadResponse)
-async def bulk_upload_products(
+@router.post("/bulk-delete", response_model=BulkDeleteResponse)
+async def bulk_delete_products(
+    request: BulkDeleteRequest,
+    current_store: Store = Depends(get_current_store),
+    db: Session = Depends(get_db)
+):
+    """Delete many products (and their stock history) by id and/or barcode"""
+    ids = sorted(set(request.ids))
+    barcodes = sorted({barcode.strip() for barcode in request.barcodes})
+
+    deleted = delete_products(current_store.id, Product.id, ids, db)
+    deleted += delete_products(current_store.id, Product.barcode, barcodes, db)
+    db.commit()
+
+    # A product named by both id and barcode is deleted once but matches both keys
+    deleted_ids = {product_id for product_id, _ in deleted}
+    deleted_barcodes = {barcode for _, barcode in deleted}
+    not_found = sum(1 for product_id in ids if product_id not in deleted_ids)
+    not_found += sum(1 for barcode in barcodes if barcode not in deleted_barcodes)
+
+    barcode_cache.invalidate_store(current_store.id)
+    search_index.invalidate_store(current_store.id)
+
+    return BulkDeleteResponse(
+        success=True,
+        deleted=len(deleted),
+        not_found=not_found
+    )
+
+
+@router.post("/bulk-upload", response_model=Union[BulkUploadResponse, JobResponse])
+def bulk_upload_products(
+    response: Response,
     file: UploadFile = File(...),
+    max_errors: int = Query(IMPORT_MAX_ERRORS, ge=0, le=10000),
+    run_async: bool = Query(False, alias="async"),
     current_store: Store = Depends(get_current_store),
     db: Session = Depends(get_db)
 ):
     """
     Bulk upload products from CSV file
     Expected columns: barcode, name, price, category, reorder_point, initial_quantity
+
+    The spooled upload is parsed and committed in chunks of IMPORT_CHUNK_ROWS,
+    so large files never have to fit in memory. At most `max_errors` row
+    errors are returned. If the file breaks after some chunks were committed,
+    those rows stay imported and the response has success=false, the totals
+    so far and an "Import stopped at row N" error.
+
+    With ?async=true the file is handed to a background job and 202 is
+    returned at once; progress arrives as "job_progress" WebSocket messages
+    and via GET /products/jobs/{job_id}.
     """
     if not file.filename.endswith('.csv'):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only CSV files are allowed"
         )
-    
+
+    if run_async:
+        # The upload is gone once the request ends, so keep our own copy
+        with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as spooled:
+            shutil.copyfileobj(file.file, spooled)
+        try:
+            job = job_manager.submit(
+                current_store.id, "product_import", run_import_job,
+                spooled.name, current_store.id, max_errors,
+                on_cancel=functools.partial(os.unlink, spooled.name)
+            )
+        except JobQueueFull as e:
+            os.unlink(spooled.name)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+        response.status_code = status.HTTP_202_ACCEPTED
+        return JobResponse(**job.to_dict())
+
     try:
-        # Read CSV file
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
-        
-        # Validate required columns
-        required_columns = ['barcode', 'name', 'price']
-        for col in required_columns:
-            if col not in df.columns:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Missing required column: {col}"
-                )
-        
-        # Optional columns with defaults
-        if 'category' not in df.columns:
-            df['category'] = None
-        if 'reorder_point' not in df.columns:
-            df['reorder_point'] = 20
-        if 'initial_quantity' not in df.columns:
-            df['initial_quantity'] = 0
-        
-        created = 0
-        skipped = 0
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                # Validate barcode
-                barcode = str(row['barcode']).strip()
-                
-                if not BarcodeService.validate_barcode(barcode):
-                    errors.append(f"Row {index + 2}: Invalid barcode format '{barcode}'")
-                    skipped += 1
-                    continue
-                
-                # Check if barcode already exists
-                if not BarcodeService.is_barcode_unique(barcode, current_store.id, db):
-                    errors.append(f"Row {index + 2}: Barcode '{barcode}' already exists")
-                    skipped += 1
-                    continue
-                
-                # Create product
-                new_product = Product(
-                    store_id=current_store.id,
-                    barcode=barcode,
-                    name=str(row['name']).strip(),
-                    price=Decimal(str(row['price'])),
-                    category=str(row['category']).strip() if pd.notna(row['category']) else None,
-                    reorder_point=int(row['reorder_point'])
-                )
-                db.add(new_product)
-                db.flush()  # Get product ID
-                
-                # Create inventory
-                new_inventory = Inventory(
-                    product_id=new_product.id,
-                    store_id=current_store.id,
-                    quantity=int(row['initial_quantity'])
-                )
-                db.add(new_inventory)
-                
-                created += 1
-                
-            except Exception as e:
-                errors.append(f"Row {index + 2}: {str(e)}")
-                skipped += 1
-        
-        db.commit()
-        
+        try:
+            result = ProductImportService.import_csv(file.file, current_store.id, db, max_errors=max_errors)
+        finally:
+            barcode_cache.invalidate_store(current_store.id)
+            search_index.invalidate_store(current_store.id)
+
         return BulkUploadResponse(
-            success=True,
-            created=created,
-            skipped=skipped,
-            errors=errors[:10]  # Return max 10 errors
+            success=result.stopped_at is None,
+            created=result.created,
+            skipped=result.skipped,
+            errors=result.errors
+        )
+
+    except InvalidImportFile as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        
-    except pd.errors.ParserError:
+    except (pd.errors.ParserError, pd.errors.EmptyDataError):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid CSV file format"
@@ -340,3 +612,24 @@ async def bulk_upload_products(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing file: {str(e)}"
         )
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    current_store: Store = Depends(get_current_store)
+):
+    """
+    Get the status of a background job started by this store
+
+    Jobs are tracked by the worker process that accepted them, so behind a
+    load balancer this can 404 for a live job; "job_progress" WebSocket
+    messages reach the store from any worker.
+    """
+    job = job_manager.get(job_id, current_store.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return JobResponse(**job.to_dict())
@@ -1,8 +1,112 @@
 import secrets
 import random
-from typing import Optional
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, Optional, Tuple
 from sqlalchemy.orm import Session
-from app.database import Product
+from app.database import Product, Inventory
+
+# Cache sizing (entries per store, number of stores kept)
+BARCODE_CACHE_SIZE = int(os.getenv("BARCODE_CACHE_SIZE", "10000"))
+BARCODE_CACHE_STORES = int(os.getenv("BARCODE_CACHE_STORES", "100"))
+# Entries expire after this long, which bounds how stale another worker's
+# copy can get (invalidations only reach the process that made the write)
+BARCODE_CACHE_TTL_SECONDS = float(os.getenv("BARCODE_CACHE_TTL_SECONDS", "30"))
+
+# What a scan needs to know about a product, without touching the database
+CachedProduct = namedtuple(
+    "CachedProduct",
+    ["product_id", "barcode", "name", "category", "price", "reorder_point", "inventory_id"]
+)
+
+
+class BarcodeCache:
+    """
+    Bounded, LRU-evicted cache of barcode -> CachedProduct, kept per store
+
+    The cache is per process. Routes that change products must invalidate
+    the affected entries (or the whole store) after committing; other
+    workers catch up when their entries expire after ttl_seconds.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = BARCODE_CACHE_SIZE,
+        max_stores: int = BARCODE_CACHE_STORES,
+        ttl_seconds: float = BARCODE_CACHE_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.max_stores = max_stores
+        self.ttl_seconds = ttl_seconds
+        # store_id -> barcode -> (expires_at, entry)
+        self._stores: "OrderedDict[int, OrderedDict[str, Tuple[float, CachedProduct]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, store_id: int, barcode: str) -> Optional[CachedProduct]:
+        """Return the cached entry and mark it most recently used"""
+        with self._lock:
+            entries = self._stores.get(store_id)
+            item = entries.get(barcode) if entries is not None else None
+            if item is not None and item[0] <= time.monotonic():
+                del entries[barcode]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(barcode)
+            self._stores.move_to_end(store_id)
+            self.hits += 1
+            return item[1]
+    
+    def put(self, store_id: int, entry: CachedProduct):
+        """Add an entry, evicting the least recently used ones past the bounds"""
+        with self._lock:
+            entries = self._stores.get(store_id)
+            if entries is None:
+                entries = self._stores[store_id] = OrderedDict()
+                if len(self._stores) > self.max_stores:
+                    self._stores.popitem(last=False)
+            self._stores.move_to_end(store_id)
+            entries[entry.barcode] = (time.monotonic() + self.ttl_seconds, entry)
+            entries.move_to_end(entry.barcode)
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+    
+    def invalidate(self, store_id: int, barcode: str):
+        """Drop a single barcode for a store"""
+        with self._lock:
+            entries = self._stores.get(store_id)
+            if entries is not None:
+                entries.pop(barcode, None)
+    
+    def invalidate_store(self, store_id: int):
+        """Drop every cached barcode for a store"""
+        with self._lock:
+            self._stores.pop(store_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._stores.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": len(self._stores),
+                "entries": sum(len(entries) for entries in self._stores.values())
+            }
+
+
+# Global barcode cache instance
+barcode_cache = BarcodeCache()
 
 
 class BarcodeService:
@@ -44,6 +148,55 @@ class BarcodeService:
         
         return product
     
+    @staticmethod
+    def resolve_barcodes(barcodes: Iterable[str], store_id: int, db: Session) -> Dict[str, CachedProduct]:
+        """
+        Resolve barcodes to product details, serving hits from the cache
+        
+        Misses are loaded together with their inventory row in one query.
+        
+        Args:
+            barcodes: Barcode strings
+            store_id: Store ID for scoping
+            db: Database session
+        
+        Returns:
+            Dictionary of barcode -> CachedProduct for barcodes that exist
+        """
+        resolved = {}
+        missing = set()
+        for barcode in set(barcodes):
+            if not BarcodeService.validate_barcode(barcode):
+                continue
+            entry = barcode_cache.get(store_id, barcode)
+            if entry is not None:
+                resolved[barcode] = entry
+            else:
+                missing.add(barcode)
+        
+        if missing:
+            rows = db.query(
+                Product.id, Product.barcode, Product.name, Product.category,
+                Product.price, Product.reorder_point, Inventory.id
+            ).outerjoin(
+                Inventory, Inventory.product_id == Product.id
+            ).filter(
+                Product.store_id == store_id,
+                Product.barcode.in_(missing)
+            ).all()
+            
+            for row in rows:
+                entry = CachedProduct(*row)
+                barcode_cache.put(store_id, entry)
+                resolved[entry.barcode] = entry
+        
+        return resolved
+    
+    @staticmethod
+    def resolve_barcode(barcode: str, store_id: int, db: Session) -> Optional[CachedProduct]:
+        """Resolve a single barcode, see resolve_barcodes"""
+        return BarcodeService.resolve_barcodes([barcode], store_id, db).get(barcode)
+    
     @staticmethod
     def generate_barcode() -> str:
         """
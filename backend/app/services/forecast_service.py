@@ -1,11 +1,15 @@
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, insert, update
 from app.database import Transaction, Product, Inventory, Forecast
 from decimal import Decimal
+import numpy as np
 import statistics
 
+# Days of sales history forecasts are based on
+HISTORY_DAYS = 30
+
 
 class ForecastService:
     """Service for AI-powered inventory forecasting"""
@@ -31,7 +35,7 @@ class ForecastService:
             return None
         
         # Get last 30 days of transactions (sales only)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        thirty_days_ago = datetime.utcnow() - timedelta(days=HISTORY_DAYS)
         
         transactions = db.query(Transaction).filter(
             Transaction.product_id == product_id,
@@ -41,14 +45,7 @@ class ForecastService:
         ).all()
         
         if not transactions:
-            # No sales history - can't forecast
-            return {
-                "product_id": product_id,
-                "days_until_stockout": None,
-                "confidence": 0.0,
-                "avg_daily_sales": 0.0,
-                "recommendation": "No sales history available"
-            }
+            return ForecastService._no_history(product_id)
         
         # Group transactions by date and sum daily sales
         daily_sales = {}
@@ -70,8 +67,25 @@ class ForecastService:
         else:
             confidence = 0.5  # Medium confidence with limited data
         
+        return ForecastService._build_forecast(
+            product_id, inventory.quantity, product.reorder_point, avg_daily_sales, confidence
+        )
+    
+    @staticmethod
+    def _no_history(product_id: int) -> Dict:
+        """Forecast for a product without sales - can't forecast"""
+        return {
+            "product_id": product_id,
+            "days_until_stockout": None,
+            "confidence": 0.0,
+            "avg_daily_sales": 0.0,
+            "recommendation": "No sales history available"
+        }
+    
+    @staticmethod
+    def _build_forecast(product_id: int, current_qty: int, reorder_point: int, avg_daily_sales: float, confidence: float) -> Dict:
+        """Turn sales statistics into stockout prediction and recommendation"""
         # Predict days until stockout
-        current_qty = inventory.quantity
         if avg_daily_sales > 0:
             days_until_stockout = int(current_qty / avg_daily_sales)
         else:
@@ -81,7 +95,7 @@ class ForecastService:
         recommendation = ForecastService._generate_recommendation(
             days_until_stockout, 
             current_qty, 
-            product.reorder_point
+            reorder_point
         )
         
         return {
@@ -143,16 +157,92 @@ class ForecastService:
             db.refresh(new_forecast)
             return new_forecast
     
+    @staticmethod
+    def sales_statistics(store_id: int, db: Session) -> Dict[int, Tuple[float, float]]:
+        """
+        Average daily sales and confidence of every product with recent sales
+        
+        Daily totals come from one GROUP BY over the store's sales; mean and
+        sample standard deviation are then computed per product with NumPy
+        over the sorted totals, without a Python loop per product.
+        
+        Returns:
+            Dictionary of product_id -> (avg_daily_sales, confidence)
+        """
+        since = datetime.utcnow() - timedelta(days=HISTORY_DAYS)
+        day = func.date(Transaction.created_at)
+        rows = db.query(
+            Transaction.product_id,
+            func.sum(func.abs(Transaction.quantity_change))
+        ).filter(
+            Transaction.store_id == store_id,
+            Transaction.transaction_type == 'out',  # Sales only
+            Transaction.created_at >= since
+        ).group_by(Transaction.product_id, day).order_by(Transaction.product_id).all()
+        
+        if not rows:
+            return {}
+        
+        product_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        daily = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        
+        # Rows are sorted by product, so each product is one contiguous run
+        ids, starts, days = np.unique(product_ids, return_index=True, return_counts=True)
+        means = np.add.reduceat(daily, starts) / days
+        squares = np.add.reduceat((daily - np.repeat(means, days)) ** 2, starts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std_devs = np.sqrt(squares / (days - 1))
+        
+        # Lower variability = higher confidence; medium confidence with a single day
+        confidence = np.where(days > 1, np.clip(1 - std_devs / (means + 1), 0.0, 1.0), 0.5)
+        return dict(zip(ids.tolist(), zip(means.tolist(), confidence.tolist())))
+    
     @staticmethod
     def recalculate_all_forecasts(store_id: int, db: Session) -> int:
-        """Recalculate forecasts for all products in store"""
-        products = db.query(Product).filter(Product.store_id == store_id).all()
-        count = 0
+        """
+        Recalculate forecasts for all products in store in one pass
         
-        for product in products:
-            forecast_data = ForecastService.calculate_forecast(product.id, store_id, db)
-            if forecast_data:
-                ForecastService.save_forecast(forecast_data, store_id, db)
-                count += 1
+        One aggregate query for sales, one for products with their stock,
+        one for the existing forecasts, then bulk UPDATE/INSERT committed
+        together. Products without inventory are skipped.
         
-        return count
+        Returns:
+            Number of forecasts written
+        """
+        stats = ForecastService.sales_statistics(store_id, db)
+        products = db.query(Product.id, Product.reorder_point, Inventory.quantity).join(
+            Inventory, Inventory.product_id == Product.id
+        ).filter(Product.store_id == store_id).all()
+        
+        existing = dict(db.query(Forecast.product_id, Forecast.id).filter(Forecast.store_id == store_id).all())
+        
+        now = datetime.utcnow()
+        updates, inserts = [], []
+        for product_id, reorder_point, quantity in products:
+            if product_id in stats:
+                avg_daily_sales, confidence = stats[product_id]
+                forecast_data = ForecastService._build_forecast(
+                    product_id, quantity, reorder_point, avg_daily_sales, confidence
+                )
+            else:
+                forecast_data = ForecastService._no_history(product_id)
+            
+            row = {
+                "days_until_stockout": forecast_data["days_until_stockout"],
+                "confidence": Decimal(str(forecast_data["confidence"])),
+                "avg_daily_sales": Decimal(str(forecast_data["avg_daily_sales"])),
+                "recommendation": forecast_data["recommendation"],
+                "last_recalculated": now
+            }
+            if product_id in existing:
+                updates.append({"id": existing[product_id], **row})
+            else:
+                inserts.append({"product_id": product_id, "store_id": store_id, **row})
+        
+        if updates:
+            db.execute(update(Forecast), updates)
+        if inserts:
+            db.execute(insert(Forecast), inserts)
+        db.commit()
+        
+        return len(products)
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from app.database import IdempotencyRecord, SessionLocal
+
+# How long a stored response can be replayed, and how many are kept in memory
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# How often expired rows are swept from the idempotency_keys table
+IDEMPOTENCY_SWEEP_SECONDS = int(os.getenv("IDEMPOTENCY_SWEEP_SECONDS", "3600"))
+
+# A response recorded under an Idempotency-Key
+StoredResponse = namedtuple("StoredResponse", ["request_hash", "status_code", "body"])
+
+
+class IdempotencyCache:
+    """TTL + LRU-evicted cache of (store_id, key) -> StoredResponse"""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, store_id: int, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            item = self._entries.get((store_id, key))
+            if item is None:
+                return None
+            expires_at, stored = item
+            if expires_at < time.monotonic():
+                del self._entries[(store_id, key)]
+                return None
+            self._entries.move_to_end((store_id, key))
+            return stored
+
+    def put(self, store_id: int, key: str, stored: StoredResponse, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[(store_id, key)] = (time.monotonic() + ttl, stored)
+            self._entries.move_to_end((store_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_store(self, store_id: int):
+        """Drop every cached response for a store"""
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == store_id]:
+                del self._entries[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global idempotency cache instance
+idempotency_cache = IdempotencyCache()
+
+
+class IdempotencyService:
+    """Service for replaying responses of retried mutating requests"""
+
+    @staticmethod
+    def request_hash(endpoint: str, payload: dict) -> str:
+        """Fingerprint a request so a key cannot be reused for a different one"""
+        raw = json.dumps([endpoint, payload], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def lookup(store_id: int, key: str, db: Session) -> Optional[StoredResponse]:
+        """
+        Find the stored response for a key
+
+        Served from the in-process cache when possible; otherwise from the
+        idempotency_keys table, which survives restarts, and the cache is
+        warmed. An expired row is deleted (and flushed) in the caller's
+        transaction right away, so the key can be remembered again.
+
+        Args:
+            store_id: Store ID for scoping
+            key: Idempotency-Key header value
+            db: Database session
+
+        Returns:
+            StoredResponse if the key was seen within the TTL, None otherwise
+        """
+        stored = idempotency_cache.get(store_id, key)
+        if stored is not None:
+            return stored
+
+        record = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.store_id == store_id,
+            IdempotencyRecord.key == key
+        ).first()
+        if record is None:
+            return None
+
+        age = (datetime.utcnow() - record.created_at).total_seconds()
+        if age > IDEMPOTENCY_TTL_SECONDS:
+            # An immediate DELETE, not db.delete(): the unit of work would
+            # flush remember()'s INSERT of the same key before it
+            db.expunge(record)
+            db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.id == record.id))
+            return None
+
+        stored = StoredResponse(record.request_hash, record.status_code, json.loads(record.response_body))
+        idempotency_cache.put(store_id, key, stored, ttl_seconds=IDEMPOTENCY_TTL_SECONDS - age)
+        return stored
+
+    @staticmethod
+    def remember(store_id: int, key: str, request_hash: str, body: dict, db: Session, status_code: int = 200) -> StoredResponse:
+        """
+        Record a response under a key
+
+        The row is added to the caller's transaction so it commits atomically
+        with the change it describes. Call cache() once the commit succeeds.
+        """
+        db.add(IdempotencyRecord(
+            store_id=store_id,
+            key=key,
+            request_hash=request_hash,
+            status_code=status_code,
+            response_body=json.dumps(body, default=str)
+        ))
+        return StoredResponse(request_hash, status_code, body)
+
+    @staticmethod
+    def cache(store_id: int, key: str, stored: StoredResponse):
+        """Make a committed response replayable without a database lookup"""
+        idempotency_cache.put(store_id, key, stored)
+
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        """Delete every expired idempotency_keys row and commit; returns rows deleted"""
+        cutoff = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        result = db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff))
+        db.commit()
+        return result.rowcount
+
+
+async def sweep_expired_keys(session_factory: Callable[[], Session] = SessionLocal):
+    """Background task: purge expired idempotency keys every IDEMPOTENCY_SWEEP_SECONDS"""
+    def sweep():
+        db = session_factory()
+        try:
+            return IdempotencyService.purge_expired(db)
+        finally:
+            db.close()
+
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_SWEEP_SECONDS)
+        try:
+            deleted = await run_in_threadpool(sweep)
+            if deleted:
+                print(f"🧹 Removed {deleted} expired idempotency keys")
+        except Exception as e:
+            print(f"⚠️  Idempotency key sweep failed: {e}")
@@ -0,0 +1,347 @@
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+from typing import BinaryIO, Callable, Dict, List, Optional, Set
+import os
+import pandas as pd
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from app.database import Product, Inventory
+from app.services.barcode_service import BarcodeService
+
+REQUIRED_COLUMNS = ["barcode", "name", "price"]
+
+# Rows parsed, validated and committed at a time, and errors kept per import
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "10000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+
+# Defaults for optional columns (and for blank cells in them)
+OPTIONAL_DEFAULTS = {"category": None, "reorder_point": 20, "initial_quantity": 0}
+
+class InvalidImportFile(ValueError):
+    """Raised when an uploaded file cannot be imported at all"""
+
+
+# Outcome of importing a DataFrame or a whole file, and of a bulk update;
+# stopped_at is the first row left unimported when a file import gave up midway
+ImportResult = namedtuple("ImportResult", ["created", "skipped", "errors", "stopped_at"], defaults=(None,))
+UpdateResult = namedtuple("UpdateResult", ["updated", "created", "errors"])
+
+# Product columns a bulk update may set
+UPDATABLE_FIELDS = ("name", "price", "category", "reorder_point")
+
+# Keys per IN (...) list, well under SQLite's bound parameter limit
+IN_CLAUSE_CHUNK = 500
+
+
+class ProductImportService:
+    """Service for bulk importing products from tabular (CSV) data"""
+
+    @staticmethod
+    def missing_column(df: pd.DataFrame) -> Optional[str]:
+        """Return the first required column absent from the frame, if any"""
+        for column in REQUIRED_COLUMNS:
+            if column not in df.columns:
+                return column
+        return None
+
+    @staticmethod
+    def existing_barcodes(store_id: int, db: Session) -> Set[str]:
+        """Fetch every barcode the store already has in a single query"""
+        return {barcode for (barcode,) in db.query(Product.barcode).filter(Product.store_id == store_id)}
+
+    @staticmethod
+    def import_frame(
+        df: pd.DataFrame,
+        store_id: int,
+        existing: Set[str],
+        db: Session,
+        row_offset: int = 0
+    ) -> ImportResult:
+        """
+        Validate and insert a frame of products with set-based checks
+
+        Validation runs column-wise over the whole frame; duplicates are found
+        against `existing` and within the frame itself (the first occurrence
+        wins), then products and inventory are written with two executemany
+        INSERTs. Nothing is committed.
+
+        Args:
+            df: Frame with at least the REQUIRED_COLUMNS
+            store_id: Store ID for scoping
+            existing: Barcodes already in the store; extended with the new ones
+            db: Database session
+            row_offset: Index of the frame's first row in the source file
+
+        Returns:
+            ImportResult with counts and "Row N: ..." errors in file order
+        """
+        df = df.reset_index(drop=True)
+        for column, default in OPTIONAL_DEFAULTS.items():
+            if column not in df.columns:
+                df[column] = default
+
+        # Spreadsheet row numbers: +1 for the header, +1 for 1-based rows
+        row_numbers = pd.Series(range(row_offset + 2, row_offset + 2 + len(df)), index=df.index)
+
+        barcode = df["barcode"].where(df["barcode"].notna(), "").astype(str).str.strip()
+        name = df["name"].where(df["name"].notna(), "").astype(str).str.strip()
+        category = df["category"].astype(object).where(df["category"].notna(), None)
+        category = category.map(lambda value: (str(value).strip() or None) if value is not None else None)
+        price = pd.to_numeric(df["price"], errors="coerce")
+        reorder_point = pd.to_numeric(df["reorder_point"], errors="coerce")
+        initial_quantity = pd.to_numeric(df["initial_quantity"], errors="coerce")
+
+        # Same barcode rule as single-product creates and scans
+        bad_format = ~barcode.map(BarcodeService.validate_barcode).astype(bool)
+
+        # Each row reports only its first problem, in this order
+        in_store = barcode.isin(existing)
+        checks = [
+            (name == "", pd.Series("Missing name", index=df.index)),
+            (price.isna(), "Invalid price '" + df["price"].astype(str) + "'"),
+            (reorder_point.isna() & df["reorder_point"].notna(),
+             "Invalid reorder_point '" + df["reorder_point"].astype(str) + "'"),
+            (initial_quantity.isna() & df["initial_quantity"].notna(),
+             "Invalid initial_quantity '" + df["initial_quantity"].astype(str) + "'"),
+        ]
+        problem = pd.Series(None, index=df.index, dtype=object)
+        for failed, message in checks:
+            problem = problem.mask(problem.isna() & failed, message)
+
+        # A repeated barcode clashes only with an earlier row that gets
+        # imported, exactly as if the rows were inserted one by one
+        candidates = ~bad_format & ~in_store & problem.isna()
+        first_row = pd.Series(df.index[candidates], index=barcode[candidates]).groupby(level=0).min()
+        repeated = barcode.map(first_row).lt(df.index)
+
+        problem = problem.mask(in_store | repeated, "Barcode '" + barcode + "' already exists")
+        problem = problem.mask(bad_format, "Invalid barcode format '" + barcode + "'")
+
+        invalid = problem.notna()
+        errors = [f"Row {number}: {message}" for number, message in zip(row_numbers[invalid], problem[invalid])]
+
+        valid = ~invalid
+        if not valid.any():
+            return ImportResult(0, int(invalid.sum()), errors)
+
+        products = pd.DataFrame({
+            "store_id": store_id,
+            "barcode": barcode[valid],
+            "name": name[valid],
+            "price": price[valid].map(lambda value: Decimal(str(value))),
+            "category": category[valid],
+            "reorder_point": reorder_point[valid].fillna(OPTIONAL_DEFAULTS["reorder_point"]).astype(int),
+        })
+        quantities = initial_quantity[valid].fillna(OPTIONAL_DEFAULTS["initial_quantity"]).astype(int)
+
+        created = ProductImportService.insert_products(
+            store_id,
+            products.astype(object).where(products.notna(), None).to_dict("records"),
+            dict(zip(products["barcode"], quantities.tolist())),
+            db
+        )
+
+        existing.update(products["barcode"])
+        return ImportResult(created, int(invalid.sum()), errors)
+
+    @staticmethod
+    def insert_products(store_id: int, products: List[dict], quantities: Dict[str, int], db: Session) -> int:
+        """
+        Insert validated products and their inventory rows in bulk
+
+        Args:
+            store_id: Store ID for scoping
+            products: Product column dicts (store_id, barcode, name, price, ...)
+            quantities: Initial inventory quantity per barcode
+            db: Database session
+
+        Returns:
+            Number of products inserted
+        """
+        if not products:
+            return 0
+
+        # Batched multi-row INSERT ... RETURNING; the rows come back in no
+        # guaranteed order, so generated IDs are matched up by barcode
+        inserted = db.execute(insert(Product).returning(Product.id, Product.barcode), products).all()
+
+        db.execute(insert(Inventory), [
+            {"product_id": product_id, "store_id": store_id, "quantity": quantities.get(code, 0)}
+            for product_id, code in inserted
+        ])
+        return len(inserted)
+
+    @staticmethod
+    def apply_updates(changes: List[dict], store_id: int, upsert: bool, db: Session) -> UpdateResult:
+        """
+        Apply partial product updates keyed by id or barcode
+
+        Keys are resolved with one query, changes for the same product are
+        merged in request order, and the updates run as one executemany
+        UPDATE by primary key. In upsert mode, barcodes that do not exist yet
+        are created (name and price required). Nothing is committed.
+
+        Args:
+            changes: Dicts with "id" or "barcode" plus the fields to set;
+                "initial_quantity" only applies to created products
+            store_id: Store ID for scoping
+            upsert: Create products for unknown barcodes
+            db: Database session
+
+        Returns:
+            UpdateResult with counts and "Item N: ..." errors (1-based)
+        """
+        ids = {change["id"] for change in changes if change.get("id") is not None}
+        barcodes = {change["barcode"] for change in changes if change.get("barcode") is not None}
+
+        id_by_barcode: Dict[str, int] = {}
+        known_ids: Set[int] = set()
+        for chunk in _chunks(sorted(ids), IN_CLAUSE_CHUNK):
+            known_ids.update(product_id for (product_id,) in db.query(Product.id).filter(
+                Product.store_id == store_id, Product.id.in_(chunk)
+            ))
+        for chunk in _chunks(sorted(barcodes), IN_CLAUSE_CHUNK):
+            for product_id, code in db.query(Product.id, Product.barcode).filter(
+                Product.store_id == store_id, Product.barcode.in_(chunk)
+            ):
+                id_by_barcode[code] = product_id
+                known_ids.add(product_id)
+
+        updates: Dict[int, dict] = {}
+        creates: Dict[str, dict] = {}
+        errors: List[str] = []
+
+        for number, change in enumerate(changes, start=1):
+            fields = {k: v for k, v in change.items() if k in UPDATABLE_FIELDS and v is not None}
+            product_id = change.get("id")
+            barcode = change.get("barcode")
+            if product_id is None:
+                product_id = id_by_barcode.get(barcode)
+
+            if product_id is not None and product_id in known_ids:
+                updates.setdefault(product_id, {"id": product_id}).update(fields)
+            elif barcode is not None and upsert:
+                if not BarcodeService.validate_barcode(barcode):
+                    errors.append(f"Item {number}: Invalid barcode format '{barcode}'")
+                    continue
+                pending = {**creates.get(barcode, {}), **fields}
+                if "initial_quantity" in change:
+                    pending["initial_quantity"] = change["initial_quantity"]
+                creates[barcode] = pending
+            else:
+                errors.append(f"Item {number}: Product {product_id if barcode is None else repr(barcode)} not found")
+
+        # Creates are validated after merging, so a name and price may come
+        # from different items for the same barcode
+        products, quantities = [], {}
+        for barcode, fields in creates.items():
+            if fields.get("name") is None or fields.get("price") is None:
+                errors.append(f"Item for barcode '{barcode}': name and price are required to create a product")
+                continue
+            products.append({
+                "store_id": store_id,
+                "barcode": barcode,
+                "name": fields["name"],
+                "price": fields["price"],
+                "category": fields.get("category"),
+                "reorder_point": fields.get("reorder_point", OPTIONAL_DEFAULTS["reorder_point"]),
+            })
+            quantities[barcode] = fields.get("initial_quantity", OPTIONAL_DEFAULTS["initial_quantity"])
+
+        rows = [row for row in updates.values() if len(row) > 1]
+        if rows:
+            db.execute(update(Product), rows)
+            # Product fields are part of the inventory view, so surface the
+            # change to delta sync clients
+            now = datetime.utcnow()
+            for chunk in _chunks([row["id"] for row in rows], IN_CLAUSE_CHUNK):
+                db.execute(
+                    update(Inventory).where(Inventory.product_id.in_(chunk)).values(last_updated=now),
+                    execution_options={"synchronize_session": False}
+                )
+
+        created = ProductImportService.insert_products(store_id, products, quantities, db)
+        return UpdateResult(len(rows), created, errors)
+
+    @staticmethod
+    def import_csv(
+        source: BinaryIO,
+        store_id: int,
+        db: Session,
+        chunk_rows: Optional[int] = None,
+        max_errors: Optional[int] = None,
+        on_chunk: Optional[Callable[[int, ImportResult], None]] = None
+    ) -> ImportResult:
+        """
+        Stream a CSV file into the store chunk by chunk
+
+        Each chunk is validated, inserted and committed before the next one is
+        parsed, so memory is bounded by chunk_rows rather than the file size.
+        Chunks committed before a parse or database error stay imported; the
+        totals so far are returned with a "stopped at row N" error and
+        stopped_at set, rather than raising.
+
+        Args:
+            source: Binary file object positioned at the header row
+            store_id: Store ID for scoping
+            db: Database session
+            chunk_rows: Rows per chunk (defaults to IMPORT_CHUNK_ROWS)
+            max_errors: Maximum number of row errors collected (defaults to IMPORT_MAX_ERRORS)
+            on_chunk: Called with (rows processed, totals so far) after each commit
+
+        Returns:
+            ImportResult totals for the whole file, or up to the failing chunk
+
+        Raises:
+            InvalidImportFile: If a required column is missing
+            pandas.errors.ParserError / EmptyDataError: If the file is not valid
+                CSV and nothing has been committed yet
+        """
+        # Barcodes are identifiers, so keep them as text (leading zeros matter)
+        reader = pd.read_csv(source, chunksize=chunk_rows or IMPORT_CHUNK_ROWS, dtype={"barcode": str})
+        if max_errors is None:
+            max_errors = IMPORT_MAX_ERRORS
+
+        existing: Optional[Set[str]] = None
+        created = skipped = processed = 0
+        errors: List[str] = []
+
+        with reader:
+            try:
+                for chunk in reader:
+                    if existing is None:
+                        missing = ProductImportService.missing_column(chunk)
+                        if missing:
+                            raise InvalidImportFile(f"Missing required column: {missing}")
+                        existing = ProductImportService.existing_barcodes(store_id, db)
+
+                    result = ProductImportService.import_frame(chunk, store_id, existing, db, row_offset=processed)
+                    db.commit()
+
+                    processed += len(chunk)
+                    created += result.created
+                    skipped += result.skipped
+                    errors.extend(result.errors[:max(max_errors - len(errors), 0)])
+
+                    if on_chunk:
+                        on_chunk(processed, ImportResult(created, skipped, errors))
+            except InvalidImportFile:
+                raise
+            except Exception as e:
+                # Nothing committed yet: the caller can report a plain failure
+                if not processed:
+                    raise
+                db.rollback()
+                # Header is row 1, so the first uncommitted row is processed + 2
+                stopped_at = processed + 2
+                print(f"⚠️  Import for store {store_id} stopped at row {stopped_at}: {e}")
+                errors.append(f"Import stopped at row {stopped_at}: {e}")
+                return ImportResult(created, skipped, errors, stopped_at)
+
+        return ImportResult(created, skipped, errors)
+
+
+def _chunks(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
@@ -0,0 +1,285 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import update, insert, select, literal, case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from app.database import Inventory, Transaction, Alert
+from app.services.barcode_service import BarcodeService, CachedProduct, barcode_cache
+
+# Products per set-based stock UPDATE (each costs three bound parameters)
+BULK_ADJUST_CHUNK = 500
+
+
+class InventoryService:
+    """Service for applying stock movements"""
+
+    @staticmethod
+    def low_stock_message(name: str, quantity: int, reorder_point: int) -> str:
+        """Build the message stored on a low stock alert"""
+        return f"Low stock alert: {name} has only {quantity} units left (reorder point: {reorder_point})"
+
+    @staticmethod
+    def adjust_stock(product_id: int, store_id: int, quantity_change: int, db: Session) -> Optional[Row]:
+        """
+        Atomically apply a quantity change to a product's inventory
+
+        Runs a single conditional UPDATE ... RETURNING, so concurrent scans of
+        the same product never lose updates and a sale can never take stock
+        below zero. The caller owns the surrounding transaction.
+
+        Args:
+            product_id: Product ID
+            store_id: Store ID for scoping
+            quantity_change: Negative for sales, positive for restocks
+            db: Database session
+
+        Returns:
+            Row with (id, quantity, last_updated) after the change, or None if
+            the inventory row is missing or holds too little stock
+        """
+        stmt = update(Inventory).where(
+            Inventory.product_id == product_id,
+            Inventory.store_id == store_id
+        )
+        if quantity_change < 0:
+            stmt = stmt.where(Inventory.quantity >= -quantity_change)
+
+        stmt = stmt.values(
+            quantity=Inventory.quantity + quantity_change,
+            last_updated=datetime.utcnow()
+        ).returning(
+            Inventory.id, Inventory.quantity, Inventory.last_updated
+        ).execution_options(synchronize_session=False)
+
+        return db.execute(stmt).first()
+
+    @staticmethod
+    def adjust_stock_bulk(store_id: int, changes: Dict[int, Tuple[int, int]], db: Session) -> Dict[int, int]:
+        """
+        Apply net quantity changes to many products with set-based UPDATEs
+
+        Each chunk of products is one UPDATE ... SET quantity = quantity +
+        CASE ... WHERE quantity >= CASE ... RETURNING, so a product is only
+        changed if it holds enough stock for its whole sequence of scans.
+
+        Args:
+            store_id: Store ID for scoping
+            changes: product_id -> (net change, stock required up front)
+            db: Database session
+
+        Returns:
+            product_id -> quantity after the change, for the products that
+            were updated; missing products have no inventory or too little stock
+        """
+        now = datetime.utcnow()
+        product_ids = list(changes)
+        updated = {}
+        for start in range(0, len(product_ids), BULK_ADJUST_CHUNK):
+            chunk = product_ids[start:start + BULK_ADJUST_CHUNK]
+            net = case({pid: changes[pid][0] for pid in chunk}, value=Inventory.product_id)
+            required = case({pid: changes[pid][1] for pid in chunk}, value=Inventory.product_id)
+            stmt = update(Inventory).where(
+                Inventory.store_id == store_id,
+                Inventory.product_id.in_(chunk),
+                Inventory.quantity >= required
+            ).values(
+                quantity=Inventory.quantity + net,
+                last_updated=now
+            ).returning(
+                Inventory.product_id, Inventory.quantity
+            ).execution_options(synchronize_session=False)
+            updated.update(db.execute(stmt).tuples().all())
+        return updated
+
+    @staticmethod
+    def current_quantity(product_id: int, store_id: int, db: Session) -> Optional[int]:
+        """Read the stored quantity, used to explain a rejected adjust_stock"""
+        row = db.query(Inventory.quantity).filter(
+            Inventory.product_id == product_id,
+            Inventory.store_id == store_id
+        ).first()
+        return row.quantity if row else None
+
+    @staticmethod
+    def record_transaction(product_id: int, store_id: int, quantity_change: int, db: Session) -> int:
+        """Insert a transaction row and return its ID without an ORM refresh"""
+        stmt = insert(Transaction).values(
+            product_id=product_id,
+            store_id=store_id,
+            quantity_change=quantity_change,
+            transaction_type="out" if quantity_change < 0 else "in"
+        ).returning(Transaction.id)
+        return db.execute(stmt).scalar_one()
+
+    @staticmethod
+    def insert_low_stock_alert(product_id: int, name: str, reorder_point: int, store_id: int, quantity: int, db: Session) -> Optional[Row]:
+        """
+        Insert a low stock alert unless an unacknowledged one is already open
+
+        The existence test and the insert are one INSERT ... SELECT ... WHERE
+        NOT EXISTS statement backed by the open-alert index. Concurrent scans
+        can both pass NOT EXISTS, so the partial unique index on open alerts
+        decides and the loser's insert becomes a no-op (ON CONFLICT DO
+        NOTHING). The caller owns the surrounding transaction.
+
+        Returns:
+            Row with (id, message, alert_type) if an alert was created, else None
+        """
+        if quantity >= reorder_point:
+            return None
+
+        message = InventoryService.low_stock_message(name, quantity, reorder_point)
+        already_open = select(Alert.id).where(
+            Alert.store_id == store_id,
+            Alert.product_id == product_id,
+            Alert.alert_type == "low_stock",
+            Alert.acknowledged == False
+        ).exists()
+        values = select(
+            literal(store_id),
+            literal(product_id),
+            literal("low_stock"),
+            literal(message),
+            literal(False),
+            literal(datetime.utcnow())
+        ).where(~already_open)
+
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        stmt = dialect_insert(Alert).from_select(
+            ["store_id", "product_id", "alert_type", "message", "acknowledged", "created_at"],
+            values
+        ).on_conflict_do_nothing().returning(Alert.id, Alert.message, Alert.alert_type)
+        return db.execute(stmt).first()
+
+    @staticmethod
+    def apply_scans(store_id: int, scans: List, db: Session) -> Tuple[List[Dict], Dict[int, Dict], List[Dict]]:
+        """
+        Apply many scans in a single database transaction
+
+        All barcodes are resolved with one query, stock changes are summed
+        per product and applied with set-based UPDATEs, transaction rows are
+        inserted together, and low stock alerts are evaluated once per
+        affected product against its final quantity. Only products whose
+        stock would run out part way are replayed scan by scan, so the
+        right scans are rejected. The caller owns the surrounding
+        transaction and commits once.
+
+        Args:
+            store_id: Store ID for scoping
+            scans: Items with barcode, action ("sale" or "restock") and quantity
+            db: Database session
+
+        Returns:
+            Tuple of (per-item results in request order,
+                      affected product_id -> final product/stock snapshot,
+                      newly created low stock alerts)
+        """
+        # Resolve every barcode with at most one query (cache hits cost none)
+        resolved = BarcodeService.resolve_barcodes([scan.barcode for scan in scans], store_id, db)
+
+        results = []
+        affected: Dict[int, CachedProduct] = {}
+        quantities: Dict[int, int] = {}
+        pending = []  # (result, transaction)
+        planned: Dict[int, Tuple[CachedProduct, List]] = {}  # product_id -> (product, [(result, scan, change)])
+
+        for index, scan in enumerate(scans):
+            result = {"index": index, "barcode": scan.barcode, "success": False}
+            results.append(result)
+
+            product = resolved.get(scan.barcode)
+            if product is None:
+                result["message"] = f"Product with barcode '{scan.barcode}' not found in your store"
+                continue
+
+            quantity_change = -scan.quantity if scan.action == "sale" else scan.quantity
+            planned.setdefault(product.product_id, (product, []))[1].append((result, scan, quantity_change))
+
+        # Net change per product, and the stock needed so no scan goes below zero
+        changes = {}
+        for product_id, (_, items) in planned.items():
+            running = lowest = 0
+            for _, _, quantity_change in items:
+                running += quantity_change
+                lowest = min(lowest, running)
+            changes[product_id] = (running, -lowest)
+        applied = InventoryService.adjust_stock_bulk(store_id, changes, db)
+
+        def succeed(result, scan, product, quantity_change, quantity):
+            result["success"] = True
+            result["message"] = f"{'Sale' if scan.action == 'sale' else 'Restock'} successful: {product.name}"
+            result["new_quantity"] = quantity
+            pending.append((result, Transaction(
+                product_id=product.product_id,
+                store_id=store_id,
+                quantity_change=quantity_change,
+                transaction_type="out" if scan.action == "sale" else "in"
+            )))
+            quantities[product.product_id] = quantity
+            affected[product.product_id] = product
+
+        for product_id, (product, items) in planned.items():
+            if product_id in applied:
+                quantity = applied[product_id] - changes[product_id][0]
+                for result, scan, quantity_change in items:
+                    quantity += quantity_change
+                    succeed(result, scan, product, quantity_change, quantity)
+                continue
+
+            # Missing inventory or stock running out part way: one scan at a time
+            for result, scan, quantity_change in items:
+                row = InventoryService.adjust_stock(product_id, store_id, quantity_change, db)
+                if row is None:
+                    available = InventoryService.current_quantity(product_id, store_id, db)
+                    if available is None:
+                        barcode_cache.invalidate(store_id, scan.barcode)
+                        result["message"] = "Inventory record not found"
+                    else:
+                        result["message"] = f"Insufficient stock. Available: {available}, Requested: {scan.quantity}"
+                    continue
+                succeed(result, scan, product, quantity_change, row.quantity)
+
+        if not pending:
+            return results, {}, []
+
+        # Transactions in request order
+        pending.sort(key=lambda item: item[0]["index"])
+        db.add_all([transaction for _, transaction in pending])
+        db.flush()  # Assign transaction IDs
+        for result, transaction in pending:
+            result["transaction_id"] = transaction.id
+
+        # Evaluate low stock once per affected product
+        new_alerts = []
+        for product_id, product in affected.items():
+            alert = InventoryService.insert_low_stock_alert(
+                product_id, product.name, product.reorder_point, store_id, quantities[product_id], db
+            )
+            if alert:
+                new_alerts.append((alert, product))
+
+        updates = {
+            product_id: {
+                "product_id": product_id,
+                "barcode": product.barcode,
+                "name": product.name,
+                "category": product.category,
+                "quantity": quantities[product_id],
+                "reorder_point": product.reorder_point
+            }
+            for product_id, product in affected.items()
+        }
+        alerts = [
+            {
+                "alert_id": alert.id,
+                "product_id": product.product_id,
+                "product_name": product.name,
+                "category": product.category,
+                "message": alert.message,
+                "alert_type": alert.alert_type
+            }
+            for alert, product in new_alerts
+        ]
+
+        return results, updates, alerts
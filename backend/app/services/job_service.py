@@ -0,0 +1,218 @@
+import asyncio
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Coroutine, Dict, Optional
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.websocket_manager import manager
+
+# Worker threads, jobs allowed to be queued or running at once, and how long
+# finished jobs stay queryable
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "20"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_MAX_PENDING jobs are already queued or running"""
+
+
+class Job:
+    """State of one background job, as reported to clients"""
+
+    def __init__(self, store_id: int, kind: str):
+        self.id = uuid.uuid4().hex
+        self.store_id = store_id
+        self.kind = kind
+        self.status = QUEUED
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.future: Optional[Future] = None
+        self.on_cancel: Optional[Callable[[], None]] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class JobManager:
+    """
+    Runs long jobs (imports, purges) on a bounded thread pool
+
+    Each job gets its own database session. Status changes and progress are
+    published to the store's WebSocket clients as "job_progress" messages,
+    scheduled onto the event loop bound with start().
+
+    Job state lives in this process only: with several workers, a job is
+    known only to the worker that accepted it, and GET /products/jobs/{id}
+    answers 404 on the others. Clients that may be load balanced elsewhere
+    should follow the "job_progress" WebSocket messages instead of polling.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.session_factory: Callable[[], Session] = SessionLocal
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Bind the event loop progress messages are broadcast on"""
+        self._loop = loop
+
+    def shutdown(self):
+        """
+        Stop accepting jobs; running ones finish, queued ones are cancelled
+
+        Cancelled jobs never reach _run, so they are marked failed here and
+        their on_cancel cleanup (e.g. removing a spooled upload) is run.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for job in list(self._jobs.values()):
+            if job.future is not None and job.future.cancelled() and not job.done:
+                self._cancel(job)
+        self._loop = None
+
+    def submit(
+        self,
+        store_id: int,
+        kind: str,
+        fn: Callable[..., Optional[Dict[str, Any]]],
+        *args,
+        on_cancel: Optional[Callable[[], None]] = None
+    ) -> Job:
+        """
+        Queue fn(job, db, *args) to run in the background
+
+        fn may call progress() as it goes; whatever dict it returns becomes
+        the job result. The session is closed when fn returns. on_cancel runs
+        instead of fn if the job is still queued at shutdown.
+
+        Raises:
+            JobQueueFull: If too many jobs are already queued or running
+        """
+        job = Job(store_id, kind)
+        job.on_cancel = on_cancel
+        with self._lock:
+            self._prune()
+            if sum(1 for j in self._jobs.values() if not j.done) >= self.max_pending:
+                raise JobQueueFull("Too many background jobs in progress, try again later")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            self._jobs[job.id] = job
+            self._publish(job)
+            job.future = self._executor.submit(self._run, job, fn, args)
+
+        return job
+
+    def get(self, job_id: str, store_id: int) -> Optional[Job]:
+        """Return a job owned by the store, if it is still retained"""
+        job = self._jobs.get(job_id)
+        if job is None or job.store_id != store_id:
+            return None
+        return job
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Job:
+        """Block until a job has finished (used by tests and shutdown hooks)"""
+        job = self._jobs[job_id]
+        job.future.result(timeout=timeout)
+        return job
+
+    def progress(self, job: Job, **fields):
+        """Record progress counters for a running job and publish them"""
+        job.progress.update(fields)
+        self._publish(job)
+
+    def _run(self, job: Job, fn: Callable, args: tuple):
+        job.status = RUNNING
+        self._publish(job)
+
+        db = self.session_factory()
+        try:
+            job.result = fn(job, db, *args)
+            status = COMPLETED
+        except Exception as e:
+            print(f"⚠️  Job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            status = FAILED
+        finally:
+            db.close()
+
+        # finished_at first, so a job never looks done without it
+        job.finished_at = datetime.utcnow()
+        job.status = status
+        self._publish(job)
+
+    def _cancel(self, job: Job):
+        job.error = "Cancelled at shutdown"
+        job.finished_at = datetime.utcnow()
+        job.status = FAILED
+        if job.on_cancel:
+            try:
+                job.on_cancel()
+            except Exception as e:
+                print(f"⚠️  Cleanup for cancelled job {job.id} ({job.kind}) failed: {e}")
+        self._publish(job)
+
+    def call_on_loop(self, coro: Coroutine):
+        """Run a coroutine on the bound event loop, from a job thread or the loop itself"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            coro.close()
+            return
+        if self._on_loop(loop):
+            loop.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def _publish(self, job: Job):
+        if self._loop is None:
+            return
+        message = {"type": "job_progress", "data": job.to_dict()}
+        self.call_on_loop(manager.broadcast(job.store_id, message))
+
+    @staticmethod
+    def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_RETENTION_SECONDS)
+        expired = [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Global job manager instance
+job_manager = JobManager()
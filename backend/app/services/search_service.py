@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.database import Product
+
+# Stores kept indexed in memory, and how long an index is trusted before it is
+# rebuilt (picks up writes made by other worker processes)
+SEARCH_INDEX_STORES = int(os.getenv("SEARCH_INDEX_STORES", "50"))
+SEARCH_INDEX_MAX_AGE_SECONDS = int(os.getenv("SEARCH_INDEX_MAX_AGE_SECONDS", "600"))
+
+# Minimum share of a term's trigrams a name word must contain to count as a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.5
+
+# The searchable fields of a product
+SearchDoc = namedtuple("SearchDoc", ["product_id", "barcode", "name", "category"])
+
+# Unicode words, so accented and non-Latin names are searchable too
+_TOKEN = re.compile(r"\w+")
+_product_id = itemgetter(1)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Case-folded words of a text"""
+    return _TOKEN.findall(text.casefold()) if text else []
+
+
+def trigrams(term: str) -> Set[str]:
+    """Trigrams of a word, padded so short words and word starts still match"""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StoreSearchIndex:
+    """
+    Prefix + trigram index over one store's products
+
+    Prefix lookups bisect a sorted list of (term, product_id) pairs built from
+    the name, category and barcode. Distinct name words are also indexed by
+    trigram, so a misspelt query word is matched against the (much smaller)
+    vocabulary first and then expanded to products.
+    """
+
+    def __init__(self, docs: Iterable[SearchDoc] = ()):
+        self.docs: Dict[int, SearchDoc] = {}
+        # Flat copies for C-level lookups while ranking and counting facets
+        self.names: Dict[int, str] = {}
+        self.categories: Dict[int, Optional[str]] = {}
+        self.words: Dict[str, Set[int]] = {}
+        self.grams: Dict[str, Set[str]] = {}
+        terms = []
+        for doc in docs:
+            self._add_doc(doc)
+            terms.extend((term, doc.product_id) for term in self._terms(doc))
+            self._add_words(doc)
+        self.terms: List[Tuple[str, int]] = sorted(terms)
+        self.built_at = time.monotonic()
+
+    @staticmethod
+    def _terms(doc: SearchDoc) -> Set[str]:
+        return set(tokenize(doc.name)) | set(tokenize(doc.category)) | {doc.barcode.casefold()}
+
+    def _add_doc(self, doc: SearchDoc):
+        self.docs[doc.product_id] = doc
+        self.names[doc.product_id] = doc.name
+        self.categories[doc.product_id] = doc.category
+
+    def _add_words(self, doc: SearchDoc):
+        for word in set(tokenize(doc.name)):
+            postings = self.words.get(word)
+            if postings is None:
+                postings = self.words[word] = set()
+                for gram in trigrams(word):
+                    self.grams.setdefault(gram, set()).add(word)
+            postings.add(doc.product_id)
+
+    def add(self, doc: SearchDoc):
+        """Index a product, replacing any previous version of it"""
+        self.remove(doc.product_id)
+        self._add_doc(doc)
+        for term in self._terms(doc):
+            bisect.insort(self.terms, (term, doc.product_id))
+        self._add_words(doc)
+
+    def remove(self, product_id: int):
+        """Drop a product from the index"""
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        del self.names[product_id], self.categories[product_id]
+        for term in self._terms(doc):
+            i = bisect.bisect_left(self.terms, (term, product_id))
+            if i < len(self.terms) and self.terms[i] == (term, product_id):
+                del self.terms[i]
+        for word in set(tokenize(doc.name)):
+            postings = self.words.get(word)
+            if postings is None:
+                continue
+            postings.discard(product_id)
+            if not postings:
+                del self.words[word]
+                for gram in trigrams(word):
+                    vocabulary = self.grams.get(gram)
+                    if vocabulary is not None:
+                        vocabulary.discard(word)
+                        if not vocabulary:
+                            del self.grams[gram]
+
+    def _match_term(self, term: str, limit: int) -> Dict[int, float]:
+        """Score products for one query word: exact 2, prefix 1, fuzzy < 1"""
+        start = bisect.bisect_left(self.terms, (term,))
+        exact_end = bisect.bisect_left(self.terms, (term + "\0",))
+        prefix_end = bisect.bisect_left(self.terms, (term + "\uffff",), start)
+
+        scores = dict.fromkeys(map(_product_id, self.terms[exact_end:prefix_end]), 1.0)
+        scores.update(dict.fromkeys(map(_product_id, self.terms[start:exact_end]), 2.0))
+
+        # Trigram matching only when prefixes alone cannot fill the page,
+        # which keeps short, common prefixes cheap
+        if len(term) >= 3 and len(scores) < limit:
+            wanted = trigrams(term)
+            shared = Counter()
+            for gram in wanted:
+                shared.update(self.grams.get(gram, ()))
+            for word, count in shared.items():
+                similarity = count / len(wanted)
+                if similarity < FUZZY_MIN_SIMILARITY:
+                    continue
+                for product_id in self.words[word]:
+                    if product_id not in scores:
+                        scores[product_id] = similarity * 0.9
+        return scores
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        category: Optional[str] = None
+    ) -> Tuple[List[SearchDoc], int, Dict[Optional[str], int]]:
+        """
+        Find products matching every word of the query
+
+        Args:
+            query: Free text; matched against name, category and barcode
+            limit: Maximum number of products returned
+            category: Only return products in this category (facets still
+                cover every match)
+
+        Returns:
+            Tuple of (best matches, total matches, match count per category)
+        """
+        scores: Optional[Dict[int, float]] = None
+        for term in tokenize(query):
+            matched = self._match_term(term, limit)
+            if scores is None:
+                scores = matched
+            else:
+                scores = {pid: score + matched[pid] for pid, score in scores.items() if pid in matched}
+            if not scores:
+                return [], 0, {}
+        if scores is None:
+            return [], 0, {}
+
+        facets = Counter(map(self.categories.__getitem__, scores))
+        if category is not None:
+            scores = {pid: score for pid, score in scores.items() if self.categories[pid] == category}
+
+        # Best score first, ties by name; there are only a few distinct scores
+        best: List[int] = []
+        for tier in sorted(set(scores.values()), reverse=True):
+            if len(best) >= limit:
+                break
+            tied = [pid for pid, score in scores.items() if score == tier]
+            best.extend(heapq.nsmallest(limit - len(best), tied, key=self.names.__getitem__))
+        return [self.docs[pid] for pid in best], len(scores), dict(facets)
+
+
+class SearchIndex:
+    """
+    Per-process registry of StoreSearchIndex objects, LRU-evicted by store
+
+    A store is indexed on its first search. Single product writes update the
+    index in place; bulk writes drop the store so it is rebuilt on demand.
+    """
+
+    def __init__(self, max_stores: int = SEARCH_INDEX_STORES, max_age_seconds: int = SEARCH_INDEX_MAX_AGE_SECONDS):
+        self.max_stores = max_stores
+        self.max_age_seconds = max_age_seconds
+        self._stores: "OrderedDict[int, StoreSearchIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, store_id: int, db: Session) -> StoreSearchIndex:
+        with self._lock:
+            index = self._stores.get(store_id)
+            if index is not None and time.monotonic() - index.built_at < self.max_age_seconds:
+                self._stores.move_to_end(store_id)
+                return index
+
+        # Build outside the lock so one store's rebuild does not stall others
+        rows = db.query(Product.id, Product.barcode, Product.name, Product.category).filter(
+            Product.store_id == store_id
+        )
+        index = StoreSearchIndex(SearchDoc(*row) for row in rows)
+        with self._lock:
+            self._stores[store_id] = index
+            self._stores.move_to_end(store_id)
+            while len(self._stores) > self.max_stores:
+                self._stores.popitem(last=False)
+        return index
+
+    def search(self, store_id: int, query: str, limit: int, db: Session, category: Optional[str] = None):
+        """Search a store's products; see StoreSearchIndex.search"""
+        index = self._get(store_id, db)
+        with self._lock:
+            return index.search(query, limit, category)
+
+    def upsert(self, store_id: int, product_id: int, barcode: str, name: str, category: Optional[str]):
+        """Reflect a created or updated product in an already built index"""
+        with self._lock:
+            index = self._stores.get(store_id)
+            if index is not None:
+                index.add(SearchDoc(product_id, barcode, name, category))
+
+    def remove(self, store_id: int, product_id: int):
+        """Drop a deleted product from an already built index"""
+        with self._lock:
+            index = self._stores.get(store_id)
+            if index is not None:
+                index.remove(product_id)
+
+    def invalidate_store(self, store_id: int):
+        """Forget a store's index after bulk changes"""
+        with self._lock:
+            self._stores.pop(store_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._stores.clear()
+
+
+# Global search index instance
+search_index = SearchIndex()
@@ -1,62 +1,742 @@
 from fastapi import WebSocket
-from typing import Dict, List
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple, Union
+import asyncio
 import json
+import os
+import time
+
+try:
+    import msgpack
+except ImportError:  # Only needed by clients that ask for the binary protocol
+    msgpack = None
+
+from app.broker import Broker, InProcessBroker, create_broker
+
+# Per-connection send buffering: frames queued per client, how long one send
+# may take, and what happens to a client whose queue is full:
+#   disconnect  - close it (it reconnects and reloads)
+#   drop_oldest - discard its oldest queued frame
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "disconnect")
+
+# Inventory updates for a store are gathered for this long and sent as one
+# inventory_batch holding the latest state per product (0 sends them as is)
+WS_COALESCE_WINDOW_MS = int(os.getenv("WS_COALESCE_WINDOW_MS", "50"))
+COALESCED_TYPES = ("inventory_update", "inventory_batch")
+
+# Broadcast frames kept per store so reconnecting clients can replay what
+# they missed (?last_seq=N) instead of reloading everything, capped by count
+# and by encoded size. A store's log outlives its last client in this
+# process by WS_REPLAY_RETENTION_SECONDS of quiet; while all logs together
+# exceed WS_REPLAY_TOTAL_BYTES, those of stores without clients here are
+# dropped, least recently active first.
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1000"))
+WS_REPLAY_BUFFER_BYTES = int(os.getenv("WS_REPLAY_BUFFER_BYTES", str(1024 * 1024)))
+WS_REPLAY_TOTAL_BYTES = int(os.getenv("WS_REPLAY_TOTAL_BYTES", str(64 * 1024 * 1024)))
+WS_REPLAY_RETENTION_SECONDS = float(os.getenv("WS_REPLAY_RETENTION_SECONDS", "300"))
+
+# Wire formats, picked per connection through the WebSocket subprotocol
+# (Sec-WebSocket-Protocol); clients asking for none get JSON text frames
+JSON = "json"
+MSGPACK = "msgpack"
+SUBPROTOCOLS = {"syncvault.json": JSON, "syncvault.msgpack.v1": MSGPACK}
+
+# MessagePack frames use these short keys (v1 of the binary protocol; add
+# codes only at the end and never reuse one). Other keys are sent as is.
+FIELD_CODES = {
+    "type": "t", "data": "d", "seq": "s", "updates": "u", "alerts": "al",
+    "product_id": "p", "barcode": "b", "name": "n", "category": "c",
+    "quantity": "q", "status": "st", "action": "a", "timestamp": "ts",
+    "alert_id": "ai", "product_name": "pn", "message": "m", "alert_type": "at",
+}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+
+# Server heartbeat: a "ping" is sent to every client this often, and clients
+# that have sent nothing (not even a "pong") for WS_IDLE_TIMEOUT_SECONDS are
+# closed. Connections per store and process are capped.
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "25"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "75"))
+WS_MAX_CONNECTIONS_PER_STORE = int(os.getenv("WS_MAX_CONNECTIONS_PER_STORE", "200"))
+
+# Close code sent to clients that cannot keep up, and to connections
+# refused because the store is full (1013: try again later)
+SLOW_CLIENT_CLOSE_CODE = 1013
+# Close code sent to clients reaped by the heartbeat
+IDLE_CLOSE_CODE = 4008
+# Close code sent to clients of a deleted store (as refused at the handshake)
+STORE_DELETED_CLOSE_CODE = 4004
+
+# Control message that makes every worker close a store's clients
+STORE_DELETED = "store_deleted"
+
+
+class ClientConnection:
+    """A connected socket with its own bounded send queue and sender task"""
+
+    def __init__(self, websocket: WebSocket, store_id: int, queue_size: int, protocol: str = JSON):
+        self.websocket = websocket
+        self.store_id = store_id
+        self.protocol = protocol
+        self.queue: "asyncio.Queue[Optional[Union[str, bytes]]]" = asyncio.Queue(maxsize=queue_size)
+        # Replayed frames, sent before the queue; not bounded by queue_size
+        self.backlog: Deque[Union[str, bytes]] = deque()
+        self.sender: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.last_seen = asyncio.get_running_loop().time()
+        # Topics this client is indexed under (see WebSocketManager.subscribe)
+        self.topics: List[Tuple[str, Hashable]] = [EVERYTHING]
+
+
+# Topic of clients without filters; they get every frame unchanged
+EVERYTHING = ("all", None)
+
+# Which parts of an inventory_batch each event type subscription covers
+BATCH_UPDATE_TYPES = ("inventory_batch", "inventory_update")
+BATCH_ALERT_TYPES = ("inventory_batch", "alert_created")
+
+
+def negotiate_subprotocol(requested: Sequence[str]) -> Optional[str]:
+    """First subprotocol the client offered that this server speaks, if any"""
+    for name in requested:
+        if name in SUBPROTOCOLS and (SUBPROTOCOLS[name] != MSGPACK or msgpack is not None):
+            return name
+    return None
+
+
+def shorten_fields(value: Any) -> Any:
+    """Replace known keys with their FIELD_CODES, recursively"""
+    if isinstance(value, dict):
+        return {FIELD_CODES.get(key, key): shorten_fields(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shorten_fields(item) for item in value]
+    return value
+
+
+def expand_fields(value: Any) -> Any:
+    """Undo shorten_fields, recursively; keys that are not codes are kept"""
+    if isinstance(value, dict):
+        return {FIELD_NAMES.get(key, key): expand_fields(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand_fields(item) for item in value]
+    return value
+
+
+def decode_message(data: Union[str, bytes]) -> Any:
+    """Parse a client frame: JSON text, or MessagePack binary (short or long keys); None if malformed"""
+    try:
+        if isinstance(data, bytes):
+            if msgpack is None:
+                return None
+            return expand_fields(msgpack.unpackb(data, raw=False))
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def encode_message(message: dict, protocol: str) -> Union[str, bytes]:
+    """Encode a message as a text (JSON) or binary (MessagePack) frame"""
+    if protocol == MSGPACK:
+        return msgpack.packb(shorten_fields(message), use_bin_type=True)
+    return json.dumps(message)
+
+
+class Frame:
+    """An outgoing message, encoded at most once per protocol"""
+
+    __slots__ = ("message", "_encoded")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    def encode(self, protocol: str) -> Union[str, bytes]:
+        data = self._encoded.get(protocol)
+        if data is None:
+            data = self._encoded[protocol] = encode_message(self.message, protocol)
+        return data
+
+
+class EventLog:
+    """A store's most recent frames by sequence number, bounded by count and encoded size"""
+
+    def __init__(self, max_frames: int, max_bytes: int):
+        # Highest number seen, even once that frame has been trimmed
+        self.seq = 0
+        self.frames: Deque[Tuple[int, Frame, int]] = deque()
+        self.bytes = 0
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.active_at = time.monotonic()
+
+    def append(self, seq: int, frame: Frame) -> int:
+        """Log a frame, trimming the oldest ones; returns the change in bytes held"""
+        before = self.bytes
+        size = len(frame.encode(JSON))
+        self.frames.append((seq, frame, size))
+        self.bytes += size
+        self.seq = max(self.seq, seq)
+        self.active_at = time.monotonic()
+        while self.frames and (len(self.frames) > self.max_frames or self.bytes > self.max_bytes):
+            self.bytes -= self.frames.popleft()[2]
+        return self.bytes - before
+
+    def since(self, last_seq: int) -> Optional[List[Frame]]:
+        """Frames numbered after last_seq in order, or None if any of them is not held"""
+        # Frames from other workers may have arrived out of order
+        missed = sorted((entry for entry in self.frames if entry[0] > last_seq), key=lambda entry: entry[0])
+        if len(missed) != self.seq - last_seq:
+            return None
+        return [frame for _, frame, _ in missed]
 
 
 class WebSocketManager:
-    """Manages WebSocket connections for real-time updates"""
-    
-    def __init__(self):
+    """
+    Manages WebSocket connections for real-time updates
+
+    Connections are per process. Broadcasts go to local clients and through
+    the broker to the other worker processes, which deliver them to theirs.
+    Delivering only enqueues: each client has a sender task draining its own
+    bounded queue, so a slow client never holds up the others or the
+    request that triggered the broadcast. Inventory updates are coalesced
+    per store before they are sent. A heartbeat pings clients and reaps the
+    idle ones, and each store has a connection cap.
+
+    Clients may subscribe to event types, categories or product IDs. They
+    are indexed by topic, so an event only costs work for the clients that
+    want it; unfiltered clients share one frame. Filtered clients get the
+    parts of an inventory_batch they asked for. Frames are encoded lazily,
+    once per wire format (JSON or MessagePack) in use.
+
+    Broadcasting only queues the message for the store's publisher task, so
+    a request never waits on the broker. The task numbers, delivers and
+    publishes the store's messages in submission order; stores do not wait
+    on each other.
+
+    Every broadcast is stamped once, by the process it starts in, with the
+    next number of the store's sequence from the broker, which every worker
+    shares. Each worker keeps the recent frames of a store in a bounded log,
+    so a client can reconnect to any worker that saw them and replay what it
+    missed; clients also get the broker's `epoch` and are told to resync
+    when the numbering restarted or the frames are gone.
+    """
+
+    def __init__(
+        self,
+        broker: Optional[Broker] = None,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+        send_timeout: float = WS_SEND_TIMEOUT_SECONDS,
+        slow_client_policy: str = WS_SLOW_CLIENT_POLICY,
+        coalesce_window_ms: int = WS_COALESCE_WINDOW_MS,
+        replay_buffer_size: int = WS_REPLAY_BUFFER_SIZE,
+        replay_buffer_bytes: int = WS_REPLAY_BUFFER_BYTES,
+        replay_total_bytes: int = WS_REPLAY_TOTAL_BYTES,
+        replay_retention: float = WS_REPLAY_RETENTION_SECONDS,
+        heartbeat_interval: float = WS_HEARTBEAT_SECONDS,
+        idle_timeout: float = WS_IDLE_TIMEOUT_SECONDS,
+        max_connections_per_store: int = WS_MAX_CONNECTIONS_PER_STORE
+    ):
         # Store connections per store_id
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, store_id: int):
-        """Accept WebSocket connection and add to store's connection pool"""
-        await websocket.accept()
-        
-        if store_id not in self.active_connections:
-            self.active_connections[store_id] = []
-        
-        self.active_connections[store_id].append(websocket)
-        print(f"✅ WebSocket connected for store {store_id}. Total connections: {len(self.active_connections[store_id])}")
-    
-    def disconnect(self, websocket: WebSocket, store_id: int):
-        """Remove WebSocket connection from store's pool"""
-        if store_id in self.active_connections:
-            if websocket in self.active_connections[store_id]:
-                self.active_connections[store_id].remove(websocket)
-                print(f"❌ WebSocket disconnected for store {store_id}. Remaining: {len(self.active_connections[store_id])}")
-            
-            # Clean up empty lists
-            if not self.active_connections[store_id]:
+        self.active_connections: Dict[int, Dict[WebSocket, ClientConnection]] = {}
+        self.broker = broker or InProcessBroker()
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_client_policy = slow_client_policy
+        self.coalesce_window = coalesce_window_ms / 1000
+        # store_id -> {"updates": {product_id: update}, "alerts": [...]} awaiting flush
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        # store_id -> timer that flushes its pending batch when the window ends
+        self._flush_timers: Dict[int, asyncio.TimerHandle] = {}
+        self.replay_buffer_size = replay_buffer_size
+        self.replay_buffer_bytes = replay_buffer_bytes
+        self.replay_total_bytes = replay_total_bytes
+        self.replay_retention = replay_retention
+        # Least recently active first, for eviction
+        self._logs: "OrderedDict[int, EventLog]" = OrderedDict()
+        self._log_bytes = 0
+        # store_id -> messages awaiting its publisher task, which runs while there are any
+        self._outbox: Dict[int, Deque[dict]] = {}
+        self._publishers: Dict[int, asyncio.Task] = {}
+        # store_id -> topic -> clients subscribed to it
+        self._topics: Dict[int, Dict[Tuple[str, Hashable], Set[ClientConnection]]] = {}
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.max_connections_per_store = max_connections_per_store
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    @property
+    def epoch(self) -> str:
+        """Names the numbering of broadcast sequences (shared by all workers of one broker)"""
+        return self.broker.epoch
+
+    async def start(self):
+        """Start receiving broadcasts from other worker processes, and the heartbeat"""
+        await self.broker.start(self.deliver)
+        if self.heartbeat_interval > 0:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        print(f"📡 WebSocket broadcast backend: {type(self.broker).__name__}")
+
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        for store_id in list(self._pending):
+            self._flush(store_id)
+        await self.join()
+        await self.broker.stop()
+
+    async def join(self):
+        """Wait until every message submitted so far is delivered here and published"""
+        while self._publishers:
+            await asyncio.wait(list(self._publishers.values()))
+
+    async def connect(self, websocket: WebSocket, store_id: int, subprotocol: Optional[str] = None) -> bool:
+        """
+        Accept WebSocket connection and add to store's connection pool
+
+        Args:
+            subprotocol: Result of negotiate_subprotocol(); sets the wire
+                format of every frame sent to this client
+
+        Returns:
+            False if the store already has max_connections_per_store clients
+            (the socket is closed with code 1013)
+        """
+        connections = self.active_connections.setdefault(store_id, {})
+        if len(connections) >= self.max_connections_per_store:
+            if not connections:
                 del self.active_connections[store_id]
-    
-    async def broadcast(self, store_id: int, message: dict):
-        """Send message to all connected clients for a specific store"""
-        if store_id not in self.active_connections:
-            return
-        
-        disconnected = []
-        message_json = json.dumps(message)
-        
-        for connection in self.active_connections[store_id]:
+            print(f"⚠️  Refusing WebSocket for store {store_id}: {len(connections)} connections already")
+            await self._close(websocket, SLOW_CLIENT_CLOSE_CODE, "Too many connections for this store")
+            return False
+
+        # Take the slot before awaiting the handshake, so concurrent
+        # connects cannot overshoot the cap. Broadcasts only reach the client
+        # once it is indexed after the handshake: frames sent meanwhile are
+        # just logged, so replay() hands each of them over exactly once.
+        protocol = SUBPROTOCOLS.get(subprotocol, JSON)
+        client = ClientConnection(websocket, store_id, self.queue_size, protocol)
+        connections[websocket] = client
+        try:
+            if subprotocol is None:
+                await websocket.accept()
+            else:
+                await websocket.accept(subprotocol=subprotocol)
+        except Exception:
+            self.disconnect(websocket, store_id)
+            raise
+
+        self._index(client)
+        client.sender = asyncio.create_task(self._drain(client))
+        print(f"✅ WebSocket connected for store {store_id}. Total connections: {len(connections)}")
+        return True
+
+    def touch(self, websocket: WebSocket, store_id: int):
+        """Record that a client sent something, which keeps it from being reaped"""
+        client = self.active_connections.get(store_id, {}).get(websocket)
+        if client is not None:
+            client.last_seen = asyncio.get_running_loop().time()
+
+    async def _heartbeat_loop(self):
+        """Ping every client and close the ones that stopped answering"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
             try:
-                await connection.send_text(message_json)
+                self._prune_logs()
+                ping = Frame({"type": "ping"})
+                now = loop.time()
+                for store_id, connections in list(self.active_connections.items()):
+                    for websocket, client in list(connections.items()):
+                        if now - client.last_seen > self.idle_timeout:
+                            print(f"⚠️  Closing idle WebSocket client in store {store_id}")
+                            self.disconnect(websocket, store_id)
+                            asyncio.create_task(self._close(websocket, IDLE_CLOSE_CODE, "Idle timeout"))
+                        else:
+                            self._enqueue(client, ping.encode(client.protocol))
             except Exception as e:
-                print(f"⚠️  Error broadcasting to client: {e}")
-                disconnected.append(connection)
-        
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection, store_id)
-    
+                print(f"⚠️  WebSocket heartbeat failed: {e}")
+
+    def disconnect(self, websocket: WebSocket, store_id: int):
+        """Remove WebSocket connection from store's pool"""
+        connections = self.active_connections.get(store_id)
+        if connections is None:
+            return
+
+        client = connections.pop(websocket, None)
+        if client is not None:
+            self._unindex(client)
+            if client.sender and client.sender is not asyncio.current_task():
+                client.sender.cancel()
+            print(f"❌ WebSocket disconnected for store {store_id}. Remaining: {len(connections)}")
+
+        # Clean up empty pools; the replay log is kept for a while from now
+        if not connections:
+            del self.active_connections[store_id]
+            log = self._logs.get(store_id)
+            if log is not None:
+                log.active_at = time.monotonic()
+
+    def subscribe(
+        self,
+        websocket: WebSocket,
+        store_id: int,
+        types: Optional[Iterable[str]] = None,
+        categories: Optional[Iterable[str]] = None,
+        product_ids: Optional[Iterable[int]] = None
+    ) -> bool:
+        """
+        Replace a client's filters; None means no filter on that field
+
+        Product-less events (jobs, resync) are only filtered by type. Events
+        about a product pass if it is in product_ids or in one of the
+        categories.
+
+        Returns:
+            False if the client is not connected
+        """
+        client = self.active_connections.get(store_id, {}).get(websocket)
+        if client is None:
+            return False
+
+        topics: List[Tuple[str, Hashable]] = []
+        if types is None and categories is None and product_ids is None:
+            topics.append(EVERYTHING)
+        else:
+            if types is None:
+                topics.append(("type", None))
+            else:
+                topics.extend(("type", t) for t in types)
+            if categories is None and product_ids is None:
+                topics.append(("product", None))
+            else:
+                topics.extend(("category", c) for c in categories or ())
+                topics.extend(("product", pid) for pid in product_ids or ())
+
+        self._unindex(client)
+        client.topics = topics
+        self._index(client)
+        return True
+
+    def _index(self, client: ClientConnection):
+        topics = self._topics.setdefault(client.store_id, {})
+        for topic in client.topics:
+            topics.setdefault(topic, set()).add(client)
+
+    def _unindex(self, client: ClientConnection):
+        topics = self._topics.get(client.store_id)
+        if topics is None:
+            return
+        for topic in client.topics:
+            subscribers = topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(client)
+                if not subscribers:
+                    del topics[topic]
+        if not topics:
+            del self._topics[client.store_id]
+
+    @staticmethod
+    def _subscribers(topics: dict, *keys: Tuple[str, Hashable]) -> Set[ClientConnection]:
+        found: Set[ClientConnection] = set()
+        for key in keys:
+            found.update(topics.get(key, ()))
+        return found
+
+    def _interested(self, topics: dict, types: Set[ClientConnection], item: Any) -> Set[ClientConnection]:
+        """Filtered clients that want an event of an already matched type about item"""
+        if not types or not isinstance(item, dict) or "product_id" not in item:
+            return types
+        products = self._subscribers(
+            topics, ("product", None), ("product", item["product_id"]), ("category", item.get("category"))
+        )
+        return types & products if len(types) < len(products) else products & types
+
+    async def broadcast(self, store_id: int, message: dict):
+        """Send message to every client of a store, in all worker processes (queued; never waits on the broker)"""
+        if self.coalesce_window > 0 and message.get("type") in COALESCED_TYPES:
+            self._coalesce(store_id, message)
+            return
+        # An event about a product (e.g. its alert) must not overtake the
+        # stock change that caused it, which may still be waiting to coalesce
+        data = message.get("data")
+        if store_id in self._pending and isinstance(data, dict) and "product_id" in data:
+            self._flush(store_id)
+        self._submit(store_id, message)
+
+    async def drop_store(self, store_id: int):
+        """Close a deleted store's clients in all worker processes"""
+        self._submit(store_id, {"type": STORE_DELETED})
+
+    async def _close_store(self, store_id: int):
+        """Close this process's clients of a store and forget its pending and replay state"""
+        self._pending.pop(store_id, None)
+        self._cancel_flush_timer(store_id)
+        self._drop_log(store_id)
+        websockets = list(self.active_connections.get(store_id, {}))
+        for websocket in websockets:
+            self.disconnect(websocket, store_id)
+        await asyncio.gather(*(
+            self._close(websocket, STORE_DELETED_CLOSE_CODE, "Store deleted") for websocket in websockets
+        ))
+
+    def _submit(self, store_id: int, message: dict):
+        """Queue a message for the store's publisher task, starting it if idle"""
+        outbox = self._outbox.get(store_id)
+        if outbox is not None:
+            outbox.append(message)
+            return
+        self._outbox[store_id] = deque([message])
+        self._publishers[store_id] = asyncio.get_running_loop().create_task(self._publish_store(store_id))
+
+    async def _publish_store(self, store_id: int):
+        """Publisher task of a store: publishes its queued messages in order, then exits"""
+        outbox = self._outbox[store_id]
+        try:
+            while outbox:
+                try:
+                    await self._publish(store_id, outbox.popleft())
+                except Exception as e:
+                    print(f"⚠️  Broadcast to store {store_id} failed: {e}")
+        finally:
+            del self._outbox[store_id]
+            del self._publishers[store_id]
+
+    async def _publish(self, store_id: int, message: dict):
+        """Number a message, deliver it to this process's clients and publish it to the other workers"""
+        if message.get("type") != STORE_DELETED:
+            seq = await self.broker.next_seq(store_id)
+            if seq is not None:
+                message = {**message, "seq": seq}
+        await self.deliver(store_id, message)
+        await self.broker.publish(store_id, message)
+
+    def _coalesce(self, store_id: int, message: dict):
+        """Merge an inventory message into the store's pending batch"""
+        data = message["data"]
+        updates = data["updates"] if message["type"] == "inventory_batch" else [data]
+
+        pending = self._pending.get(store_id)
+        if pending is None:
+            pending = self._pending[store_id] = {"updates": {}, "alerts": []}
+            self._flush_timers[store_id] = asyncio.get_running_loop().call_later(
+                self.coalesce_window, self._flush, store_id
+            )
+
+        for update in updates:
+            # Later fields win; fields only an earlier message had are kept
+            pending["updates"].setdefault(update["product_id"], {}).update(update)
+        pending["alerts"].extend(data.get("alerts", []))
+
+    def _cancel_flush_timer(self, store_id: int):
+        timer = self._flush_timers.pop(store_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _flush(self, store_id: int):
+        """Queue a store's pending batch for publishing (failures are logged by its publisher task)"""
+        self._cancel_flush_timer(store_id)
+        pending = self._pending.pop(store_id, None)
+        if not pending:
+            return
+        self._submit(store_id, {
+            "type": "inventory_batch",
+            "data": {
+                "updates": list(pending["updates"].values()),
+                "alerts": pending["alerts"]
+            }
+        })
+
+    async def deliver(self, store_id: int, message: dict):
+        """Log and queue an already numbered message for this process's clients of a store (never blocks on sends)"""
+        if message.get("type") == STORE_DELETED:
+            await self._close_store(store_id)
+            return
+
+        # Encoded once per protocol, however many clients receive it (or replay it later)
+        frame = Frame(message)
+        seq = message.get("seq")
+        if seq is not None:
+            self._log(store_id, seq, frame)
+
+        topics = self._topics.get(store_id)
+        if not topics:
+            return
+        for client in list(topics.get(EVERYTHING, ())):
+            self._enqueue(client, frame.encode(client.protocol))
+
+        if topics.keys() == {EVERYTHING}:
+            return  # Nobody has filters
+        if message.get("type") == "inventory_batch":
+            self._deliver_batch(topics, message, frame)
+            return
+        types = self._subscribers(topics, ("type", None), ("type", message.get("type")))
+        for client in self._interested(topics, types, message.get("data")):
+            self._enqueue(client, frame.encode(client.protocol))
+
+    def _deliver_batch(self, topics: dict, message: dict, full_frame: Frame):
+        """Send each filtered client the updates and alerts it subscribed to"""
+        data = message["data"]
+        wanted: Dict[ClientConnection, Tuple[List[int], List[int]]] = {}
+        for part, part_types in ((0, BATCH_UPDATE_TYPES), (1, BATCH_ALERT_TYPES)):
+            types = self._subscribers(topics, ("type", None), *(("type", t) for t in part_types))
+            for i, item in enumerate(data.get(("updates", "alerts")[part], ())):
+                for client in self._interested(topics, types, item):
+                    wanted.setdefault(client, ([], []))[part].append(i)
+
+        # Clients with the same selection share one frame
+        everything = (tuple(range(len(data.get("updates", ())))), tuple(range(len(data.get("alerts", ())))))
+        frames: Dict[Tuple[Tuple[int, ...], Tuple[int, ...]], Frame] = {everything: full_frame}
+        for client, (updates, alerts) in wanted.items():
+            key = (tuple(updates), tuple(alerts))
+            frame = frames.get(key)
+            if frame is None:
+                frame = frames[key] = Frame({**message, "data": {
+                    **data,
+                    "updates": [data["updates"][i] for i in updates],
+                    "alerts": [data["alerts"][i] for i in alerts]
+                }})
+            self._enqueue(client, frame.encode(client.protocol))
+
+    def _log(self, store_id: int, seq: int, frame: Frame):
+        log = self._logs.get(store_id)
+        if log is None:
+            log = self._logs[store_id] = EventLog(self.replay_buffer_size, self.replay_buffer_bytes)
+        else:
+            self._logs.move_to_end(store_id)
+        self._log_bytes += log.append(seq, frame)
+
+        if self._log_bytes > self.replay_total_bytes:
+            for other in [s for s in self._logs if s != store_id and s not in self.active_connections]:
+                self._drop_log(other)
+                if self._log_bytes <= self.replay_total_bytes:
+                    break
+
+    def _drop_log(self, store_id: int):
+        log = self._logs.pop(store_id, None)
+        if log is not None:
+            self._log_bytes -= log.bytes
+
+    def _prune_logs(self):
+        """Drop the logs of stores that have had no clients here and no frames for replay_retention"""
+        cutoff = time.monotonic() - self.replay_retention
+        for store_id in [s for s, log in self._logs.items() if log.active_at < cutoff and s not in self.active_connections]:
+            self._drop_log(store_id)
+
+    def last_seq(self, store_id: int) -> int:
+        """Sequence number of the latest frame delivered to a store (0 if none)"""
+        log = self._logs.get(store_id)
+        return log.seq if log else 0
+
+    def replay(self, websocket: WebSocket, store_id: int, last_seq: int, epoch: Optional[str] = None) -> bool:
+        """
+        Queue the frames a reconnecting client missed since last_seq
+
+        Must run right after connect() with no await in between, so no live
+        frame can be queued ahead of the replayed ones. Replayed frames are
+        not limited by the send queue: the whole log can be replayed.
+
+        Args:
+            websocket: The client, already connected
+            store_id: Store the client belongs to
+            last_seq: Last sequence number the client received
+            epoch: Epoch the client's sequence numbers came from
+
+        Returns:
+            True if the client is caught up, False if it was sent a "resync"
+            message and has to reload its state instead
+        """
+        client = self.active_connections.get(store_id, {}).get(websocket)
+        if client is None:
+            return False
+
+        log = self._logs.get(store_id) or EventLog(0, 0)
+        missed: Optional[List[Frame]] = None
+        reason = None
+        if epoch is not None and epoch != self.epoch:
+            reason = "epoch_changed"
+        elif last_seq > log.seq:
+            reason = "unknown_seq"
+        else:
+            missed = log.since(last_seq)
+            if missed is None:
+                reason = "gap_too_large"
+
+        if reason is not None:
+            self._enqueue(client, encode_message({
+                "type": "resync",
+                "data": {"reason": reason, "seq": log.seq, "epoch": self.epoch}
+            }, client.protocol))
+            return False
+
+        if missed:
+            # Whatever is queued already (the welcome message) still goes
+            # first; frames broadcast from now on queue behind the replay
+            while not client.queue.empty():
+                queued = client.queue.get_nowait()
+                if queued is not None:
+                    client.backlog.append(queued)
+            client.backlog.extend(frame.encode(client.protocol) for frame in missed)
+            # Wakes the sender if it is already waiting on the empty queue
+            client.queue.put_nowait(None)
+        return True
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Send message to a specific client"""
+        """Send message to a specific client, behind anything already queued for it"""
+        for connections in self.active_connections.values():
+            client = connections.get(websocket)
+            if client is not None:
+                self._enqueue(client, encode_message(message, client.protocol))
+                return
         try:
             await websocket.send_json(message)
         except Exception as e:
             print(f"⚠️  Error sending personal message: {e}")
 
+    def _enqueue(self, client: ClientConnection, data: Union[str, bytes]):
+        try:
+            client.queue.put_nowait(data)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.slow_client_policy == "drop_oldest":
+            client.queue.get_nowait()
+            client.queue.put_nowait(data)
+            client.dropped += 1
+            if client.dropped == 1 or client.dropped % 100 == 0:
+                print(f"⚠️  Slow WebSocket client in store {client.store_id}: {client.dropped} frames dropped")
+        else:
+            print(f"⚠️  Disconnecting slow WebSocket client in store {client.store_id}")
+            self.disconnect(client.websocket, client.store_id)
+            asyncio.create_task(self._close(client.websocket, SLOW_CLIENT_CLOSE_CODE, "Client too slow"))
+
+    async def _drain(self, client: ClientConnection):
+        """Sender task: one in-flight send per client, each bounded by the send timeout"""
+        try:
+            while True:
+                data = client.backlog.popleft() if client.backlog else await client.queue.get()
+                if data is None:
+                    continue
+                send = client.websocket.send_bytes(data) if isinstance(data, bytes) else client.websocket.send_text(data)
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print(f"⚠️  WebSocket send timed out for store {client.store_id}")
+            self.disconnect(client.websocket, client.store_id)
+            await self._close(client.websocket, SLOW_CLIENT_CLOSE_CODE, "Send timed out")
+        except Exception as e:
+            print(f"⚠️  Error broadcasting to client: {e}")
+            self.disconnect(client.websocket, client.store_id)
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int, reason: str):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
 
 # Global WebSocket manager instance
-manager = WebSocketManager()
+manager = WebSocketManager(create_broker())
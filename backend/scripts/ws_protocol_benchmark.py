@@ -0,0 +1,87 @@
+"""
+Compare WebSocket wire formats: bytes per message and encode cost
+
+Run from backend/:  python scripts/ws_protocol_benchmark.py [iterations]
+
+Deflate sizes emulate permessage-deflate as negotiated by default (raw
+deflate, context kept between messages of one connection), measured over
+a stream of messages so later ones benefit from the shared window.
+"""
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.websocket_manager import JSON, MSGPACK, encode_message, msgpack  # noqa: E402
+
+CATEGORIES = ["Dairy", "Bakery", "Grains", "Snacks", "Beverages"]
+
+
+def inventory_update(i: int) -> dict:
+    return {
+        "type": "inventory_update",
+        "data": {
+            "product_id": 1000 + i,
+            "barcode": f"8901{i:09d}",
+            "name": f"Product {i} 500g",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "quantity": 40 - i % 40,
+            "status": "healthy" if i % 3 else "low",
+            "action": "sale",
+            "timestamp": datetime(2024, 1, 1, 12, 0, i % 60).isoformat()
+        },
+        "seq": i
+    }
+
+
+def inventory_batch(i: int, size: int = 50) -> dict:
+    updates = [inventory_update(i * size + j)["data"] for j in range(size)]
+    for update in updates:
+        del update["action"]
+    return {"type": "inventory_batch", "data": {"updates": updates, "alerts": []}, "seq": i}
+
+
+def deflated_sizes(frames) -> int:
+    """Total compressed bytes for a stream of frames on one connection"""
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    total = 0
+    for frame in frames:
+        data = frame.encode() if isinstance(frame, str) else frame
+        # permessage-deflate strips the trailing empty block of a sync flush
+        total += len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+    return total
+
+
+def benchmark(name: str, make_message, iterations: int):
+    messages = [make_message(i) for i in range(iterations)]
+    print(f"\n📦 {name} ({iterations} messages)")
+    print(f"   {'format':<10}{'bytes/msg':>12}{'+deflate':>12}{'encode µs':>12}")
+
+    for protocol in (JSON, MSGPACK):
+        if protocol == MSGPACK and msgpack is None:
+            print(f"   {protocol:<10}  (msgpack not installed)")
+            continue
+        started = time.perf_counter()
+        frames = [encode_message(message, protocol) for message in messages]
+        elapsed = time.perf_counter() - started
+
+        raw = sum(len(frame.encode() if isinstance(frame, str) else frame) for frame in frames)
+        print(
+            f"   {protocol:<10}{raw / iterations:>12.1f}{deflated_sizes(frames) / iterations:>12.1f}"
+            f"{elapsed / iterations * 1e6:>12.1f}"
+        )
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("🚀 WebSocket protocol benchmark")
+    benchmark("inventory_update", inventory_update, iterations)
+    benchmark("inventory_batch (50 updates)", inventory_batch, max(iterations // 20, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from app import main as app_main
 from app.main import app
 from app.database import Base, get_db
+from app.services.barcode_service import barcode_cache
+from app.services.idempotency_service import idempotency_cache
+from app.pagination import count_cache
+from app.services.search_service import search_index
 
 # Use in-memory SQLite for tests with StaticPool to share connection
 # This avoids "no such table" errors when using in-memory DB with multiple sessions
@@ -38,8 +43,21 @@ def db_session(setup_database):
     transaction.rollback()
     connection.close()
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # In-process caches outlive the rolled-back test transaction
+    barcode_cache.clear()
+    idempotency_cache.clear()
+    count_cache.clear()
+    search_index.clear()
+    yield
+    barcode_cache.clear()
+    idempotency_cache.clear()
+    count_cache.clear()
+    search_index.clear()
+
 @pytest.fixture(scope="function")
-def client(db_session):
+def client(db_session, monkeypatch):
     # Override get_db dependency to use the test session
     def override_get_db():
         try:
@@ -48,10 +66,19 @@ def client(db_session):
             pass
             
     app.dependency_overrides[get_db] = override_get_db
+    # The WebSocket handshake opens its own short-lived sessions
+    monkeypatch.setattr(app_main, "websocket_session_factory", lambda: TestingSessionLocal(bind=db_session.connection()))
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
 
+@pytest.fixture(scope="function")
+def background_jobs(db_session, monkeypatch):
+    # Background jobs open their own sessions; join them to the test transaction
+    from app.services.job_service import job_manager
+    monkeypatch.setattr(job_manager, "session_factory", lambda: TestingSessionLocal(bind=db_session.connection()))
+    return job_manager
+
 @pytest.fixture(scope="function")
 def auth_token(client):
     # Helper to get auth token
@@ -67,3 +94,18 @@ def auth_token(client):
     if response.status_code == 200:
         return response.json()["access_token"]
     return None
+
+@pytest.fixture(scope="function")
+def query_counter():
+    # Counts SQL statements sent to the test database
+    class Counter:
+        count = 0
+
+    counter = Counter()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.count += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield counter
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -1,6 +1,8 @@
 import pytest
 from app.database import Store
 from app.routers.auth import get_password_hash
+from app.pagination import count_cache
+from app.services.idempotency_service import idempotency_cache
 
 def test_signup(client):
     response = client.post("/auth/signup", json={
@@ -75,3 +77,35 @@ def test_change_password(client, auth_token):
         "password": "NewPassword123"
     })
     assert new_login.status_code == 200
+
+
+def test_delete_store_purges_everything_in_background(client, auth_token, db_session, background_jobs):
+    from app.database import Product, Inventory, Transaction
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for i in range(3):
+        client.post("/products/", json={"barcode": f"7700{i:06d}", "name": f"P{i}", "price": 1, "initial_quantity": 5}, headers=headers)
+        client.post("/inventory/scan", json={"barcode": f"7700{i:06d}", "action": "sale"}, headers=headers)
+
+    response = client.request("DELETE", "/auth/me", json={"password": "WrongPassword"}, headers=headers)
+    assert response.status_code == 400
+
+    store_id = client.get("/auth/me", headers=headers).json()["id"]
+    client.get("/inventory/", params={"limit": 1, "include_total": True}, headers=headers)
+    client.post("/inventory/scan", json={"barcode": "7700000000", "action": "restock"},
+                headers={**headers, "Idempotency-Key": "before-purge"})
+    assert idempotency_cache.get(store_id, "before-purge") is not None
+
+    response = client.request("DELETE", "/auth/me", json={"password": "Password123"}, headers=headers)
+    assert response.status_code == 202
+    job = background_jobs.wait(response.json()["id"], timeout=30)
+    assert job.status == "completed"
+    # 3 each of products, inventory rows, transactions and low-stock alerts,
+    # plus the idempotent restock and its recorded response
+    assert job.result["rows_deleted"] == 14
+    assert idempotency_cache.get(store_id, "before-purge") is None
+    assert not [key for key in count_cache._counts if key[1] == store_id]
+
+    db_session.expire_all()
+    for model in (Store, Product, Inventory, Transaction):
+        assert db_session.query(model).count() == 0
+    assert client.get("/auth/me", headers=headers).status_code == 404
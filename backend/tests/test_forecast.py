@@ -45,3 +45,53 @@ def test_run_forecast(client, auth_token, db_session):
     forecasts = list_response.json()
     assert isinstance(forecasts, list)
     assert len(forecasts) >= 1
+
+
+def test_recalculate_all_matches_per_product_forecasts(client, auth_token, db_session, query_counter):
+    from app.database import Forecast
+    from app.services.forecast_service import ForecastService
+
+    store = db_session.query(Store).filter(Store.phone == "+919999999999").first()
+    now = datetime.utcnow()
+    histories = {
+        "steady": [(0, 5), (1, 5), (2, 5)],
+        "bursty": [(0, 1), (0, 2), (3, 20), (6, 4)],  # Two sales on day 0
+        "single_day": [(1, 7)],
+        "stale": [(45, 10)],  # Outside the 30 day window
+        "no_sales": [],
+    }
+    products = {}
+    for i, (name, sales) in enumerate(histories.items()):
+        product = Product(store_id=store.id, barcode=f"7700{i}", name=name, price=3.0, reorder_point=10)
+        db_session.add(product)
+        db_session.flush()
+        db_session.add(Inventory(product_id=product.id, store_id=store.id, quantity=40 + i))
+        for days_ago, quantity in sales:
+            db_session.add(Transaction(
+                product_id=product.id, store_id=store.id, quantity_change=quantity,
+                transaction_type="out", created_at=now - timedelta(days=days_ago, minutes=1)
+            ))
+        # Restocks are not sales
+        db_session.add(Transaction(product_id=product.id, store_id=store.id, quantity_change=50, transaction_type="in"))
+        products[name] = product.id
+    no_inventory = Product(store_id=store.id, barcode="77099", name="no_inventory", price=3.0)
+    db_session.add(no_inventory)
+    db_session.commit()
+
+    expected = {pid: ForecastService.calculate_forecast(pid, store.id, db_session) for pid in products.values()}
+    ForecastService.save_forecast(expected[products["steady"]], store.id, db_session)  # One to update
+
+    query_counter.count = 0
+    assert ForecastService.recalculate_all_forecasts(store.id, db_session) == len(products)
+    assert query_counter.count <= 10
+
+    forecasts = {f.product_id: f for f in db_session.query(Forecast).filter(Forecast.store_id == store.id)}
+    assert set(forecasts) == set(products.values())
+    for product_id, data in expected.items():
+        forecast = forecasts[product_id]
+        assert forecast.days_until_stockout == data["days_until_stockout"]
+        assert float(forecast.confidence) == data["confidence"]
+        assert float(forecast.avg_daily_sales) == data["avg_daily_sales"]
+        assert forecast.recommendation == data["recommendation"]
+    assert forecasts[products["stale"]].recommendation == "No sales history available"
+    assert float(forecasts[products["single_day"]].confidence) == 0.5
@@ -1,4 +1,7 @@
-from app.database import Product, Store, Inventory
+from app.database import Product, Store, Inventory, Transaction, Alert
+from app.services.barcode_service import barcode_cache
+from app.services.idempotency_service import idempotency_cache
+from app.routers import inventory as inventory_router
 
 def test_add_product_and_update_inventory(client, auth_token, db_session):
     headers = {"Authorization": f"Bearer {auth_token}"}
@@ -64,3 +67,302 @@ def test_scan_item_view(client, auth_token, db_session):
     assert found is not None
     assert found["name"] == "View Product"
     assert found["quantity"] == 5
+
+def test_scan_batch(client, auth_token, db_session):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    store = db_session.query(Store).filter(Store.phone == "+919999999999").first()
+    product = Product(
+        store_id=store.id,
+        barcode="111122223333",
+        name="Batch Product",
+        price=5.0,
+        reorder_point=5
+    )
+    db_session.add(product)
+    db_session.flush()
+    db_session.add(Inventory(product_id=product.id, store_id=store.id, quantity=10))
+    db_session.commit()
+
+    response = client.post("/inventory/scan/batch", json={"items": [
+        {"barcode": "111122223333", "action": "sale", "quantity": 4},
+        {"barcode": "000000000000", "action": "sale", "quantity": 1},
+        {"barcode": "111122223333", "action": "sale", "quantity": 3},
+        {"barcode": "111122223333", "action": "sale", "quantity": 10}
+    ]}, headers=headers)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["processed"] == 2
+    assert data["failed"] == 2
+    assert [r["success"] for r in data["results"]] == [True, False, True, False]
+    assert data["results"][2]["new_quantity"] == 3
+
+    inventory = db_session.query(Inventory).filter(Inventory.product_id == product.id).first()
+    assert inventory.quantity == 3
+    assert db_session.query(Transaction).filter(Transaction.product_id == product.id).count() == 2
+    assert db_session.query(Alert).filter(Alert.product_id == product.id).count() == 1
+
+def test_scan_batch_updates_stock_in_bulk(client, auth_token, db_session):
+    from sqlalchemy import event
+
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    store = db_session.query(Store).filter(Store.phone == "+919999999999").first()
+    for i in range(30):
+        product = Product(store_id=store.id, barcode=f"4242000{i:05d}", name=f"Bulk {i}", price=1, reorder_point=1)
+        db_session.add(product)
+        db_session.flush()
+        db_session.add(Inventory(product_id=product.id, store_id=store.id, quantity=50))
+    db_session.commit()
+
+    items = [
+        {"barcode": f"4242000{i % 30:05d}", "action": "sale" if i % 4 else "restock", "quantity": 2}
+        for i in range(300)
+    ]
+    stock_updates = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE inventory"):
+            stock_updates.append(statement)
+
+    engine = db_session.get_bind().engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.post("/inventory/scan/batch", json={"items": items}, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    assert response.json()["processed"] == 300
+    # One set-based UPDATE, not one per scan
+    assert len(stock_updates) == 1
+
+    results = response.json()["results"]
+    expected = {f"4242000{i:05d}": 50 for i in range(30)}
+    for item, result in zip(items, results):
+        expected[item["barcode"]] += 2 if item["action"] == "restock" else -2
+        assert result["new_quantity"] == expected[item["barcode"]]  # Running quantity per scan
+    stored = dict(db_session.query(Product.barcode, Inventory.quantity).join(Inventory).filter(Product.store_id == store.id))
+    assert stored == expected
+
+def test_barcode_cache_hits_and_invalidation(client, auth_token, db_session):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    created = client.post("/products/", json={
+        "barcode": "777788889999",
+        "name": "Cached Product",
+        "price": 12.5,
+        "reorder_point": 2,
+        "initial_quantity": 10
+    }, headers=headers)
+    assert created.status_code == 200
+    product_id = created.json()["id"]
+
+    for _ in range(3):
+        response = client.post("/inventory/scan", json={
+            "barcode": "777788889999",
+            "action": "sale"
+        }, headers=headers)
+        assert response.status_code == 200
+
+    stats = barcode_cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert response.json()["new_quantity"] == 7
+
+    # Renaming the product must not leave a stale name in the cache
+    client.put(f"/products/{product_id}", json={"name": "Renamed Product"}, headers=headers)
+    response = client.post("/inventory/scan", json={
+        "barcode": "777788889999",
+        "action": "restock"
+    }, headers=headers)
+    assert response.json()["product"]["name"] == "Renamed Product"
+    assert barcode_cache.stats()["misses"] == 2
+
+def test_barcode_cache_entries_expire():
+    from app.services.barcode_service import BarcodeCache, CachedProduct
+    entry = CachedProduct(1, "123456", "Tea", "Drinks", 10, 5, 1)
+
+    fresh = BarcodeCache(ttl_seconds=60)
+    fresh.put(1, entry)
+    assert fresh.get(1, "123456") == entry
+
+    # Another worker's write is only seen once the local copy expires
+    stale = BarcodeCache(ttl_seconds=0)
+    stale.put(1, entry)
+    assert stale.get(1, "123456") is None
+    assert stale.stats()["entries"] == 0
+
+def test_scan_creates_single_open_alert_and_reports_timing(client, auth_token, db_session):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    client.post("/products/", json={
+        "barcode": "565656565656",
+        "name": "Alert Product",
+        "price": 3,
+        "reorder_point": 5,
+        "initial_quantity": 6
+    }, headers=headers)
+
+    for expected in (4, 2):
+        response = client.post("/inventory/scan", json={
+            "barcode": "565656565656",
+            "action": "sale",
+            "quantity": 2
+        }, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["new_quantity"] == expected
+        stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+        assert stages == ["resolve", "update", "insert", "commit", "broadcast"]
+
+    product = db_session.query(Product).filter(Product.barcode == "565656565656").first()
+    assert db_session.query(Alert).filter(Alert.product_id == product.id).count() == 1
+
+def test_open_alerts_are_unique_per_product(client, auth_token, db_session):
+    import pytest
+    from sqlalchemy.exc import IntegrityError
+    from app.services.inventory_service import InventoryService
+
+    store = db_session.query(Store).first()
+    product = Product(store_id=store.id, barcode="575757575757", name="Race Product", price=1, reorder_point=5)
+    db_session.add(product)
+    db_session.flush()
+
+    first = InventoryService.insert_low_stock_alert(product.id, product.name, 5, store.id, 1, db_session)
+    assert first is not None
+    assert InventoryService.insert_low_stock_alert(product.id, product.name, 5, store.id, 0, db_session) is None
+
+    # A racing writer that skipped the NOT EXISTS check is stopped by the index
+    with pytest.raises(IntegrityError):
+        with db_session.begin_nested():
+            db_session.add(Alert(store_id=store.id, product_id=product.id, alert_type="low_stock", acknowledged=False))
+
+    # Acknowledged alerts do not count as open
+    db_session.query(Alert).filter(Alert.id == first.id).update({"acknowledged": True})
+    assert InventoryService.insert_low_stock_alert(product.id, product.name, 5, store.id, 0, db_session) is not None
+
+def test_offline_sync_is_idempotent(client, auth_token, db_session):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    client.post("/products/", json={
+        "barcode": "909090909090",
+        "name": "Offline Product",
+        "price": 1,
+        "initial_quantity": 20
+    }, headers=headers)
+
+    backlog = {"device_id": "till-1", "scans": [
+        {"seq": 1, "barcode": "909090909090", "action": "sale", "quantity": 2},
+        {"seq": 2, "barcode": "909090909090", "action": "sale", "quantity": 3},
+        {"seq": 3, "barcode": "123412341234", "action": "sale", "quantity": 1}
+    ]}
+    response = client.post("/inventory/sync", json=backlog, headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["applied"] == 2
+    assert data["duplicates"] == 0
+    assert [r["seq"] for r in data["rejected"]] == [3]
+    assert data["high_water_mark"] == 3
+
+    # The response was lost: the device replays, plus one new scan
+    backlog["scans"].append({"seq": 4, "barcode": "909090909090", "action": "restock", "quantity": 10})
+    response = client.post("/inventory/sync", json=backlog, headers=headers)
+    data = response.json()
+    assert data["applied"] == 1
+    assert data["duplicates"] == 3
+    assert data["high_water_mark"] == 4
+
+    product = db_session.query(Product).filter(Product.barcode == "909090909090").first()
+    inventory = db_session.query(Inventory).filter(Inventory.product_id == product.id).first()
+    assert inventory.quantity == 25
+
+def test_idempotency_key_replays_scan(client, auth_token, db_session):
+    headers = {"Authorization": f"Bearer {auth_token}", "Idempotency-Key": "scan-abc-1"}
+
+    client.post("/products/", json={
+        "barcode": "343434343434",
+        "name": "Retry Product",
+        "price": 2,
+        "initial_quantity": 10
+    }, headers={"Authorization": headers["Authorization"]})
+
+    scan = {"barcode": "343434343434", "action": "sale", "quantity": 4}
+    first = client.post("/inventory/scan", json=scan, headers=headers)
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    retry = client.post("/inventory/scan", json=scan, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+
+    # Survives losing the in-process cache (e.g. a restart)
+    idempotency_cache.clear()
+    retry = client.post("/inventory/scan", json=scan, headers=headers)
+    assert retry.json()["transaction_id"] == first.json()["transaction_id"]
+
+    misuse = client.post("/inventory/scan", json={**scan, "quantity": 1}, headers=headers)
+    assert misuse.status_code == 422
+
+    product = db_session.query(Product).filter(Product.barcode == "343434343434").first()
+    inventory = db_session.query(Inventory).filter(Inventory.product_id == product.id).first()
+    assert inventory.quantity == 6
+
+def test_expired_idempotency_key_can_be_reused(client, auth_token, db_session):
+    from datetime import datetime, timedelta
+    from app.database import IdempotencyRecord
+    from app.services.idempotency_service import IdempotencyService
+
+    auth = {"Authorization": f"Bearer {auth_token}"}
+    client.post("/products/", json={
+        "barcode": "353535353535",
+        "name": "Expiry Product",
+        "price": 2,
+        "initial_quantity": 10
+    }, headers=auth)
+
+    scan = {"barcode": "353535353535", "action": "sale", "quantity": 1}
+    first = client.post("/inventory/scan", json=scan, headers={**auth, "Idempotency-Key": "old-key"})
+    assert first.status_code == 200
+
+    long_ago = datetime.utcnow() - timedelta(days=2)
+    db_session.query(IdempotencyRecord).update({"created_at": long_ago})
+    db_session.commit()
+    idempotency_cache.clear()
+
+    again = client.post("/inventory/scan", json=scan, headers={**auth, "Idempotency-Key": "old-key"})
+    assert again.status_code == 200
+    assert "Idempotent-Replayed" not in again.headers
+    assert again.json()["new_quantity"] == 8
+
+    # The sweep removes expired rows that are never looked up again
+    client.post("/inventory/scan", json=scan, headers={**auth, "Idempotency-Key": "other-key"})
+    db_session.query(IdempotencyRecord).filter(IdempotencyRecord.key == "other-key").update({"created_at": long_ago})
+    assert IdempotencyService.purge_expired(db_session) == 1
+    assert [r.key for r in db_session.query(IdempotencyRecord)] == ["old-key"]
+
+def test_delta_inventory_sync(client, auth_token, monkeypatch):
+    monkeypatch.setattr(inventory_router, "INVENTORY_SYNC_GRACE_SECONDS", 0)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    for barcode in ("818181818181", "828282828282"):
+        client.post("/products/", json={
+            "barcode": barcode,
+            "name": f"Delta {barcode}",
+            "price": 1,
+            "initial_quantity": 5
+        }, headers=headers)
+
+    full = client.get("/inventory/", headers=headers)
+    assert len(full.json()) == 2
+    cursor = full.headers["X-Inventory-Cursor"]
+
+    client.post("/inventory/scan", json={"barcode": "828282828282", "action": "sale"}, headers=headers)
+
+    delta = client.get("/inventory/", params={"since": cursor}, headers=headers).json()
+    assert [item["barcode"] for item in delta["items"]] == ["828282828282"]
+    assert delta["items"][0]["quantity"] == 4
+
+    empty = client.get("/inventory/", params={"since": delta["cursor"]}, headers=headers).json()
+    assert empty["items"] == []
+
+    assert client.get("/inventory/", params={"since": "not-a-cursor"}, headers=headers).status_code == 400
@@ -0,0 +1,76 @@
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, Store, Product, Inventory, Transaction
+from app.services.inventory_service import InventoryService
+
+
+def test_concurrent_sales_never_lose_updates(tmp_path):
+    # File-backed SQLite so every thread gets its own connection and the
+    # conditional UPDATE has to hold up against the real writer lock
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'stress.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    initial_quantity = 150
+    with Session() as db:
+        store = Store(name="Stress Store", phone="+910000000001", password_hash="x", api_key="sk_stress")
+        db.add(store)
+        db.flush()
+        product = Product(store_id=store.id, barcode="424242424242", name="Hot SKU", price=1.0)
+        db.add(product)
+        db.flush()
+        db.add(Inventory(product_id=product.id, store_id=store.id, quantity=initial_quantity))
+        db.commit()
+        store_id, product_id = store.id, product.id
+
+    threads_count = 12
+    sales_per_thread = 20  # 240 attempted sales against 150 units
+    sold = []
+    rejected = []
+    errors = []
+    barrier = threading.Barrier(threads_count)
+
+    def till():
+        barrier.wait()
+        with Session() as db:
+            for _ in range(sales_per_thread):
+                try:
+                    row = InventoryService.adjust_stock(product_id, store_id, -1, db)
+                    if row is None:
+                        rejected.append(1)
+                        db.rollback()
+                        continue
+                    db.add(Transaction(
+                        product_id=product_id,
+                        store_id=store_id,
+                        quantity_change=-1,
+                        transaction_type="out"
+                    ))
+                    db.commit()
+                    sold.append(row.quantity)
+                except Exception as e:
+                    errors.append(e)
+                    db.rollback()
+
+    threads = [threading.Thread(target=till) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(sold) == initial_quantity
+    assert len(rejected) == threads_count * sales_per_thread - initial_quantity
+    # Every successful sale observed a distinct post-decrement quantity
+    assert sorted(sold) == list(range(initial_quantity))
+
+    with Session() as db:
+        assert db.query(Inventory.quantity).filter(Inventory.product_id == product_id).scalar() == 0
+        assert db.query(Transaction).filter(Transaction.product_id == product_id).count() == initial_quantity
+
+    engine.dispose()
@@ -0,0 +1,435 @@
+import csv
+import io
+import json
+import pytest
+
+
+def create_products(client, headers, count, prefix="4000"):
+    for i in range(count):
+        response = client.post("/products/", json={
+            "barcode": f"{prefix}{i:06d}",
+            "name": f"Product {i}",
+            "price": 10 + i,
+            "category": "Snacks" if i % 2 else "Drinks",
+            "initial_quantity": i
+        }, headers=headers)
+        assert response.status_code == 200
+
+
+def test_stream_inventory_ndjson(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 5)
+
+    response = client.get("/inventory/", headers={**headers, "Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "X-Inventory-Cursor" in response.headers
+
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert len(items) == 5
+    assert {item["barcode"] for item in items} == {f"4000{i:06d}" for i in range(5)}
+
+
+def test_stream_products_csv(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 3)
+
+    response = client.get("/products/", headers={**headers, "Accept": "text/csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["barcode"] for row in rows] == [f"4000{i:06d}" for i in range(3)]
+    assert rows[2]["current_quantity"] == "2"
+
+
+def test_keyset_pagination_products_and_inventory(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 7)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/products/", params=params, headers=headers).json()
+        assert page["total"] == 7
+        seen.extend(product["barcode"] for product in page["products"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [f"4000{i:06d}" for i in range(7)]
+
+    first = client.get("/inventory/", params={"limit": 5, "include_total": True}, headers=headers)
+    assert len(first.json()) == 5
+    assert first.headers["X-Total-Count"] == "7"
+    rest = client.get("/inventory/", params={"limit": 5, "cursor": first.headers["X-Next-Cursor"]}, headers=headers)
+    assert len(rest.json()) == 2
+    assert "X-Next-Cursor" not in rest.headers
+
+    assert client.get("/alerts/", params={"cursor": "garbage"}, headers=headers).status_code == 400
+
+
+def test_list_endpoints_stay_unpaginated_without_limit(client, auth_token, monkeypatch):
+    import app.pagination as pagination
+    monkeypatch.setattr(pagination, "PAGE_SIZE_DEFAULT", 3)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 7)
+
+    everything = client.get("/inventory/", headers=headers)
+    assert len(everything.json()) == 7
+    assert "X-Next-Cursor" not in everything.headers
+    assert client.get("/forecasts/", headers=headers).status_code == 200
+    assert client.get("/alerts/", headers=headers).status_code == 200
+
+    first = client.get("/inventory/", params={"limit": 2}, headers=headers)
+    # A cursor without a limit continues with the default page size
+    second = client.get("/inventory/", params={"cursor": first.headers["X-Next-Cursor"]}, headers=headers)
+    assert len(second.json()) == 3
+    assert "X-Next-Cursor" in second.headers
+
+
+def test_product_reads_use_constant_query_count(client, auth_token, query_counter):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 20)
+
+    def queries_for(path, **params):
+        query_counter.count = 0
+        response = client.get(path, params=params, headers=headers)
+        assert response.status_code == 200
+        return query_counter.count
+
+    small_page = queries_for("/products/", limit=2, include_total=False)
+    large_page = queries_for("/products/", limit=20, include_total=False)
+    assert small_page == large_page == 2  # store lookup + one joined product query
+
+    product_id = client.get("/products/", params={"limit": 1}, headers=headers).json()["products"][0]["id"]
+    assert queries_for(f"/products/{product_id}") == small_page
+
+
+def test_bulk_upload_reports_row_errors_and_inserts_in_bulk(client, auth_token, query_counter):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 1, prefix="0001")
+
+    rows = [
+        "barcode,name,price,category,reorder_point,initial_quantity",
+        "0001000000,Existing,1,,,",       # already in the store
+        "0002222,Bad Price,abc,Snacks,5,3",
+        "0002222,Chips,2.5,Snacks,5,3",
+        "0002222,Chips Again,2,,,",       # duplicate within the file
+        "12,Too Short,1,,,",
+        "0005555,Water,3,Drinks,,7",
+    ]
+    rows += [f"9{i:07d},Bulk {i},1.5,Bulk,10,{i}" for i in range(200)]
+    upload = ("products.csv", io.BytesIO("\n".join(rows).encode()), "text/csv")
+
+    query_counter.count = 0
+    response = client.post("/products/bulk-upload", files={"file": upload}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 202
+    assert body["skipped"] == 4
+    assert body["errors"] == [
+        "Row 2: Barcode '0001000000' already exists",
+        "Row 3: Invalid price 'abc'",
+        "Row 5: Barcode '0002222' already exists",
+        "Row 6: Invalid barcode format '12'",
+    ]
+    # Query count does not grow with the number of rows
+    assert query_counter.count < 15
+
+    products = client.get("/products/", params={"limit": 1000}, headers=headers).json()["products"]
+    by_barcode = {product["barcode"]: product for product in products}
+    assert by_barcode["0002222"]["name"] == "Chips"
+    assert by_barcode["0002222"]["current_quantity"] == 3
+    assert by_barcode["0005555"]["reorder_point"] == 20
+    assert by_barcode["90000199"]["current_quantity"] == 199
+
+
+def test_bulk_upload_commits_in_chunks_and_caps_errors(client, auth_token, monkeypatch):
+    from app.services import import_service
+    monkeypatch.setattr(import_service, "IMPORT_CHUNK_ROWS", 50)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    rows = ["barcode,name,price"]
+    rows += [f"7{i:07d},Item {i},2" for i in range(120)]
+    rows[101] = "70000003,Repeat From First Chunk,2"  # Row 102, third chunk
+    rows[120] = "xx,Bad Barcode,2"
+    upload = ("products.csv", io.BytesIO("\n".join(rows).encode()), "text/csv")
+
+    response = client.post("/products/bulk-upload", params={"max_errors": 1}, files={"file": upload}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 118
+    assert body["skipped"] == 2
+    assert body["errors"] == ["Row 102: Barcode '70000003' already exists"]
+
+    missing = ("products.csv", io.BytesIO(b"barcode,name\n12345678,No Price\n"), "text/csv")
+    response = client.post("/products/bulk-upload", files={"file": missing}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Missing required column: price"
+
+
+def test_bulk_upload_reports_partial_totals_when_file_breaks(client, auth_token, monkeypatch):
+    from app.services import import_service
+    monkeypatch.setattr(import_service, "IMPORT_CHUNK_ROWS", 50)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    rows = ["barcode,name,price"]
+    rows += [f"8{i:07d},Item {i},2" for i in range(120)]
+    rows[80] = "80000079,Too,Many,Fields,Here"  # Row 81, second chunk
+    upload = ("products.csv", io.BytesIO("\n".join(rows).encode()), "text/csv")
+
+    response = client.post("/products/bulk-upload", files={"file": upload}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is False
+    assert body["created"] == 50
+    assert body["skipped"] == 0
+    assert len(body["errors"]) == 1
+    assert body["errors"][0].startswith("Import stopped at row 52: ")
+
+    products = client.get("/products/", params={"limit": 1000}, headers=headers).json()
+    assert products["total"] == 50
+
+
+def test_async_bulk_upload_runs_as_background_job(client, auth_token, background_jobs, monkeypatch):
+    from app.websocket_manager import manager
+    messages = []
+
+    async def record(store_id, message):
+        messages.append(message)
+
+    monkeypatch.setattr(manager, "broadcast", record)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    rows = ["barcode,name,price"] + [f"6{i:07d},Item {i},2" for i in range(30)] + ["6,Bad,2"]
+    upload = ("products.csv", io.BytesIO("\n".join(rows).encode()), "text/csv")
+    response = client.post("/products/bulk-upload", params={"async": "true"}, files={"file": upload}, headers=headers)
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    background_jobs.wait(job_id, timeout=30)
+
+    response = client.get(f"/products/jobs/{job_id}", headers=headers)
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "completed"
+    assert job["progress"] == {"rows_processed": 31, "created": 30, "skipped": 1}
+    assert job["result"]["errors"] == ["Row 32: Invalid barcode format '6'"]
+
+    statuses = [m["data"]["status"] for m in messages if m["type"] == "job_progress"]
+    assert statuses[0] == "queued" and statuses[-1] == "completed"
+
+    products = client.get("/products/", headers=headers).json()
+    assert products["total"] == 30
+
+    assert client.get("/products/jobs/unknown", headers=headers).status_code == 404
+
+
+def test_queued_jobs_fail_and_clean_up_at_shutdown(tmp_path):
+    import threading
+    from app.services.job_service import JobManager, FAILED, COMPLETED
+
+    jobs = JobManager(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(job, db):
+        started.set()
+        release.wait(5)
+        return {"ok": True}
+
+    running = jobs.submit(1, "blocker", blocker)
+    assert started.wait(5)
+    spooled = tmp_path / "upload.csv"
+    spooled.write_text("barcode,name,price\n")
+    queued = jobs.submit(1, "product_import", lambda job, db: {}, on_cancel=lambda: spooled.unlink())
+
+    jobs.shutdown()
+    assert queued.status == FAILED
+    assert queued.error == "Cancelled at shutdown"
+    assert queued.finished_at is not None
+    assert not spooled.exists()
+
+    release.set()
+    running.future.result(timeout=5)
+    assert running.status == COMPLETED
+
+
+def test_bulk_patch_updates_and_upserts_in_one_transaction(client, auth_token, query_counter):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 3, prefix="5000")
+    products = client.get("/products/", headers=headers).json()["products"]
+    first_id = products[0]["id"]
+
+    # Warm the barcode cache so the update has to invalidate it
+    client.post("/inventory/scan", json={"barcode": "5000000001", "action": "restock"}, headers=headers)
+
+    query_counter.count = 0
+    response = client.patch("/products/bulk", json={
+        "upsert": True,
+        "items": [
+            {"id": first_id, "price": 99.5},
+            {"barcode": "5000000001", "reorder_point": 7, "category": "Frozen"},
+            {"id": first_id, "name": "Renamed"},
+            {"barcode": "5000999999", "name": "New Item", "price": 3, "initial_quantity": 12},
+            {"barcode": "5000888888", "name": "No Price"},
+            {"id": 999999, "price": 1},
+        ]
+    }, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is False  # Some items were rejected
+    assert body["updated"] == 2
+    assert body["created"] == 1
+    assert body["errors"] == [
+        "Item 6: Product 999999 not found",
+        "Item for barcode '5000888888': name and price are required to create a product",
+    ]
+    # Statement count does not depend on the number of items
+    assert query_counter.count < 15
+
+    by_barcode = {
+        p["barcode"]: p for p in client.get("/products/", headers=headers).json()["products"]
+    }
+    assert by_barcode["5000000000"]["name"] == "Renamed"
+    assert by_barcode["5000000000"]["price"] == "99.50"
+    assert by_barcode["5000000001"]["reorder_point"] == 7
+    assert by_barcode["5000000001"]["category"] == "Frozen"
+    assert by_barcode["5000999999"]["current_quantity"] == 12
+    assert "5000888888" not in by_barcode
+
+    response = client.post("/inventory/scan", json={"barcode": "5000000001", "action": "restock"}, headers=headers)
+    assert response.json()["product"]["reorder_point"] == 7
+
+    response = client.patch("/products/bulk", json={"items": [{"barcode": "5000000001", "price": 3}]}, headers=headers)
+    assert response.json() == {"success": True, "updated": 1, "created": 0, "errors": []}
+
+    response = client.patch("/products/bulk", json={"items": [{"id": 1, "barcode": "5000000001"}]}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_search_prefix_fuzzy_and_facets(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    catalogue = [
+        ("3000000001", "Chocolate Milk", "Dairy"),
+        ("3000000002", "Chocolate Bar", "Snacks"),
+        ("3000000003", "Choco Chip Cookies", "Snacks"),
+        ("3000000004", "Orange Juice", "Drinks"),
+    ]
+    for barcode, name, category in catalogue:
+        client.post("/products/", json={"barcode": barcode, "name": name, "price": 2, "category": category}, headers=headers)
+
+    response = client.get("/products/search", params={"q": "choc"}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 3
+    assert {f["category"]: f["count"] for f in body["facets"]} == {"Snacks": 2, "Dairy": 1}
+
+    # Exact word beats prefix, and every word must match
+    body = client.get("/products/search", params={"q": "chocolate milk"}, headers=headers).json()
+    assert [p["name"] for p in body["products"]] == ["Chocolate Milk"]
+
+    # Misspelt words still match through trigrams
+    body = client.get("/products/search", params={"q": "ornge"}, headers=headers).json()
+    assert [p["barcode"] for p in body["products"]] == ["3000000004"]
+
+    # Category filter narrows results but facets still cover every match
+    body = client.get("/products/search", params={"q": "choc", "category": "Snacks"}, headers=headers).json()
+    assert body["total"] == 2
+    assert len(body["facets"]) == 2
+
+    # Writes are reflected without a rebuild
+    products = {p["barcode"]: p["id"] for p in client.get("/products/", headers=headers).json()["products"]}
+    client.put(f"/products/{products['3000000004']}", json={"name": "Apple Juice"}, headers=headers)
+    client.delete(f"/products/{products['3000000002']}", headers=headers)
+    client.post("/products/", json={"barcode": "3000000005", "name": "Apple Pie", "price": 4}, headers=headers)
+
+    body = client.get("/products/search", params={"q": "apple"}, headers=headers).json()
+    assert sorted(p["name"] for p in body["products"]) == ["Apple Juice", "Apple Pie"]
+    body = client.get("/products/search", params={"q": "3000000002"}, headers=headers).json()
+    assert body["total"] == 0
+
+
+def test_search_matches_non_ascii_names(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post("/products/", json={"barcode": "3100000001", "name": "Café Crème", "price": 3}, headers=headers)
+    client.post("/products/", json={"barcode": "3100000002", "name": "حليب طازج", "price": 2}, headers=headers)
+    client.post("/products/", json={"barcode": "3100000003", "name": "STRASSE Brot", "price": 1}, headers=headers)
+
+    body = client.get("/products/search", params={"q": "CAFÉ crè"}, headers=headers).json()
+    assert [p["barcode"] for p in body["products"]] == ["3100000001"]
+    body = client.get("/products/search", params={"q": "حليب"}, headers=headers).json()
+    assert [p["barcode"] for p in body["products"]] == ["3100000002"]
+    # Case folding, not just lower-casing
+    body = client.get("/products/search", params={"q": "straße"}, headers=headers).json()
+    assert [p["barcode"] for p in body["products"]] == ["3100000003"]
+
+
+def test_export_csv_round_trips_through_bulk_upload(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 3, prefix="0200")
+
+    response = client.get("/products/export", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    exported = response.text
+    rows = list(csv.DictReader(io.StringIO(exported)))
+    assert [row["barcode"] for row in rows] == [f"0200{i:06d}" for i in range(3)]
+    assert rows[2]["initial_quantity"] == "2"
+    assert rows[0]["days_until_stockout"] == ""
+
+    # Re-import into another store
+    client.post("/auth/signup", json={"phone": "+918888888888", "store_name": "Other", "password": "Password123"})
+    token = client.post("/auth/login", json={"phone": "+918888888888", "password": "Password123"}).json()["access_token"]
+    other = {"Authorization": f"Bearer {token}"}
+    upload = ("export.csv", io.BytesIO(exported.encode()), "text/csv")
+    response = client.post("/products/bulk-upload", files={"file": upload}, headers=other)
+    assert response.json()["created"] == 3
+
+    reexported = client.get("/products/export", headers=other).text
+    assert reexported == exported
+
+
+def test_export_parquet_writes_row_groups(client, auth_token, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from app import streaming
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_ROWS", 2)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 5)
+
+    response = client.get("/products/export", params={"format": "parquet"}, headers=headers)
+    assert response.status_code == 200
+    parquet = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.column("barcode").to_pylist() == [f"4000{i:06d}" for i in range(5)]
+    assert [str(price) for price in table.column("price").to_pylist()] == ["10.00", "11.00", "12.00", "13.00", "14.00"]
+
+
+def test_deletes_cascade_in_the_database(client, auth_token, db_session):
+    from app.database import Product, Inventory, Transaction, Alert
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_products(client, headers, 4, prefix="0300")
+    for i in range(4):
+        # Sell down below the reorder point so every product has history and an alert
+        client.post("/inventory/scan", json={"barcode": f"0300{i:06d}", "action": "restock", "quantity": 5}, headers=headers)
+        client.post("/inventory/scan", json={"barcode": f"0300{i:06d}", "action": "sale"}, headers=headers)
+    ids = {p["barcode"]: p["id"] for p in client.get("/products/", headers=headers).json()["products"]}
+    db_session.expire_all()
+
+    assert client.delete(f"/products/{ids['0300000000']}", headers=headers).status_code == 200
+    response = client.post("/products/bulk-delete", json={
+        "ids": [ids["0300000001"], ids["0300000002"], 999999],
+        "barcodes": ["0300000002"]
+    }, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "deleted": 2, "not_found": 1}
+
+    remaining = [ids["0300000003"]]
+    assert [pid for (pid,) in db_session.query(Product.id)] == remaining
+    for model in (Inventory, Transaction, Alert):
+        assert {pid for (pid,) in db_session.query(model.product_id)} == set(remaining)
+
+    assert client.post("/products/bulk-delete", json={}, headers=headers).status_code == 422
@@ -0,0 +1,666 @@
+import asyncio
+import json
+
+import pytest
+
+from app import websocket_manager
+from app.broker import InProcessBroker, PostgresBroker, UnixSocketBroker
+from app.database import Store
+from app.websocket_manager import WebSocketManager, negotiate_subprotocol
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay=0):
+        self.sent = []
+        self.send_delay = send_delay
+        self.close_code = None
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, data):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(data)
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.close_code = code
+
+
+async def wait_until(condition, timeout=1.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_unix_socket_broker_fans_out_across_managers(tmp_path):
+    async def scenario():
+        worker_a = WebSocketManager(UnixSocketBroker(str(tmp_path)))
+        worker_b = WebSocketManager(UnixSocketBroker(str(tmp_path)))
+        await worker_a.start()
+        await worker_b.start()
+        client_a, client_b, other_store = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await worker_a.connect(client_a, 1)
+        await worker_b.connect(client_b, 1)
+        await worker_b.connect(other_store, 2)
+
+        await worker_a.broadcast(1, {"type": "alert_created", "data": {"alert_id": 7}})
+        await wait_until(lambda: client_a.sent and client_b.sent)
+
+        await worker_a.stop()
+        await worker_b.stop()
+        return client_a.sent, client_b.sent, other_store.sent
+
+    sent_a, sent_b, sent_other = asyncio.run(scenario())
+    message = {"type": "alert_created", "data": {"alert_id": 7}, "seq": 1}
+    assert sent_a == [message]  # Delivered locally once, not echoed back
+    assert sent_b == [message]
+    assert sent_other == []
+    assert not list(tmp_path.glob("*.sock"))  # Sockets removed on stop
+
+
+def test_unix_socket_broker_splits_messages_larger_than_a_datagram(tmp_path):
+    # Well past the ~208 KB a single Unix datagram can carry
+    updates = [{"product_id": i, "name": "x" * 200} for i in range(1500)]
+    message = {"type": "inventory_batch", "data": {"updates": updates, "alerts": []}}
+    assert len(json.dumps(message)) > 300_000
+
+    async def scenario():
+        worker_a = WebSocketManager(UnixSocketBroker(str(tmp_path)), coalesce_window_ms=0)
+        worker_b = WebSocketManager(UnixSocketBroker(str(tmp_path)), coalesce_window_ms=0)
+        await worker_a.start()
+        await worker_b.start()
+        client_b = FakeWebSocket()
+        await worker_b.connect(client_b, 1)
+
+        for _ in range(3):
+            await worker_a.broadcast(1, message)
+        await wait_until(lambda: len(client_b.sent) == 3, timeout=5)
+
+        await worker_a.stop()
+        await worker_b.stop()
+        return client_b.sent
+
+    sent = asyncio.run(scenario())
+    assert [frame["data"]["updates"] for frame in sent] == [updates] * 3
+
+
+def test_dropping_a_store_closes_its_clients_in_every_worker(tmp_path):
+    async def scenario():
+        worker_a = WebSocketManager(UnixSocketBroker(str(tmp_path)))
+        worker_b = WebSocketManager(UnixSocketBroker(str(tmp_path)))
+        await worker_a.start()
+        await worker_b.start()
+        client_a, client_b, other_store = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await worker_a.connect(client_a, 1)
+        await worker_b.connect(client_b, 1)
+        await worker_b.connect(other_store, 2)
+        await worker_a.broadcast(1, {"type": "alert_created", "data": {"alert_id": 7}})
+
+        await worker_a.drop_store(1)
+        await wait_until(lambda: client_b.close_code is not None)
+
+        await worker_a.stop()
+        await worker_b.stop()
+        return worker_a, worker_b, client_a, client_b, other_store
+
+    worker_a, worker_b, client_a, client_b, other_store = asyncio.run(scenario())
+    assert client_a.close_code == client_b.close_code == websocket_manager.STORE_DELETED_CLOSE_CODE
+    assert other_store.close_code is None
+    assert 1 not in worker_a.active_connections and 1 not in worker_b.active_connections
+    assert worker_a.last_seq(1) == 0
+
+
+def test_postgres_broker_splits_and_reassembles_large_payloads():
+    class FakeConnection:
+        def __init__(self):
+            self.payloads = []
+
+        async def execute(self, query, params):
+            self.payloads.append(params[1])
+
+    async def scenario():
+        publisher, listener = PostgresBroker("postgresql://unused"), PostgresBroker("postgresql://unused")
+        publisher._publisher = FakeConnection()
+        received = []
+
+        async def deliver(store_id, message):
+            received.append((store_id, message))
+
+        # Skip start(): no database, just the payload framing
+        listener.deliver = publisher.deliver = deliver
+
+        message = {"type": "inventory_batch", "data": {"updates": [{"name": "x" * 100}] * 200}}
+        await publisher.publish(3, message)
+        payloads = publisher._publisher.payloads
+        for payload in payloads:
+            await publisher._receive(payload)  # Own messages are ignored
+        for payload in reversed(payloads):
+            await listener._receive(payload)
+        return payloads, received, message
+
+    payloads, received, message = asyncio.run(scenario())
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) < 8000 for payload in payloads)
+    assert received == [(3, message)]
+
+
+def test_slow_client_does_not_block_broadcast():
+    async def scenario(policy):
+        manager = WebSocketManager(queue_size=3, send_timeout=5, slow_client_policy=policy, coalesce_window_ms=0)
+        fast, slow = FakeWebSocket(), FakeWebSocket(send_delay=60)
+        await manager.connect(fast, 1)
+        await manager.connect(slow, 1)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for i in range(10):
+            await manager.broadcast(1, {"type": "inventory_update", "data": {"seq": i}})
+            await asyncio.sleep(0.001)  # Other requests run between broadcasts
+        elapsed = loop.time() - started
+
+        await wait_until(lambda: len(fast.sent) == 10)
+        connected = slow in manager.active_connections.get(1, {})
+        queued = [json.loads(data)["data"]["seq"] for data in list(manager.active_connections[1][slow].queue._queue)] if connected else None
+        for websocket in (fast, slow):
+            manager.disconnect(websocket, 1)
+        return elapsed, fast.sent, slow.close_code, connected, queued
+
+    elapsed, fast_sent, close_code, connected, _ = asyncio.run(scenario("disconnect"))
+    assert elapsed < 0.5
+    assert [m["data"]["seq"] for m in fast_sent] == list(range(10))
+    assert not connected
+    assert close_code == 1013
+
+    elapsed, fast_sent, close_code, connected, queued = asyncio.run(scenario("drop_oldest"))
+    assert elapsed < 0.5
+    assert len(fast_sent) == 10
+    assert connected and close_code is None
+    # Frame 0 is stuck in the sender; the queue keeps only the newest frames
+    assert queued == [7, 8, 9]
+
+
+def test_broadcast_does_not_wait_on_the_broker():
+    class StalledBroker(InProcessBroker):
+        """Numbering store 1 hangs until released, like a slow database"""
+
+        def __init__(self):
+            super().__init__()
+            self.release = asyncio.Event()
+
+        async def next_seq(self, store_id):
+            if store_id == 1:
+                await self.release.wait()
+            return await super().next_seq(store_id)
+
+    async def scenario():
+        broker = StalledBroker()
+        manager = WebSocketManager(broker, coalesce_window_ms=0)
+        stalled, other = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(stalled, 1)
+        await manager.connect(other, 2)
+
+        await asyncio.wait_for(manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 1}}), timeout=0.1)
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 2}})
+        await asyncio.sleep(0.01)
+        await manager.broadcast(2, {"type": "alert_created", "data": {"alert_id": 3}})
+        await wait_until(lambda: other.sent)
+        before_release = (list(stalled.sent), list(other.sent))
+
+        broker.release.set()
+        await manager.join()
+        await wait_until(lambda: len(stalled.sent) == 2)
+        return before_release, stalled.sent, other.sent
+
+    before_release, stalled, other = asyncio.run(scenario())
+    message = {"type": "alert_created", "data": {"alert_id": 3}, "seq": 1}
+    assert before_release == ([], [message])  # Store 2 did not wait for store 1
+    assert [(m["seq"], m["data"]["alert_id"]) for m in stalled] == [(1, 1), (2, 2)]
+    assert other == [message]
+
+
+def test_send_timeout_disconnects_client():
+    async def scenario():
+        manager = WebSocketManager(send_timeout=0.05, coalesce_window_ms=0)
+        stuck = FakeWebSocket(send_delay=60)
+        await manager.connect(stuck, 1)
+        await manager.broadcast(1, {"type": "ping"})
+        await wait_until(lambda: stuck.close_code is not None)
+        return stuck.close_code, manager.active_connections
+
+    close_code, connections = asyncio.run(scenario())
+    assert close_code == 1013
+    assert connections == {}
+
+
+def test_inventory_updates_are_coalesced_per_store():
+    async def scenario():
+        manager = WebSocketManager(coalesce_window_ms=30)
+        client = FakeWebSocket()
+        await manager.connect(client, 1)
+
+        await manager.broadcast(1, {"type": "inventory_update", "data": {"product_id": 1, "name": "Tea", "quantity": 9}})
+        await manager.broadcast(1, {"type": "inventory_update", "data": {"product_id": 2, "name": "Milk", "quantity": 4}})
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 5}})
+        await manager.broadcast(1, {"type": "inventory_batch", "data": {
+            "updates": [{"product_id": 1, "quantity": 7}],
+            "alerts": [{"alert_id": 6}]
+        }})
+        await manager.broadcast(1, {"type": "inventory_update", "data": {"product_id": 1, "quantity": 6}})
+        await asyncio.sleep(0.01)
+        before_window = list(client.sent)
+
+        await wait_until(lambda: len(client.sent) == 2)
+        manager.disconnect(client, 1)
+        return before_window, client.sent
+
+    before_window, sent = asyncio.run(scenario())
+    # Other messages are not held back
+    assert before_window == [{"type": "alert_created", "data": {"alert_id": 5}, "seq": 1}]
+    assert sent[1] == {
+        "seq": 2,
+        "type": "inventory_batch",
+        "data": {
+            "updates": [
+                {"product_id": 1, "name": "Tea", "quantity": 6},
+                {"product_id": 2, "name": "Milk", "quantity": 4},
+            ],
+            "alerts": [{"alert_id": 6}]
+        }
+    }
+
+
+def test_product_alert_flushes_pending_updates_first():
+    async def scenario():
+        manager = WebSocketManager(coalesce_window_ms=1000)
+        client = FakeWebSocket()
+        await manager.connect(client, 1)
+
+        await manager.broadcast(1, {"type": "inventory_update", "data": {"product_id": 3, "quantity": 2}})
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 8, "product_id": 3}})
+        await wait_until(lambda: len(client.sent) == 2)
+        manager.disconnect(client, 1)
+        return client.sent
+
+    sent = asyncio.run(scenario())
+    assert [(frame["type"], frame["seq"]) for frame in sent] == [("inventory_batch", 1), ("alert_created", 2)]
+    assert sent[0]["data"]["updates"] == [{"product_id": 3, "quantity": 2}]
+
+
+def test_coalescing_timers_are_cancelled_with_their_batch():
+    async def scenario():
+        manager = WebSocketManager()
+        client = FakeWebSocket()
+        await manager.connect(client, 1)
+        update = {"type": "inventory_update", "data": {"product_id": 3, "quantity": 2}}
+
+        # Flushed early by a product event: its timer goes with the batch
+        await manager.broadcast(1, update)
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 8, "product_id": 3}})
+        early = dict(manager._flush_timers)
+
+        # A deleted store's batch is dropped, not flushed when the window ends
+        await manager.broadcast(2, update)
+        await manager.drop_store(2)
+        await manager.join()
+        deleted = dict(manager._flush_timers)
+        await asyncio.sleep(manager.coalesce_window * 2)
+        await manager.join()
+
+        # Stopping flushes what is pending and leaves no timer behind
+        await manager.broadcast(1, update)
+        await manager.stop()
+        await wait_until(lambda: len(client.sent) == 3)
+        return early, deleted, manager, client.sent
+
+    early, deleted, manager, sent = asyncio.run(scenario())
+    assert early == {} and deleted == {} and manager._flush_timers == {}
+    assert 2 not in manager._logs
+    assert [m["type"] for m in sent] == ["inventory_batch", "alert_created", "inventory_batch"]
+
+
+def test_reconnecting_client_replays_missed_events():
+    async def scenario():
+        manager = WebSocketManager(coalesce_window_ms=0, replay_buffer_size=5)
+        for i in range(8):
+            await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": i}})
+        await manager.join()
+
+        results = {}
+        for name, last_seq, epoch in [
+            ("recent", 6, manager.epoch),
+            ("current", 8, manager.epoch),
+            ("too_old", 2, manager.epoch),
+            ("other_epoch", 6, "elsewhere"),
+            ("ahead", 9, None),
+        ]:
+            client = FakeWebSocket()
+            await manager.connect(client, 1)
+            caught_up = manager.replay(client, 1, last_seq, epoch)
+            await asyncio.sleep(0.01)
+            manager.disconnect(client, 1)
+            results[name] = (caught_up, client.sent)
+        return manager.epoch, results
+
+    epoch, results = asyncio.run(scenario())
+    caught_up, sent = results["recent"]
+    assert caught_up
+    assert [(m["seq"], m["data"]["alert_id"]) for m in sent] == [(7, 6), (8, 7)]
+    assert results["current"] == (True, [])
+
+    for name, reason in [("too_old", "gap_too_large"), ("other_epoch", "epoch_changed"), ("ahead", "unknown_seq")]:
+        caught_up, sent = results[name]
+        assert not caught_up
+        assert sent == [{"type": "resync", "data": {"reason": reason, "seq": 8, "epoch": epoch}}]
+
+
+def test_broadcast_during_handshake_is_replayed_once():
+    class SlowHandshake(FakeWebSocket):
+        def __init__(self):
+            super().__init__()
+            self.accepting = asyncio.Event()
+            self.release = asyncio.Event()
+
+        async def accept(self, subprotocol=None):
+            self.accepting.set()
+            await self.release.wait()
+
+    async def scenario():
+        manager = WebSocketManager(coalesce_window_ms=0)
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 1}})
+
+        client = SlowHandshake()
+        connecting = asyncio.create_task(manager.connect(client, 1))
+        await client.accepting.wait()
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 2}})
+        await manager.join()
+        client.release.set()
+        await connecting
+
+        caught_up = manager.replay(client, 1, 1, manager.epoch)
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 3}})
+        await wait_until(lambda: len(client.sent) == 2)
+        await asyncio.sleep(0.05)
+        return caught_up, client.sent
+
+    caught_up, sent = asyncio.run(scenario())
+    assert caught_up
+    assert [m["seq"] for m in sent] == [2, 3]
+
+
+def test_sequence_is_shared_so_clients_can_resume_on_another_worker(tmp_path):
+    async def scenario():
+        worker_a = WebSocketManager(UnixSocketBroker(str(tmp_path)), coalesce_window_ms=0)
+        worker_b = WebSocketManager(UnixSocketBroker(str(tmp_path)), coalesce_window_ms=0)
+        await worker_a.start()
+        await worker_b.start()
+        watcher = FakeWebSocket()
+        await worker_b.connect(watcher, 1)
+
+        for i in range(6):
+            # One request after another; concurrent ones may be numbered in either order
+            worker = worker_a if i % 2 else worker_b
+            await worker.broadcast(1, {"type": "alert_created", "data": {"alert_id": i}})
+            await worker.join()
+        await wait_until(lambda: worker_a.last_seq(1) == worker_b.last_seq(1) == 6)
+
+        # A client of worker A that saw up to seq 2 comes back through worker B
+        client = FakeWebSocket()
+        await worker_b.connect(client, 1)
+        caught_up = worker_b.replay(client, 1, 2, worker_a.epoch)
+        await wait_until(lambda: len(client.sent) == 4)
+
+        await worker_a.stop()
+        await worker_b.stop()
+        return worker_a.epoch, worker_b.epoch, watcher.sent, caught_up, client.sent
+
+    epoch_a, epoch_b, watched, caught_up, replayed = asyncio.run(scenario())
+    assert epoch_a == epoch_b
+    assert sorted(m["seq"] for m in watched) == [1, 2, 3, 4, 5, 6]
+    assert caught_up
+    assert [(m["seq"], m["data"]["alert_id"]) for m in replayed] == [(3, 2), (4, 3), (5, 4), (6, 5)]
+
+
+def test_replay_is_not_limited_by_the_send_queue_and_logs_are_bounded():
+    async def scenario():
+        manager = WebSocketManager(coalesce_window_ms=0, queue_size=4, replay_buffer_size=100)
+        watcher = FakeWebSocket()
+        await manager.connect(watcher, 1)
+        for i in range(30):
+            await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": i}})
+        await manager.join()
+
+        client = FakeWebSocket()
+        await manager.connect(client, 1)
+        await manager.send_personal_message({"type": "connection_established"}, client)
+        caught_up = manager.replay(client, 1, 0, manager.epoch)
+        await wait_until(lambda: len(client.sent) == 31)
+        results = {"replay": (caught_up, client.sent)}
+
+        # Byte cap: only the newest frames that fit are kept
+        frame_bytes = manager._logs[1].frames[-1][2]
+        small = WebSocketManager(coalesce_window_ms=0, replay_buffer_bytes=frame_bytes * 5 + 1)
+        for i in range(30):
+            await small.broadcast(1, {"type": "alert_created", "data": {"alert_id": i}})
+        await small.join()
+        results["trimmed"] = [seq for seq, _, _ in small._logs[1].frames]
+
+        # Over the total budget, logs of stores without clients here go first
+        budget = WebSocketManager(coalesce_window_ms=0, replay_total_bytes=frame_bytes * 12)
+        await budget.connect(FakeWebSocket(), 1)
+        for store_id in (1, 2, 3):
+            for i in range(5):
+                await budget.broadcast(store_id, {"type": "alert_created", "data": {"alert_id": 10 + i}})
+        await budget.join()
+        results["evicted"] = sorted(budget._logs)
+
+        # Logs of stores nobody here is connected to are dropped once quiet
+        manager.replay_retention = 0
+        manager.disconnect(watcher, 1)
+        manager.disconnect(client, 1)
+        await manager.broadcast(2, {"type": "alert_created", "data": {"alert_id": 0}})
+        await manager.join()
+        manager._prune_logs()
+        results["pruned"] = (dict(manager._logs), manager._log_bytes)
+        return results
+
+    results = asyncio.run(scenario())
+    caught_up, sent = results["replay"]
+    assert caught_up
+    assert sent[0] == {"type": "connection_established"}
+    assert [m["seq"] for m in sent[1:]] == list(range(1, 31))
+    assert results["trimmed"] == [26, 27, 28, 29, 30]
+    assert results["evicted"] == [1, 3]
+    assert results["pruned"] == ({}, 0)
+
+
+def test_subscriptions_filter_events_per_client():
+    dairy_update = {"product_id": 1, "category": "Dairy", "quantity": 3}
+    bakery_update = {"product_id": 2, "category": "Bakery", "quantity": 8}
+    snack_update = {"product_id": 3, "category": "Snacks", "quantity": 1}
+    dairy_alert = {"alert_id": 9, "product_id": 1, "category": "Dairy"}
+
+    async def scenario():
+        manager = WebSocketManager(coalesce_window_ms=0)
+        clients = {name: FakeWebSocket() for name in ("all", "alerts", "dairy", "product_2")}
+        for websocket in clients.values():
+            await manager.connect(websocket, 1)
+        manager.subscribe(clients["alerts"], 1, types=["alert_created"])
+        manager.subscribe(clients["dairy"], 1, categories=["Dairy"])
+        manager.subscribe(clients["product_2"], 1, product_ids=[2])
+
+        await manager.broadcast(1, {"type": "inventory_update", "data": dairy_update})
+        await manager.broadcast(1, {"type": "inventory_update", "data": bakery_update})
+        await manager.broadcast(1, {"type": "alert_created", "data": {"alert_id": 8, "product_id": 3, "category": "Snacks"}})
+        await manager.broadcast(1, {"type": "job_progress", "data": {"id": "abc"}})
+        await manager.broadcast(1, {"type": "inventory_batch", "data": {
+            "updates": [dairy_update, bakery_update, snack_update],
+            "alerts": [dairy_alert]
+        }})
+        await asyncio.sleep(0.01)
+        for websocket in clients.values():
+            manager.disconnect(websocket, 1)
+        return {name: websocket.sent for name, websocket in clients.items()}, manager._topics
+
+    sent, topics = asyncio.run(scenario())
+    assert [m["seq"] for m in sent["all"]] == [1, 2, 3, 4, 5]
+    assert len(sent["all"][4]["data"]["updates"]) == 3
+    assert [m["seq"] for m in sent["alerts"]] == [3, 5]
+    assert [m["seq"] for m in sent["dairy"]] == [1, 4, 5]
+    assert [m["seq"] for m in sent["product_2"]] == [2, 4, 5]
+
+    assert sent["alerts"][1]["data"] == {"updates": [], "alerts": [dairy_alert]}
+    assert sent["dairy"][2]["data"] == {"updates": [dairy_update], "alerts": [dairy_alert]}
+    assert sent["product_2"][2]["data"] == {"updates": [bakery_update], "alerts": []}
+    assert topics == {}  # Index emptied as clients leave
+
+
+def test_msgpack_clients_get_short_binary_frames(monkeypatch):
+    msgpack = pytest.importorskip("msgpack")
+    encoded = []
+    original = websocket_manager.encode_message
+
+    def counting_encode(message, protocol):
+        encoded.append(protocol)
+        return original(message, protocol)
+
+    monkeypatch.setattr(websocket_manager, "encode_message", counting_encode)
+    update = {"product_id": 4, "name": "Rice", "category": "Grains", "quantity": 12, "status": "low"}
+
+    async def scenario():
+        manager = WebSocketManager(coalesce_window_ms=0)
+        json_clients = [FakeWebSocket() for _ in range(3)]
+        binary_clients = [FakeWebSocket() for _ in range(3)]
+        for websocket in json_clients:
+            await manager.connect(websocket, 1)
+        for websocket in binary_clients:
+            await manager.connect(websocket, 1, negotiate_subprotocol(["other", "syncvault.msgpack.v1"]))
+        await manager.broadcast(1, {"type": "inventory_update", "data": update})
+        await asyncio.sleep(0.01)
+        for websocket in json_clients + binary_clients:
+            manager.disconnect(websocket, 1)
+        return json_clients, binary_clients
+
+    json_clients, binary_clients = asyncio.run(scenario())
+    assert sorted(encoded) == ["json", "msgpack"]  # Once per protocol, not per client
+    assert binary_clients[0].subprotocol == "syncvault.msgpack.v1"
+    assert json_clients[0].sent == [{"type": "inventory_update", "data": update, "seq": 1}]
+
+    frame = binary_clients[0].sent[0]
+    assert all(websocket.sent[0] is frame for websocket in binary_clients)
+    assert msgpack.unpackb(frame) == {
+        "t": "inventory_update",
+        "d": {"p": 4, "n": "Rice", "c": "Grains", "q": 12, "st": "low"},
+        "s": 1
+    }
+    assert len(frame) < len(json.dumps(json_clients[0].sent[0])) / 2
+
+
+def test_websocket_endpoint_negotiates_binary_protocol(client, auth_token, db_session):
+    msgpack = pytest.importorskip("msgpack")
+    store_id = db_session.query(Store).first().id
+
+    with client.websocket_connect(f"/ws/{store_id}?token={auth_token}", subprotocols=["syncvault.msgpack.v1"]) as ws:
+        assert ws.accepted_subprotocol == "syncvault.msgpack.v1"
+        welcome = msgpack.unpackb(ws.receive_bytes())
+        assert welcome["t"] == "connection_established"
+
+    with client.websocket_connect(f"/ws/{store_id}?token={auth_token}") as ws:
+        assert ws.receive_json()["type"] == "connection_established"
+
+
+def test_websocket_endpoint_accepts_binary_client_frames(client, auth_token, db_session):
+    msgpack = pytest.importorskip("msgpack")
+    store_id = db_session.query(Store).first().id
+
+    with client.websocket_connect(f"/ws/{store_id}?token={auth_token}", subprotocols=["syncvault.msgpack.v1"]) as ws:
+        msgpack.unpackb(ws.receive_bytes())  # Welcome
+        ws.send_bytes(msgpack.packb({"t": "subscribe", "types": ["alert_created"]}))
+        subscribed = msgpack.unpackb(ws.receive_bytes())
+        assert subscribed["t"] == "subscribed"
+        assert subscribed["filters"] == {"types": ["alert_created"]}
+
+        ws.send_bytes(msgpack.packb({"type": "ping"}))
+        assert msgpack.unpackb(ws.receive_bytes())["t"] == "pong"
+        ws.send_bytes(b"\xc1")  # Never valid MessagePack
+        assert msgpack.unpackb(ws.receive_bytes())["t"] == "pong"
+
+
+def test_websocket_checks_token_and_releases_its_session(client, auth_token, db_session, monkeypatch):
+    from starlette.websockets import WebSocketDisconnect
+    from app import main
+    from tests.conftest import TestingSessionLocal
+
+    store_id = db_session.query(Store).first().id
+    for url, code in [
+        (f"/ws/{store_id}", 4001),
+        (f"/ws/{store_id}?token=not-a-jwt", 4001),
+        (f"/ws/{store_id + 1}?token={auth_token}", 4003),
+    ]:
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect(url):
+                pass
+        assert rejected.value.code == code
+
+    sessions = []
+
+    def tracking_factory():
+        session = TestingSessionLocal(bind=db_session.connection())
+        close = session.close
+        session.close = lambda: (sessions.append("closed"), close())
+        sessions.append("opened")
+        return session
+
+    monkeypatch.setattr(main, "websocket_session_factory", tracking_factory)
+    with client.websocket_connect(f"/ws/{store_id}?token={auth_token}") as ws:
+        assert ws.receive_json()["type"] == "connection_established"
+        # Released before the socket was accepted, not when it closes
+        assert sessions == ["opened", "closed"]
+
+
+def test_websocket_endpoint_does_not_hide_unexpected_errors(client, auth_token, db_session, monkeypatch):
+    from app import main
+
+    def broken_decode(data):
+        raise RuntimeError("decoder bug")
+
+    store_id = db_session.query(Store).first().id
+    monkeypatch.setattr(main, "decode_message", broken_decode)
+    with pytest.raises(RuntimeError, match="decoder bug"):
+        with client.websocket_connect(f"/ws/{store_id}?token={auth_token}") as ws:
+            ws.receive_json()  # Welcome
+            ws.send_text("{}")
+            ws.receive_json()
+    assert store_id not in main.manager.active_connections
+
+
+def test_store_connection_cap_and_idle_reaper():
+    async def scenario():
+        manager = WebSocketManager(heartbeat_interval=0.02, idle_timeout=0.1, max_connections_per_store=2)
+        await manager.start()
+        active, idle, refused = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        assert await manager.connect(active, 1)
+        assert await manager.connect(idle, 1)
+        assert not await manager.connect(refused, 1)
+
+        for _ in range(20):
+            manager.touch(active, 1)
+            await asyncio.sleep(0.01)
+        await wait_until(lambda: idle.close_code is not None)
+        still_connected = list(manager.active_connections.get(1, {}))
+        await manager.stop()
+        manager.disconnect(active, 1)
+        return active, idle, refused, still_connected
+
+    active, idle, refused, still_connected = asyncio.run(scenario())
+    assert refused.close_code == 1013
+    assert idle.close_code == 4008
+    assert still_connected == [active]
+    assert {"type": "ping"} in active.sent and {"type": "ping"} in idle.sent
@@ -77,13 +77,48 @@ CREATE TABLE forecasts (
     UNIQUE(product_id, store_id)
 );
 
+-- Synced Scans Table (offline scanner replay receipts)
+CREATE TABLE synced_scans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    store_id INTEGER NOT NULL,
+    device_id VARCHAR(100) NOT NULL,
+    seq INTEGER NOT NULL,
+    transaction_id INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (store_id) REFERENCES stores(id) ON DELETE CASCADE,
+    FOREIGN KEY (transaction_id) REFERENCES transactions(id) ON DELETE SET NULL
+);
+
+-- Idempotency Keys Table (replayable responses of retried requests)
+CREATE TABLE idempotency_keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    store_id INTEGER NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    status_code INTEGER NOT NULL,
+    response_body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (store_id) REFERENCES stores(id) ON DELETE CASCADE
+);
+
+-- Last WebSocket broadcast number per store, shared by all workers
+CREATE TABLE broadcast_sequences (
+    store_id INTEGER PRIMARY KEY,
+    seq BIGINT NOT NULL DEFAULT 0
+);
+
 -- Indexes for Performance
 CREATE INDEX idx_products_barcode ON products(barcode);
 CREATE INDEX idx_products_store ON products(store_id);
 CREATE INDEX idx_inventory_store ON inventory(store_id);
 CREATE INDEX idx_inventory_product ON inventory(product_id);
+CREATE INDEX ix_inventory_store_last_updated ON inventory(store_id, last_updated);
 CREATE INDEX idx_transactions_timestamp ON transactions(created_at);
 CREATE INDEX idx_transactions_product ON transactions(product_id);
 CREATE INDEX idx_alerts_store ON alerts(store_id);
 CREATE INDEX idx_alerts_acknowledged ON alerts(acknowledged);
+CREATE INDEX ix_alerts_open_lookup ON alerts(store_id, product_id, alert_type, acknowledged);
+CREATE UNIQUE INDEX ix_alerts_one_open ON alerts(store_id, product_id, alert_type) WHERE acknowledged = false;
 CREATE INDEX idx_forecasts_store ON forecasts(store_id);
+CREATE UNIQUE INDEX ix_synced_scans_device_seq ON synced_scans(store_id, device_id, seq);
+CREATE UNIQUE INDEX ix_idempotency_keys_store_key ON idempotency_keys(store_id, key);
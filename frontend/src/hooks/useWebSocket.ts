@@ -6,6 +6,9 @@ import { toast } from 'react-hot-toast';
 export const useWebSocket = (storeId?: number) => {
     const ws = useRef<WebSocket | null>(null);
     const [lastMessage, setLastMessage] = useState<any>(null);
+    // Position in the store's event stream, so a reconnect only replays what was missed
+    const lastSeq = useRef<number | null>(null);
+    const epoch = useRef<string | null>(null);
 
     useEffect(() => {
         if (!storeId) return;
@@ -15,7 +18,10 @@ export const useWebSocket = (storeId?: number) => {
             // WebSocket URL might need token in query param if headers not supported in browser WS
             // or headers if using a library, but native WS doesn't support headers easily.
             // Usually passed in query string: ?token=...
-            const url = `${WS_URL}/${storeId}?token=${token}`;
+            let url = `${WS_URL}/${storeId}?token=${token}`;
+            if (lastSeq.current !== null && epoch.current) {
+                url += `&last_seq=${lastSeq.current}&epoch=${epoch.current}`;
+            }
 
             ws.current = new WebSocket(url);
 
@@ -26,8 +32,25 @@ export const useWebSocket = (storeId?: number) => {
             ws.current.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
+                    if (data.type === 'ping') {
+                        // Server heartbeat; silent clients are disconnected
+                        ws.current?.send(JSON.stringify({ type: 'pong' }));
+                        return;
+                    }
+                    if (data.type === 'connection_established') {
+                        // Resuming: replayed events follow and carry lower seqs
+                        if (lastSeq.current === null || data.epoch !== epoch.current) {
+                            lastSeq.current = data.seq;
+                        }
+                        epoch.current = data.epoch;
+                    } else if (data.type === 'resync') {
+                        lastSeq.current = data.data.seq;
+                        epoch.current = data.data.epoch;
+                    } else if (typeof data.seq === 'number') {
+                        lastSeq.current = data.seq;
+                    }
                     setLastMessage(data);
-                    if (data.type === 'inventory_update') {
+                    if (data.type === 'inventory_update' || data.type === 'inventory_batch') {
                         toast('Inventory Updated', { icon: '🔄' });
                     }
                 } catch (e) {
@@ -28,7 +28,7 @@ const Dashboard = () => {
 
     useEffect(() => {
         if (wsMessage) {
-            if (wsMessage.type === 'inventory_update') {
+            if (wsMessage.type === 'inventory_update' || wsMessage.type === 'inventory_batch' || wsMessage.type === 'resync') {
                 fetchData(); // Simplest way to sync is refetch, or update local state if payload has details
             }
         }